@@ -3,6 +3,7 @@
 #   "matplotlib",
 #   "matplotlib-fontja",
 #   "pandas",
+#   "pyarrow",
 #   "seaborn",
 #   "tabulate",
 # ]
@@ -15,7 +16,6 @@ Processing Overview:
 どの時期にどのキャラクターが人気を集めていたかの変遷を明らかにします。
 """
 
-import pickle
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as path_effects
@@ -23,114 +23,22 @@ import matplotlib_fontja
 import seaborn as sns
 from pathlib import Path
 
-from common_utils import filter_software_talk
+from character_cube import load_cube
+from rank_tensor import character_rank_tensor
 
 # 日本語フォント設定
 # matplotlib_fontja.japanize() # Main execution blockで設定します
 
-def load_characters():
-    df = pd.read_csv("characters.csv")
-    return df["キャラクター名"].tolist()
+def genre_stats(cube, category):
+    # キューブ (カテゴリ × 年 × キャラクター の集計済みの表) からジャンルの行を取り出す
+    df = cube[cube["category"] == category]
+    if df.empty:
+        print(f"Skipping {category}: no data.")
+    return df.reset_index(drop=True)
 
-def find_characters(tags, character_names):
-    if not tags:
-        return []
-    
-    # タグリストの正規化
-    if isinstance(tags, str):
-        tag_list = tags.split()
-        tags_str = tags
-    elif isinstance(tags, list):
-        tag_list = tags
-        tags_str = " ".join(tags)
-    else:
-        return []
-        
-    found = []
-    # 完全一致が必要な短い名前のキャラなど
-    exact_match_chars = ["RIA", "朱花", "青葉", "銀芽", "金苗", "ナツ", "シロ", "ナコ", "レコ"]
-    
-    for name in character_names:
-        if name in exact_match_chars:
-            if name in tag_list:
-                found.append(name)
-        else:
-            # 部分一致 (タグ文字列の中にキャラ名が含まれるか)
-            if name in tags_str:
-                found.append(name)
-    return found
-
-def process_genre(category, character_names, use_cache=True):
-    cache_dir = Path("results/history/cache")
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    cache_path = cache_dir / f"{category}_processed_v2.csv" # V2 to include userId
-
-    if use_cache and cache_path.exists():
-        print(f"Loading cached data for {category}...")
-        df_cached = pd.read_csv(cache_path)
-        # startTimeをdatetime型に戻す
-        if "startTime" in df_cached.columns:
-            df_cached["startTime"] = pd.to_datetime(df_cached["startTime"])
-        return df_cached
-
-    pickle_path = Path(f"results/{category}.pickle")
-    if not pickle_path.exists():
-        print(f"Skipping {category}: File not found.")
-        return pd.DataFrame()
-
-    print(f"Processing {category}...")
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    
-    df = pd.json_normalize(recv["data"])
-    
-    # ソフトウェアトークの場合、VOCALOID関連および音楽関連を除外 (analyzer.pyと同等のフィルタ)
-    if category == "software_talk":
-        df = filter_software_talk(df)
-
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df["year"] = df["startTime"].dt.year.astype(int)
-    df["viewCounter"] = df["viewCounter"].astype(int)
-    # userIdが欠損している場合は0または適当な値で埋める (一応)
-    if "userId" not in df.columns:
-        df["userId"] = 0
-    df["userId"] = df["userId"].fillna(0).astype(int)
-
-    # キャラクター抽出
-    # 高速化のため、タグのユニークな組み合わせに対してキャラ抽出を行い、マージする
-    df["tags_str"] = df["tags"].apply(lambda x: " ".join(x) if isinstance(x, list) else str(x))
-    unique_tags = df[["tags_str"]].drop_duplicates()
-    unique_tags["found_chars"] = unique_tags["tags_str"].apply(lambda x: find_characters(x, character_names))
-    
-    df = df.merge(unique_tags, on="tags_str", how="left")
-    
-    # 展開 (1動画に複数キャラがいる場合、それぞれに行を分ける)
-    df_exploded = df.explode("found_chars")
-    df_exploded = df_exploded.dropna(subset=["found_chars"])
-    df_exploded = df_exploded.rename(columns={"found_chars": "character"})
-    
-    # プロットに必要なカラムのみ抽出
-    res_df = df_exploded[["year", "character", "viewCounter", "contentId", "startTime", "userId"]]
-    
-    # キャッシュ保存
-    res_df.to_csv(cache_path, index=False, encoding="utf-8-sig")
-    
-    return res_df
-
-def create_bump_chart(df_pivot_rank, title, output_path, ylabel="順位", top_n=10):
-    # カラム（年）を数値型に変換
+def create_bump_chart(df_pivot_rank, target_chars, title, output_path, ylabel="順位"):
+    # 描く対象 (最新年の上位N人と過去に1位を取ったキャラ) は順位テンソル側で選択済み
     df_pivot_rank.columns = df_pivot_rank.columns.astype(int)
-
-    # 最新年の上位N人を取得
-    last_year = df_pivot_rank.columns.max()
-    # 最新年にデータがないキャラがいる可能性を考慮し、ドロップナ
-    last_year_data = df_pivot_rank[last_year].dropna().sort_values()
-    top_chars = last_year_data.head(top_n).index.tolist()
-    
-    # 過去に1位を取ったことがあるキャラも追加 (歴史的勝者)
-    leaders = df_pivot_rank.apply(lambda x: x.idxmin(), axis=0).dropna().unique().tolist()
-    
-    target_chars = list(set(top_chars + leaders))
     
     # フィルタリング
     df_plot = df_pivot_rank.loc[target_chars]
@@ -208,13 +116,8 @@ def save_rankings_summary(df_raw, genre, output_dir):
     if df_2025.empty:
         return
 
-    # 各指標の集計
-    stats = df_2025.groupby("character").agg({
-        "contentId": "nunique",
-        "userId": "nunique",
-        "viewCounter": "sum"
-    }).reset_index()
-    
+    # 各指標 (キューブで集計済み)
+    stats = df_2025[["character", "posts", "posters", "views"]].copy()
     stats.columns = ["キャラクター", "投稿数", "投稿者数", "再生数"]
     stats["1人あたり平均投稿数"] = (stats["投稿数"] / stats["投稿者数"]).round(2)
     
@@ -236,40 +139,25 @@ def save_rankings_summary(df_raw, genre, output_dir):
     
     print(f"Saved summary to {output_path}")
 
-def generate_all_rankings(df_raw, category, output_dir, title_suffix):
-    if df_raw.empty:
-        return
-        
-    df_raw = df_raw[(df_raw["year"] >= 2011) & (df_raw["year"] <= 2025)]
-    if df_raw.empty:
+def generate_all_rankings(tensor, df_raw, category, output_dir, title_suffix, top_n=10):
+    if category not in tensor.genres or df_raw.empty:
         return
 
-    # 1. 再生数
-    print(f"Generating views ranking for {category}...")
-    yearly_views = df_raw.groupby(["year", "character"])["viewCounter"].sum().reset_index()
-    df_wide_views = yearly_views.pivot(index="year", columns="character", values="viewCounter")
-    df_wide_views.to_csv(output_dir / f"{category}_views_race.csv", encoding="utf-8-sig")
-    df_rank_views = df_wide_views.rank(axis=1, ascending=False, method='min')
-    create_bump_chart(df_rank_views.T, f"ボイロキャラ人気推移:再生数 ({title_suffix})", output_dir / f"bump_chart_{category}_views.png", ylabel="順位 (再生数)")
-
-    # 2. 投稿数
-    print(f"Generating posts ranking for {category}...")
-    yearly_posts = df_raw.groupby(["year", "character"])["contentId"].nunique().reset_index()
-    df_wide_posts = yearly_posts.pivot(index="year", columns="character", values="contentId")
-    df_wide_posts.to_csv(output_dir / f"{category}_posts_race.csv", encoding="utf-8-sig")
-    df_rank_posts = df_wide_posts.rank(axis=1, ascending=False, method='min')
-    create_bump_chart(df_rank_posts.T, f"ボイロキャラ人気推移:投稿数 ({title_suffix})", output_dir / f"bump_chart_{category}_posts.png", ylabel="順位 (投稿数)")
-
-    # 3. 投稿者数
-    print(f"Generating posters ranking for {category}...")
-    yearly_posters = df_raw.groupby(["year", "character"])["userId"].nunique().reset_index()
-    df_wide_posters = yearly_posters.pivot(index="year", columns="character", values="userId")
-    df_wide_posters.to_csv(output_dir / f"{category}_posters_race.csv", encoding="utf-8-sig")
-    df_rank_posters = df_wide_posters.rank(axis=1, ascending=False, method='min')
-    create_bump_chart(df_rank_posters.T, f"ボイロキャラ人気推移:投稿者数 ({title_suffix})", output_dir / f"bump_chart_{category}_posters.png", ylabel="順位 (投稿者数)")
+    # 再生数・投稿数・投稿者数 (順位は順位テンソルで全ジャンル・全指標まとめて求めてある)
+    metrics = [("views", "再生数"), ("posts", "投稿数"), ("posters", "投稿者数")]
+    for metric, label in metrics:
+        print(f"Generating {metric} ranking for {category}...")
+        tensor.value_frame(category, metric).to_csv(output_dir / f"{category}_{metric}_race.csv", encoding="utf-8-sig")
+        create_bump_chart(
+            tensor.rank_frame(category, metric).T,
+            tensor.bump_targets(category, metric, top_n),
+            f"ボイロキャラ人気推移:{label} ({title_suffix})",
+            output_dir / f"bump_chart_{category}_{metric}.png",
+            ylabel=f"順位 ({label})",
+        )
 
     # 4. 平均投稿数 (CSVのみ)
-    yearly_avg = (df_wide_posts / df_wide_posters).round(2)
+    yearly_avg = (tensor.value_frame(category, "posts") / tensor.value_frame(category, "posters")).round(2)
     yearly_avg.to_csv(output_dir / f"{category}_avg_posts_race.csv", encoding="utf-8-sig")
 
     # 5. サマリーテーブル
@@ -301,26 +189,18 @@ def save_combined_rankings(all_stats, output_dir, cat_names):
             if df_2025_raw.empty:
                 continue
             
-            # 集集
-            stats = df_2025_raw.groupby("character").agg({
-                "contentId": "nunique",
-                "userId": "nunique",
-                "viewCounter": "sum"
-            })
-            medians = df_2025_raw.groupby("character")["viewCounter"].median()
-            df_2025 = stats.join(medians.rename("median_views")).reset_index()
-            
-            df_2025.columns = ["character", "contentId", "userId", "viewCounter", "median_views"]
-            df_2025["1人あたり平均投稿数"] = (df_2025["contentId"] / df_2025["userId"]).round(2)
-            df_2025["平均再生数"] = (df_2025["viewCounter"] / df_2025["contentId"]).astype(int)
+            # 集計済みの指標 (中央値は年ごとにキューブで求めてある)
+            df_2025 = df_2025_raw[["character", "posts", "posters", "views", "median_views"]].reset_index(drop=True)
+            df_2025["1人あたり平均投稿数"] = (df_2025["posts"] / df_2025["posters"]).round(2)
+            df_2025["平均再生数"] = (df_2025["views"] / df_2025["posts"]).astype(int)
             
             # 各指標でソート
             if key == "posts":
-                val_col = "contentId"
-                sort_col = "contentId"
+                val_col = "posts"
+                sort_col = "posts"
             else: # posters
-                val_col = "userId"
-                sort_col = "userId"
+                val_col = "posters"
+                sort_col = "posters"
             
             df_sorted = df_2025.sort_values(sort_col, ascending=False).head(20).reset_index(drop=True)
             
@@ -380,9 +260,9 @@ def save_avg_posts_comparison(all_stats, output_dir, cat_names, ordered_genres):
         if df_2025_raw.empty:
             continue
         
-        df_2025 = df_2025_raw.groupby("character").agg({"contentId": "nunique", "userId": "nunique"}).reset_index()
-        df_2025["1人あたり平均投稿数"] = (df_2025["contentId"] / df_2025["userId"]).round(2)
-        df_sorted = df_2025.sort_values("contentId", ascending=False).head(20).reset_index(drop=True)
+        df_2025 = df_2025_raw[["character", "posts", "posters"]].reset_index(drop=True)
+        df_2025["1人あたり平均投稿数"] = (df_2025["posts"] / df_2025["posters"]).round(2)
+        df_sorted = df_2025.sort_values("posts", ascending=False).head(20).reset_index(drop=True)
         
         display_name = cat_names.get(genre, genre)
         entries = [f"{row['character']} ({row['1人あたり平均投稿数']})" for i, row in df_sorted.iterrows()]
@@ -415,8 +295,6 @@ def main():
     output_dir = Path("results/history")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    character_names = load_characters()
-    
     # 日本語フォント設定
     sns.set_style("whitegrid")
     try:
@@ -428,22 +306,25 @@ def main():
             plt.rcParams['font.family'] = ['Meiryo', 'Yu Gothic', 'MS Gothic']
 
     all_genre_stats = {}
+    # キャラ名の照合は大文字小文字を区別する
+    cube = load_cube(["software_talk", *target_categories], ignore_case=False)
+    tensor = character_rank_tensor(["overall", *target_categories])
 
     # 1. 全体データの処理
     print("Processing overall data (software_talk)...")
-    df_overall_raw = process_genre("software_talk", character_names)
+    df_overall_raw = genre_stats(cube, "software_talk")
     if not df_overall_raw.empty:
         # ノイズ除去
         df_overall_raw = df_overall_raw[~((df_overall_raw["character"] == "東北イタコ") & (df_overall_raw["year"] == 2013))]
-        generate_all_rankings(df_overall_raw, "overall", output_dir, "全体")
+        generate_all_rankings(tensor, df_overall_raw, "overall", output_dir, "全体")
         all_genre_stats["overall"] = df_overall_raw
 
     # 2. ジャンル別データの処理
     for genre in target_categories:
-        df_genre = process_genre(genre, character_names)
+        df_genre = genre_stats(cube, genre)
         if df_genre.empty:
             continue
-        generate_all_rankings(df_genre, genre, output_dir, cat_names.get(genre, genre))
+        generate_all_rankings(tensor, df_genre, genre, output_dir, cat_names.get(genre, genre))
         all_genre_stats[genre] = df_genre
 
     # 3. 比較表の作成
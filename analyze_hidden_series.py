@@ -1,44 +1,40 @@
-import pickle
 import pandas as pd
-import re
+
+from common_utils import add_year_rank
+from series_classifier import LOOSE_STYLES, has_style, series_flags
+from video_store import load_videos
 
 def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
+    # 2015〜2025年 のパーティションだけを読み込み、シリーズ表記のフラグ (ストアにキャッシュ) を付ける
+    df = load_videos('onboard', columns=['key', 'title', 'viewCounter', 'year'], start_time=False, years=range(2015, 2026))
+    df['series_flags'] = series_flags(df)
+    return add_year_rank(df)
 
 def analyze_all_numbering_styles(df):
     results = []
     years = sorted([y for y in df['year'].unique() if 2015 <= y <= 2025])
     
-    # Define regex patterns for different series styles
-    patterns = {
-        'part_style': r'part|Part',
-        'episode_style': r'\d+話|[一二三四五六七八九十]+話|第.+話',
-        'symbol_style': r'#\d+|No\.\d+|vol\.\d+',
-        'bracket_style': r'[【（\(\[［]\d+[】）\)\]］]',
-        'prefix_style': r'第\d+[回 ]|其の[一二三四五六七八九十\d]+',
-        'suffix_num_style': r'\s\d{1,3}$' # Ends with 1-3 digits space-separated
+    # Series styles (loose patterns in series_classifier)
+    styles = {
+        'part_style': 'part_loose',
+        'episode_style': 'episode_loose',
+        'symbol_style': 'symbol_loose',
+        'bracket_style': 'bracket_loose',
+        'prefix_style': 'prefix_loose',
+        'suffix_num_style': 'suffix_num_loose' # Ends with 1-3 digits space-separated
     }
     
     print("--- Detailed Series Naming Trends (Top 1000 each year) ---")
     
     for year in years:
         year_df = df[df['year'] == year]
-        top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
+        top_1000 = year_df[year_df['year_rank'] <= 1000]
         
         counts = {'year': year}
-        any_series_mask = pd.Series([False] * len(top_1000), index=top_1000.index)
-        
-        for name, pattern in patterns.items():
-            mask = top_1000['title'].str.contains(pattern, case=False, na=False)
-            counts[name] = mask.sum()
-            any_series_mask |= mask
+        for name, style in styles.items():
+            counts[name] = has_style(top_1000['series_flags'], [style]).sum()
             
-        counts['TOTAL_SERIES'] = any_series_mask.sum()
+        counts['TOTAL_SERIES'] = has_style(top_1000['series_flags'], LOOSE_STYLES).sum()
         results.append(counts)
     
     res_df = pd.DataFrame(results)
@@ -46,9 +42,9 @@ def analyze_all_numbering_styles(df):
     
     # Sample check for 'symbol_style' and 'bracket_style' in 2024
     print("\n--- Samples of 'Symbol/Bracket/Suffix' style in 2024 ---")
-    df_2024 = df[df['year'] == 2024].sort_values('viewCounter', ascending=False).head(1000)
-    hidden_patterns = f"({patterns['symbol_style']}|{patterns['bracket_style']}|{patterns['suffix_num_style']})"
-    samples = df_2024[df_2024['title'].str.contains(hidden_patterns, case=False, na=False)]['title'].head(10).tolist()
+    df_2024 = df[(df['year'] == 2024) & (df['year_rank'] <= 1000)].sort_values('year_rank')
+    hidden = has_style(df_2024['series_flags'], [styles['symbol_style'], styles['bracket_style'], styles['suffix_num_style']])
+    samples = df_2024[hidden]['title'].head(10).tolist()
     for s in samples:
         print(f"  - {s}")
 
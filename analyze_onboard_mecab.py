@@ -1,41 +1,20 @@
-import pickle
 import pandas as pd
 from datetime import datetime
-import MeCab
-import unidic_lite
 from collections import Counter
-import re
 
-def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
-
-def get_tagger():
-    # unidic-lite dictionary path
-    dic_path = unidic_lite.DICDIR
-    return MeCab.Tagger(f'-d "{dic_path}"')
+from common_utils import add_year_rank
+from keyword_matrix import build_keyword_matrix
+from term_trends import emerging_terms, update_term_counts
+from title_tokens import title_nouns
+from video_store import load_videos
 
-def extract_nouns(text, tagger):
-    nouns = []
-    # Clean text: remove symbols
-    text = re.sub(r'[【】［］（）()!！?？\[\]]', ' ', text)
-    node = tagger.parseToNode(text)
-    while node:
-        # Check for nouns
-        features = node.feature.split(',')
-        if features[0] == '名詞':
-            # Ignore single characters and simple numbers
-            if len(node.surface) > 1 and not node.surface.isdigit():
-                nouns.append(node.surface)
-        node = node.next
-    return nouns
+def load_data():
+    # 分析対象の 2015〜2025年 のパーティションだけを読み込む
+    df = load_videos('onboard', columns=['key', 'title', 'viewCounter', 'startEpoch', 'year'], years=range(2015, 2026))
+    # 年ごとの再生数順位を一度だけ求め、各年の上位1000件はマスクで取り出す
+    return add_year_rank(df)
 
 def analyze_onboard_trends(df):
-    tagger = get_tagger()
     report = []
     report.append("# Onboard Video Trend Analysis Report\n")
     report.append("## Hypothesis 2: Shift to Project-Oriented (Mecab Analysis)\n")
@@ -45,11 +24,12 @@ def analyze_onboard_trends(df):
     trend_data = []
     for year in years:
         year_df = df[df['year'] == year]
-        top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
+        top_1000 = year_df[year_df['year_rank'] <= 1000].sort_values('year_rank')
         
+        # 名詞はタイトルの解析キャッシュから取り出す (未解析のタイトルだけ MeCab にかける)
         all_nouns = []
-        for title in top_1000['title']:
-            all_nouns.extend(extract_nouns(title, tagger))
+        for nouns in title_nouns(top_1000):
+            all_nouns.extend(nouns)
         
         counter = Counter(all_nouns)
         common_words = [f"{word}({count})" for word, count in counter.most_common(15)]
@@ -65,19 +45,18 @@ def analyze_onboard_trends(df):
     report.append("\n## Project-Oriented Specific Keyword Frequency (Mecab-based)\n")
     
     project_kws = ['検証', '理由', '比較', '解説', '紹介', '方法', '記録', '失敗', '成功', '徹底']
-    kw_stats = []
-    for year in years:
-        year_df = df[df['year'] == year]
-        top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
-        
-        row = {'year': year}
-        for kw in project_kws:
-            count = top_1000['title'].str.contains(kw).sum()
-            row[kw] = count / len(top_1000)
-        kw_stats.append(row)
-    
-    kw_df = pd.DataFrame(kw_stats)
+    # 各年の上位1000件のタイトルを1回だけ走査してキーワードの出現行列を作り、年ごとの出現率に集計する
+    top_df = df[df['year'].isin(years) & (df['year_rank'] <= 1000)]
+    matrix = build_keyword_matrix(top_df['title'], project_kws)
+    kw_df = matrix.document_frequency(top_df['year'], share=True).rename_axis('year').reset_index()
     report.append(kw_df.to_markdown(index=False))
+    
+    # 前年に比べて出現率が伸びた語 (名詞の 1-gram・2-gram。年別出現数ストアは新しい動画の分だけ更新する)
+    update_term_counts('onboard')
+    latest = years[-1]
+    report.append(f"\n## Emerging Terms ({latest} vs {latest - 1})\n")
+    emerging = emerging_terms(latest, categories=['onboard'], top=20)
+    report.append(emerging[['word', 'count', 'base_count', 'share', 'base_share', 'lift']].to_markdown(index=False))
 
     with open('results/onboard_analysis_report.md', 'w', encoding='utf-8') as f:
         f.write("\n".join(report))
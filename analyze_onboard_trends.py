@@ -1,15 +1,15 @@
-import pickle
 import pandas as pd
 from datetime import datetime
 import json
 
+from common_utils import add_year_rank
+from keyword_matrix import build_keyword_matrix
+from video_store import load_videos
+
 def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
+    df = load_videos('onboard', columns=['title', 'viewCounter', 'lengthSeconds', 'year'], start_time=False)
+    # 年ごとの再生数順位を一度だけ求め、各年の上位N件はマスクで取り出す
+    return add_year_rank(df)
 
 def analyze_length(df):
     print("--- Hypothesis 1: Video Length Shortening ---")
@@ -19,7 +19,7 @@ def analyze_length(df):
     for year in years:
         year_df = df[df['year'] == year]
         # Top 1000 by viewCounter
-        top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
+        top_1000 = year_df[year_df['year_rank'] <= 1000]
         
         mean_len = top_1000['lengthSeconds'].mean()
         median_len = top_1000['lengthSeconds'].median()
@@ -46,7 +46,7 @@ def extract_titles_for_gemini(df):
     for year in sample_years:
         year_df = df[df['year'] == year]
         # Top 50 titles
-        top_50 = year_df.sort_values('viewCounter', ascending=False).head(50)
+        top_50 = year_df[year_df['year_rank'] <= 50].sort_values('year_rank')
         summary[str(year)] = top_50['title'].tolist()
     
     with open('results/onboard_titles_sample.json', 'w', encoding='utf-8') as f:
@@ -67,20 +67,10 @@ def analyze_keywords(df):
         '酷道': 'kokudo'
     }
     
-    results = []
-    years = sorted(df['year'].unique())
-    for year in years:
-        year_df = df[df['year'] == year]
-        top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
-        
-        row = {'year': year}
-        for kw_jp, kw_en in keywords.items():
-            # Simple substring match
-            count = top_1000['title'].str.contains(kw_jp, case=False, na=False).sum()
-            row[kw_jp] = count / len(top_1000) if len(top_1000) > 0 else 0
-        results.append(row)
-    
-    kw_df = pd.DataFrame(results)
+    # Simple substring match: scan each year's top 1000 titles once for all keywords
+    top_df = df[df['year_rank'] <= 1000]
+    matrix = build_keyword_matrix(top_df['title'], list(keywords), ignore_case=True)
+    kw_df = matrix.document_frequency(top_df['year'], share=True).rename_axis('year').reset_index()
     print(kw_df.to_string(index=False))
     return kw_df
 
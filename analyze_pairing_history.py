@@ -14,59 +14,19 @@ Processing Overview:
 人気ペアの順位変動をバンプチャートとして可視化します。
 """
 
-import pickle
-import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib_fontja
 import seaborn as sns
 from pathlib import Path
-from itertools import combinations
-import sys
+
+from rank_tensor import pair_rank_tensor
 
 # 日本語フォント設定
 # matplotlib_fontja.japanize() # Main execution blockで設定します
 
-def load_characters():
-    df = pd.read_csv("characters.csv")
-    return df["キャラクター名"].tolist()
-
-def find_characters(tags, character_names):
-    if not tags:
-        return []
-    
-    if isinstance(tags, str):
-        tag_list = tags.split()
-        tags_str = tags
-    elif isinstance(tags, list):
-        tag_list = tags
-        tags_str = " ".join(tags)
-    else:
-        return []
-        
-    found = []
-    exact_match_chars = ["RIA", "朱花", "青葉", "銀芽", "金苗", "ナツ", "シロ", "ナコ", "レコ"]
-    
-    for name in character_names:
-        if name in exact_match_chars:
-            if name in tag_list:
-                found.append(name)
-        else:
-            if name in tags_str:
-                found.append(name)
-    return found
-
-def create_bump_chart(df_pivot_rank, title, output_path, top_n=15):
-    # カラム（年）を数値型に変換
+def create_bump_chart(df_pivot_rank, target_pairs, title, output_path):
+    # 描く対象 (最新年の上位Nペアと過去に1位を取ったペア) は順位テンソル側で選択済み
     df_pivot_rank.columns = df_pivot_rank.columns.astype(int)
-
-    # 最新年の上位Nペアを取得
-    last_year = df_pivot_rank.columns.max()
-    top_pairs = df_pivot_rank[last_year].sort_values().head(top_n).index.tolist()
-    
-    # 過去に1位を取ったことがあるペアも追加
-    leaders = df_pivot_rank.apply(lambda x: x.idxmin(), axis=0).unique().tolist()
-    
-    target_pairs = list(set(top_pairs + leaders))
     
     # フィルタリング
     df_plot = df_pivot_rank.loc[target_pairs]
@@ -136,64 +96,14 @@ def main():
     output_dir = Path("results/history")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    character_names = load_characters()
-    
-    pickle_path = Path(f"results/{genre}.pickle")
-    if not pickle_path.exists():
-        print(f"File not found: {pickle_path}")
-        return
-
     print(f"Processing {genre} for Pairings...")
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    
-    df = pd.json_normalize(recv["data"])
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df["year"] = df["startTime"].dt.year.astype(int)
-    df["viewCounter"] = df["viewCounter"].astype(int)
-    
-    # 2011-2025
-    df = df[(df["year"] >= 2011) & (df["year"] <= 2025)]
-
-    # Extract chars per video
-    # Optimization: Unique tags first
-    df["tags_str"] = df["tags"].apply(lambda x: " ".join(x) if isinstance(x, list) else str(x))
-    unique_tags = df[["tags_str"]].drop_duplicates()
-    unique_tags["found_chars"] = unique_tags["tags_str"].apply(lambda x: find_characters(x, character_names))
-    
-    df = df.merge(unique_tags, on="tags_str", how="left")
-    
-    # Expand Pairs
-    pair_data = []
-    
-    print("Aggregating pairs...")
-    for _, row in df.iterrows():
-        chars = row["found_chars"]
-        if len(chars) >= 2:
-            # Sort to ensure "A & B" is same as "B & A"
-            for p in combinations(sorted(chars), 2):
-                pair_name = f"{p[0]} & {p[1]}"
-                pair_data.append({
-                    "year": row["year"],
-                    "pair": pair_name,
-                    "viewCounter": row["viewCounter"]
-                })
-    
-    if not pair_data:
+    # 2人以上のキャラクターが出る動画のペアごとの年別再生数と、その順位 (2011-2025)
+    tensor = pair_rank_tensor([genre])
+    if not tensor.entities:
         print("No pairs found.")
         return
         
-    df_pairs = pd.DataFrame(pair_data)
-    
-    # Group by Year + Pair
-    yearly_pair_views = df_pairs.groupby(["year", "pair"])["viewCounter"].sum().reset_index()
-    
-    # Pivot
-    df_wide = yearly_pair_views.pivot(index="year", columns="pair", values="viewCounter")
-    df_wide.to_csv(output_dir / f"{genre}_pairings_race.csv", encoding="utf-8-sig")
-    
-    # Rank
-    df_rank = df_wide.rank(axis=1, ascending=False, method='min')
+    tensor.value_frame(genre, "views").to_csv(output_dir / f"{genre}_pairings_race.csv", encoding="utf-8-sig")
     
     # Plot
     sns.set_style("whitegrid")
@@ -204,7 +114,12 @@ def main():
         if platform.system() == "Windows":
             plt.rcParams['font.family'] = ['Meiryo', 'Yu Gothic', 'MS Gothic']
 
-    create_bump_chart(df_rank.T, f"ボイロ実況 人気ペア推移 ({genre})", output_dir / f"bump_chart_{genre}_pairs.png")
+    create_bump_chart(
+        tensor.rank_frame(genre, "views").T,
+        tensor.bump_targets(genre, "views", top_n=15),
+        f"ボイロ実況 人気ペア推移 ({genre})",
+        output_dir / f"bump_chart_{genre}_pairs.png",
+    )
     
     print(f"Done. Saved to {output_dir / f'bump_chart_{genre}_pairs.png'}")
 
@@ -1,42 +1,45 @@
-import pickle
 import pandas as pd
 
+from common_utils import add_year_rank
+from series_index import attach_series
+from video_store import load_videos
+
 def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
+    # 2015〜2025年 のパーティションだけを読み込み、再構成したシリーズと年ごとの再生数順位を付ける
+    df = load_videos('onboard', columns=['key', 'title', 'userId', 'viewCounter', 'year'], start_time=False, years=range(2015, 2026))
+    df = attach_series(df, 'onboard')
+    return add_year_rank(df)
 
 def analyze_part_distribution(df):
     results = []
     years = sorted([y for y in df['year'].unique() if 2015 <= y <= 2025])
     
-    print("--- Analysis of 'Part' series concentration ---")
+    print("--- Analysis of series concentration ---")
     
     for year in years:
         year_df = df[df['year'] == year]
-        top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
+        top_1000 = year_df[year_df['year_rank'] <= 1000]
         
-        # Videos containing 'part' or 'Part'
-        part_videos = top_1000[top_1000['title'].str.contains('part', case=False, na=False)]
+        # Videos belonging to a series (2 or more videos by the same poster)
+        series_videos = top_1000[top_1000['series_size'] >= 2]
         
-        total_part_videos = len(part_videos)
-        unique_users = part_videos['userId'].nunique()
+        total_series_videos = len(series_videos)
+        series_count = series_videos['series_id'].nunique()
+        unique_users = series_videos['userId'].nunique()
         
-        # Calculate how many videos the top 3 'part' posters account for
-        if not part_videos.empty:
-            user_counts = part_videos['userId'].value_counts()
-            top_3_ratio = user_counts.head(3).sum() / total_part_videos
+        # Calculate how many videos the top 3 series posters account for
+        if not series_videos.empty:
+            user_counts = series_videos['userId'].value_counts()
+            top_3_ratio = user_counts.head(3).sum() / total_series_videos
         else:
             top_3_ratio = 0
             
         results.append({
             'year': year,
-            'part_video_count': total_part_videos,
+            'series_video_count': total_series_videos,
+            'series_count': series_count,
             'unique_posters': unique_users,
-            'avg_parts_per_user': total_part_videos / unique_users if unique_users > 0 else 0,
+            'avg_videos_per_series': total_series_videos / series_count if series_count > 0 else 0,
             'top_3_concentration': top_3_ratio
         })
     
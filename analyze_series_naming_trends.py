@@ -1,14 +1,14 @@
-import pickle
 import pandas as pd
-import re
+
+from common_utils import add_year_rank
+from series_classifier import has_style, series_flags
+from video_store import load_videos
 
 def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
+    # 2015〜2025年 のパーティションだけを読み込み、シリーズ表記のフラグ (ストアにキャッシュ) を付ける
+    df = load_videos('onboard', columns=['key', 'title', 'userId', 'viewCounter', 'year'], start_time=False, years=range(2015, 2026))
+    df['series_flags'] = series_flags(df)
+    return add_year_rank(df)
 
 def analyze_naming_trends(df):
     results = []
@@ -18,15 +18,14 @@ def analyze_naming_trends(df):
     
     for year in years:
         year_df = df[df['year'] == year]
-        top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
+        top_1000 = year_df[year_df['year_rank'] <= 1000]
         
         # Count 'part' / 'Part'
-        part_count = top_1000['title'].str.contains('part', case=False, na=False).sum()
+        part_count = has_style(top_1000['series_flags'], ['part_loose']).sum()
         
         # Count '話' (excluding words like '世話' or '話題')
         # We look for digits followed by '話' or '話' preceded by digits/kanji numbers
-        hana_pattern = r'\d+話|[一二三四五六七八九十]+話|第.+話'
-        hana_count = top_1000['title'].str.contains(hana_pattern, na=False).sum()
+        hana_count = has_style(top_1000['series_flags'], ['episode_loose']).sum()
         
         results.append({
             'year': year,
@@ -42,7 +41,7 @@ def analyze_naming_trends(df):
     print("\n--- Top '話' (Episode) style users (2024-2025) ---")
     recent_df = df[df['year'].isin([2024, 2025])]
     recent_top = recent_df.sort_values('viewCounter', ascending=False).head(2000)
-    hana_videos = recent_top[recent_top['title'].str.contains(hana_pattern, na=False)]
+    hana_videos = recent_top[has_style(recent_top['series_flags'], ['episode_loose'])]
     
     if not hana_videos.empty:
         user_counts = hana_videos['userId'].value_counts().head(5)
@@ -3,13 +3,13 @@
 #   "matplotlib",
 #   "matplotlib-fontja",
 #   "pandas",
+#   "pyarrow",
 #   "requests",
 #   "seaborn",
 # ]
 # ///
 
 import datetime
-import pickle
 import sys
 import tomllib
 import xml.etree.ElementTree as ET
@@ -22,6 +22,8 @@ import requests
 import seaborn as sns
 
 from common_utils import filter_software_talk
+from value_sketches import densities, quantiles
+from video_store import load_videos
 
 # SHOW_PLOT = True
 SHOW_PLOT = False
@@ -31,27 +33,26 @@ VIOLINPLOT = True
 
 def visualize_both(df, category, title, output_dir):
     print("再生数")
-    df2 = df[["startTime", "viewCounter"]]
-    annualView = df2.resample("YE", on="startTime").sum()
+    # 取り込み時に算出済みの JST の年 (整数) で集計する
+    by_year = df.groupby("year")["viewCounter"]
+    annualView = by_year.sum()
 
     # 2025年まで表示するようにインデックスを調整
-    start_dt = pd.Timestamp("2011-12-31").tz_localize(annualView.index.tz)
-    end_dt = pd.Timestamp("2025-12-31").tz_localize(annualView.index.tz)
-    target_index = pd.date_range(start=start_dt, end=end_dt, freq="YE")
+    target_index = pd.RangeIndex(2011, 2026, name="year")
     annualView = annualView.reindex(target_index, fill_value=0)
-    x = [d.year for d in annualView.index]
+    x = list(target_index)
     print(annualView)
 
     print("再生数（中央値）")
-    annualViewMedian = df2.resample("YE", on="startTime").quantile(0.5).reindex(target_index, fill_value=0)
+    # 再生数の分布のスケッチから求める (相対誤差 1% 以内)
+    annualViewMedian = quantiles(category, 0.5).reindex(target_index, fill_value=0)
     print(annualViewMedian)
     print("=======")
 
     print("=======")
     print("投稿数")
 
-    df_counts = df["startTime"].value_counts()
-    annualSubmit = df_counts.resample("YE").sum().reindex(target_index, fill_value=0)
+    annualSubmit = df.groupby("year").size().reindex(target_index, fill_value=0)
     print(annualSubmit)
     print("=======")
 
@@ -63,7 +64,7 @@ def visualize_both(df, category, title, output_dir):
 
     # step3 折れ線グラフの描画
     p1 = ax.bar(x, annualSubmit, color="C0", label="投稿数", alpha=0.6)
-    (p2,) = twin1.plot(x, annualView["viewCounter"] / (10**6), color="C1", marker="o", label="再生数")
+    (p2,) = twin1.plot(x, annualView / (10**6), color="C1", marker="o", label="再生数")
 
     ax.set_xlabel("投稿年")
     twin1.set_ylabel("再生数（百万単位）")
@@ -89,15 +90,11 @@ def visualize_both(df, category, title, output_dir):
 
 
 def visualize_newcomer(df: pd.DataFrame, category: str, title: str, output_dir):
-    df = df[df["userId"] != 0].copy()
-    df["year"] = df["startTime"].dt.year
+    df = df[df["userId"] != 0]
     total_posters = df.groupby("year")["userId"].nunique().to_dict()
 
-    df2 = df.groupby("userId").min()
-    newcommers = {}
-    for d in df2["startTime"]:
-        current = newcommers.get(d.year, 0)
-        newcommers[d.year] = current + 1
+    # 各投稿者の初投稿年ごとの人数
+    newcommers = df.groupby("userId")["year"].min().value_counts().to_dict()
 
     x = list(range(2011, 2026))
     y_total = [total_posters.get(x_, 0) for x_ in x]
@@ -132,15 +129,11 @@ def visualize_newcomer(df: pd.DataFrame, category: str, title: str, output_dir):
     plt.close("all")
 
 def visualize_newcomer_emphasis(df: pd.DataFrame, category: str, title: str, output_dir, emphasis_years=[2023, 2025]):
-    df = df[df["userId"] != 0].copy()
-    df["year"] = df["startTime"].dt.year
+    df = df[df["userId"] != 0]
     total_posters = df.groupby("year")["userId"].nunique().to_dict()
 
-    df2 = df.groupby("userId").min()
-    newcommers = {}
-    for d in df2["startTime"]:
-        current = newcommers.get(d.year, 0)
-        newcommers[d.year] = current + 1
+    # 各投稿者の初投稿年ごとの人数
+    newcommers = df.groupby("userId")["year"].min().value_counts().to_dict()
 
     # 2020年以降に限定
     x = list(range(2020, 2026))
@@ -179,12 +172,31 @@ def visualize_newcomer_emphasis(df: pd.DataFrame, category: str, title: str, out
         fig.savefig(output_dir / f"{category}_annual-newcommer-emphasis.png", dpi=300, bbox_inches="tight")
     plt.close("all")
 
+def draw_violins(ax, category: str, years, upper: float, width: float = 0.5):
+    """
+    再生数の分布のスケッチから年ごとのバイオリン図 (密度の面積で正規化、箱は四分位範囲、白丸は中央値) を描く。
+    """
+    violins = densities(category, years=years, upper=upper)
+    years = [y for y in years if y in violins]
+    if not years:
+        return
+    scale = width / 2 / max(density.max() for _, density in violins.values())
+    box = quantiles(category, [0.25, 0.5, 0.75], years=years)
+    for x, year in enumerate(years):
+        grid, density = violins[year]
+        ax.fill_betweenx(grid, x - density * scale, x + density * scale, color="C0", linewidth=1, edgecolor="0.25")
+        q1, median, q3 = box.loc[year]
+        ax.vlines(x, q1, q3, color="0.25", linewidth=width * 10)
+        ax.scatter([x], [median], color="white", s=width * 30, zorder=3)
+    ax.set_xticks(range(len(years)), [str(y) for y in years])
+
+
 def visualize_distribution(df: pd.DataFrame, category: str, title: str, dist_ylim: str, output_dir):
-    df2 = df[["startTime", "viewCounter"]].copy()
-    df2["startTime"] = df2["startTime"].dt.year
     if VIOLINPLOT:
-        sns.violinplot(data=df2.query("2018 <= startTime < 2026"), x="startTime", y="viewCounter", cut=0, width=0.5)
+        # 行を読まずに再生数の分布のスケッチから描く
+        draw_violins(plt.gca(), category, range(2018, 2026), dist_ylim[1])
     else:
+        df2 = df[["year", "viewCounter"]].rename(columns={"year": "startTime"})
         sns.boxplot(data=df2.query("2018 <= startTime < 2026"), x="startTime", y="viewCounter")
 
     plt.gca().set_xlabel("投稿年")
@@ -231,7 +243,7 @@ def visualize_continuation(df: pd.DataFrame, category: str, title: str, output_d
     df_valid = df[df["userId"] != 0]
 
     # Determine Debut Year for each user
-    user_debut = df_valid.groupby("userId")["startTime"].min().dt.year
+    user_debut = df_valid.groupby("userId")["year"].min()
 
     # Determine active users (posted within last 1 year from max date)
     now = df_valid["startTime"].max()
@@ -483,17 +495,14 @@ def visualize_lifespan_thumbnail(df: pd.DataFrame, category: str, title: str, ou
 
 
 def preprocess(category):
-    with open(f"results/{category}.pickle", "rb") as f:
-        recv = pickle.load(f)
-    # print(recv["meta"])
-    df = pd.json_normalize(recv["data"])
+    # フェッチ時に型付きの列へ変換済みのストアから読み込む
+    df = load_videos(category)
 
     # ソフトウェアトークの場合、VOCALOID関連を除外（歌唱系が混じるため）
     if category == "software_talk":
         df = filter_software_talk(df)
 
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df = df.sort_values("startTime", ignore_index=True)
+    df = df.sort_values("startEpoch", ignore_index=True)
     df.fillna({"userId": 0}, inplace=True)
     df["userId"] = df["userId"].astype("uint64")
     date = datetime.datetime.now()
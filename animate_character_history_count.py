@@ -8,7 +8,6 @@
 # ]
 # ///
 
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -18,6 +17,8 @@ import matplotlib_fontja
 from pathlib import Path
 from PIL import Image
 
+from rank_tensor import character_rank_tensor, monthly_rank_frame
+
 # FFmpeg configuration
 plt.rcParams['animation.ffmpeg_path'] = r"C:\Users\estshorter\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0.1-full_build\bin\ffmpeg.exe"
 
@@ -47,34 +48,23 @@ def get_icon_color(icon_path):
     return None
 
 def create_animation():
-    input_path = Path("results/history/cache/software_talk_processed.csv")
     icon_dir = Path("icons")
     output_dir = Path("results/history")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    if not input_path.exists():
-        print(f"Error: Cache data not found at {input_path}.")
-        return
-
     print("Loading and preparing data...")
-    df = pd.read_csv(input_path)
-    df = df[(df["year"] >= 2011) & (df["year"] <= 2025)]
-    
-    # 投稿数ベースでの集計 (contentId のユニーク数)
-    yearly_counts = df.groupby(["year", "character"])["contentId"].nunique().reset_index()
-    yearly_counts.columns = ["year", "character", "postCount"]
-    df_wide = yearly_counts.pivot(index="year", columns="character", values="postCount")
-    
-    # 順位変換 (NaNはそのまま)
-    df_rank = df_wide.rank(axis=1, ascending=False, method='min')
+    # 全体 (ソフトウェアトーク) の年ごとの順位 (描く対象の選択に使う)
+    tensor = character_rank_tensor(["overall"])
+    # 月ごとの直近12か月の順位 (NaNはそのまま。年の間の動きも実データで描く)
+    df_rank = monthly_rank_frame("overall", "posts")
     # 10位より下をカット (11位として扱う)
     df_rank[df_rank > 10] = 11
     
     # 登場キャラの抽出
     # メイン: 2025年のTOP10
-    target_chars = df_rank.loc[2025][df_rank.loc[2025] <= 10].index.tolist()
+    target_chars = tensor.top("overall", "posts", 10, year=2025)
     # 背景: 2025年TOP10以外で、過去に一度でも10位以内に入ったキャラ
-    ever_top10 = df_rank[df_rank <= 10].dropna(how='all', axis=1).columns.tolist()
+    ever_top10 = df_rank.columns[(df_rank <= 10).any()].tolist()
     other_chars = [c for c in ever_top10 if c not in target_chars]
     
     print(f"Target characters (Top 10 in 2025): {len(target_chars)}")
@@ -120,9 +110,12 @@ def create_animation():
                 print(f"FAILED to match icon: {char}")
 
     # アニメーション設定
+    # 月ごとの点の位置 (年 + (月 - 12) / 12。12月が年の目盛りに重なる。月の格子は欠けなし)
     years = sorted(df_rank.index.tolist())
-    steps_per_year = 30 * 2
-    frames = (len(years) - 1) * steps_per_year + 1
+    # 月の点の間を補間するフレーム数 (1年あたり 12 × 5 = 60 フレームで従来と同じ)
+    steps_per_month = 5
+    frames = (len(years) - 1) * steps_per_month + 1
+    year_ticks = list(range(int(np.ceil(years[0])), int(np.floor(years[-1])) + 1))
     
     fig, ax = plt.subplots(figsize=(16, 9))
     # 余白を固定してガタつきを防止
@@ -147,17 +140,17 @@ def create_animation():
     def update(frame):
         ax.clear()
         # 軸と範囲を固定 (10位まで表示)
-        ax.set_xlim(2010.5, 2025.5)
+        ax.set_xlim(2010.0, 2025.5)
         ax.set_ylim(10.5, 0.5)
         ax.set_yticks(range(1, 11))
-        ax.set_xticks(years)
-        ax.set_xticklabels([str(y) for y in years])
+        ax.set_xticks(year_ticks)
+        ax.set_xticklabels([str(y) for y in year_ticks])
         
-        year_idx = frame // steps_per_year
-        alpha = (frame % steps_per_year) / steps_per_year
-        current_year_val = years[year_idx] + alpha
+        year_idx = frame // steps_per_month
+        alpha = (frame % steps_per_month) / steps_per_month
+        current_year_val = years[year_idx] + alpha / 12
         
-        ax.set_title(f"ボイロキャラクター人気順位推移 (投稿数) ({int(years[year_idx])}年)", fontsize=28, pad=20)
+        ax.set_title(f"ボイロキャラクター人気順位推移 (投稿数) ({int(np.ceil(years[year_idx]))}年)", fontsize=28, pad=20)
         ax.set_xlabel("年", fontsize=18)
         ax.set_ylabel("順位 (投稿数)", fontsize=18)
         ax.grid(True, axis='both', linestyle='--', alpha=0.3)
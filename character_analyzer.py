@@ -15,71 +15,41 @@ Processing Overview:
 および2人出演限定のコンビランキングを集計し、グラフ（ランキング図、推移図）として可視化します。
 """
 
-import pickle
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import matplotlib_fontja
 import sys
 from pathlib import Path
 
-from common_utils import filter_software_talk, find_characters
+from character_cube import character_videos, load_characters, load_cube
 
 matplotlib_fontja.japanize()
 
 def main(category):
-    pickle_path = Path(f"results/{category}.pickle")
-    characters_path = Path("characters.csv")
     output_dir = Path("results") / category
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # 1. Load data
-    print(f"Loading data for {category}...")
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    df = pd.json_normalize(recv["data"])
-
-    # ソフトウェアトークの場合、VOCALOID関連を除外（歌唱系が混じるため）
-    if category == "software_talk":
-        df = filter_software_talk(df)
-
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df["year"] = df["startTime"].dt.year
-    df["viewCounter"] = df["viewCounter"].astype(int)
-
-    characters_df = pd.read_csv(characters_path)
-    character_names = characters_df["キャラクター名"].tolist()
-
-    # 2. Map characters to videos
+    # 1-2. Map characters to videos (タグの語彙 ID で照合。software_talk は歌唱系を除外済み)
     print(f"Mapping characters to videos for {category}...")
-    df["found_characters"] = df["tags"].apply(lambda x: find_characters(x, character_names))
+    character_names = load_characters()
+    mapping_df = character_videos(category, character_names, columns=("key", "contentId", "viewCounter", "year"))
 
     # 3. Save mapping
     print("Saving mapping...")
-    mapping_data = []
-    for _, row in df.iterrows():
-        for char in row["found_characters"]:
-            mapping_data.append({
-                "contentId": row["contentId"],
-                "character": char,
-                "viewCounter": row["viewCounter"],
-                "year": row["year"]
-            })
-    
-    if not mapping_data:
+    if mapping_df.empty:
         print(f"No characters found for {category}.")
         return
         
-    mapping_df = pd.DataFrame(mapping_data)
-    mapping_df.to_csv(output_dir / f"{category}_character_mapping.csv", index=False, encoding="utf-8-sig")
+    mapping_df[["contentId", "character", "viewCounter", "year"]].to_csv(output_dir / f"{category}_character_mapping.csv", index=False, encoding="utf-8-sig")
 
-    # 4. Calculate rankings
+    # 4. Calculate rankings (年 × キャラクターの集計済みのキューブから)
     print("Calculating rankings...")
-    char_views = mapping_df.groupby("character")["viewCounter"].sum().sort_values(ascending=False).reset_index()
+    cube = load_cube([category])
+    char_views = cube.groupby("character")["views"].sum().sort_values(ascending=False).rename("viewCounter").reset_index()
     char_views.to_csv(output_dir / f"{category}_character_ranking_overall.csv", index=False, encoding="utf-8-sig")
 
-    char_counts = mapping_df.groupby("character")["contentId"].nunique().sort_values(ascending=False).reset_index()
+    char_counts = cube.groupby("character")["posts"].sum().sort_values(ascending=False).reset_index()
     char_counts.columns = ["character", "postCount"]
     char_counts.to_csv(output_dir / f"{category}_character_ranking_overall_count.csv", index=False, encoding="utf-8-sig")
 
@@ -112,7 +82,7 @@ def main(category):
     fig, axes = plt.subplots(3, 3, figsize=(24, 20))
     axes = axes.flatten()
     for i, year in enumerate(all_years):
-        year_data = mapping_df[mapping_df["year"] == year].groupby("character")["viewCounter"].sum().sort_values(ascending=False).head(20).reset_index()
+        year_data = cube[cube["year"] == year].set_index("character")["views"].sort_values(ascending=False).head(20).rename("viewCounter").reset_index()
         if not year_data.empty:
             sns.barplot(data=year_data, x="viewCounter", y="character", ax=axes[i], hue="character", palette="magma", legend=False)
             axes[i].set_title(f"{year}年 (TOP 20 - 再生数)", fontsize=16)
@@ -128,7 +98,7 @@ def main(category):
     fig, axes = plt.subplots(3, 3, figsize=(24, 20))
     axes = axes.flatten()
     for i, year in enumerate(all_years):
-        year_data = mapping_df[mapping_df["year"] == year].groupby("character")["contentId"].nunique().sort_values(ascending=False).head(20).reset_index()
+        year_data = cube[cube["year"] == year].set_index("character")["posts"].sort_values(ascending=False).head(20).reset_index()
         year_data.columns = ["character", "postCount"]
         if not year_data.empty:
             sns.barplot(data=year_data, x="postCount", y="character", ax=axes[i], hue="character", palette="magma", legend=False)
@@ -143,18 +113,11 @@ def main(category):
 
     # 6. Co-occurrence Matrix
     print("Creating co-occurrence matrix...")
-    co_occurrence = np.zeros((len(character_names), len(character_names)))
-    char_to_idx = {name: i for i, name in enumerate(character_names)}
-
-    for found in df["found_characters"]:
-        for i in range(len(found)):
-            for j in range(i + 1, len(found)):
-                idx1 = char_to_idx[found[i]]
-                idx2 = char_to_idx[found[j]]
-                co_occurrence[idx1, idx2] += 1
-                co_occurrence[idx2, idx1] += 1
-
-    co_df = pd.DataFrame(co_occurrence, index=character_names, columns=character_names)
+    # 同じ動画に出るキャラクターの組 (動画キーでの自己結合)
+    members = mapping_df[["key", "character"]]
+    both = members.merge(members, on="key")
+    both = both[both["character_x"] != both["character_y"]]
+    co_df = pd.crosstab(both["character_x"], both["character_y"]).reindex(index=character_names, columns=character_names, fill_value=0)
     mask = co_df.sum(axis=0) > 0
     co_df_filtered = co_df.loc[mask, mask]
 
@@ -162,16 +125,13 @@ def main(category):
     print("Visualizing network and pairings...")
     if not co_df_filtered.empty:
         # Top Pairings by view count (Strictly 2 characters)
-        pair_views = {}
-        for _, row in df.iterrows():
-            found = row["found_characters"]
-            if len(found) == 2:
-                p = sorted(found)
-                pair_name = f"{p[0]} & {p[1]}"
-                pair_views[pair_name] = pair_views.get(pair_name, 0) + row["viewCounter"]
+        sizes = mapping_df.groupby("key")["character"].transform("size")
+        duos = mapping_df[sizes == 2].sort_values(["key", "character"])
+        pairs = duos.groupby("key").agg(pair=("character", " & ".join), viewCounter=("viewCounter", "first"), year=("year", "first"))
+        pair_views = pairs.groupby("pair")["viewCounter"].sum()
         
-        if pair_views:
-            top_pairs = pd.Series(pair_views).sort_values(ascending=False).head(20)
+        if not pair_views.empty:
+            top_pairs = pair_views.sort_values(ascending=False).head(20)
             plt.figure(figsize=(10, 8))
             sns.barplot(x=top_pairs.values, y=top_pairs.index, hue=top_pairs.index, palette="coolwarm", legend=False)
             plt.title(f"{category} 人気コンビ総再生数ランキング (TOP 20 - 2人出演限定)")
@@ -186,17 +146,10 @@ def main(category):
         axes = axes.flatten()
         
         for i, year in enumerate(all_years):
-            year_df = df[df["year"] == year]
-            pair_views_year = {}
-            for _, row in year_df.iterrows():
-                found = row["found_characters"]
-                if len(found) == 2:
-                    p = sorted(found)
-                    pair_name = f"{p[0]} & {p[1]}"
-                    pair_views_year[pair_name] = pair_views_year.get(pair_name, 0) + row["viewCounter"]
+            pair_views_year = pairs[pairs["year"] == year].groupby("pair")["viewCounter"].sum()
             
-            if pair_views_year:
-                top_pairs_year = pd.Series(pair_views_year).sort_values(ascending=False).head(20)
+            if not pair_views_year.empty:
+                top_pairs_year = pair_views_year.sort_values(ascending=False).head(20)
                 sns.barplot(x=top_pairs_year.values, y=top_pairs_year.index, ax=axes[i], hue=top_pairs_year.index, palette="coolwarm", legend=False)
                 axes[i].set_title(f"{year}年 (TOP 20 - 2人出演限定)", fontsize=16)
                 axes[i].set_xlabel("再生数")
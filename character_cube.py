@@ -0,0 +1,265 @@
+"""
+Processing Overview:
+キャラクター別集計のキューブ (カテゴリ × 投稿年 × キャラクター -> 投稿数・投稿者数・総再生数・再生数中央値)。
+各カテゴリの動画 × キャラクターの出現 (タグの語彙 ID による照合) から一度だけ集計して保存し、
+ランキングのレポート (generate_rankings_md.py など) はこの表を読み込んで並べ替えるだけにします。
+同じ読み込みから、月単位と直近12か月 (ローリング) の投稿数・再生数・投稿者数の時系列 (キャラクター別月次系列) も作ります。
+元データ (コーパス・タグ語彙・characters.csv) が更新された場合は、次に読み込むときに作り直します。
+投稿者数では投稿者不明 (userId が 0) の動画を1人の投稿者として数えます (poster_sketches.py の投稿者数も同じ規則です)。
+
+使い方:
+    python character_cube.py
+"""
+
+import hashlib
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common_utils import filter_software_talk, find_character_rows
+from tag_index import VOCAB_PATH
+from video_store import CATEGORIES_PATH, CORPUS_DIR, STORE_DIR, has_category, load_category_bits, load_videos
+
+CUBE_DIR = STORE_DIR / "character_cube"
+# 集計の内容を変えた場合は上げる (次回読み込み時に作り直されます)
+CUBE_VERSION = 3
+CHARACTERS_PATH = Path("characters.csv")
+# ランキングで扱うカテゴリ (ストアに登録済みのカテゴリも含めます。データのないものは飛ばす)
+CUBE_CATEGORIES = ["software_talk", "game", "onboard", "kitchen", "explanation", "theater", "travel", "fishing"]
+
+CUBE_SCHEMA = pa.schema(
+    [
+        ("category", pa.string()),
+        ("year", pa.int16()),
+        ("character", pa.string()),
+        ("posts", pa.int64()),           # 投稿数 (ユニーク動画数)
+        ("posters", pa.int64()),         # 投稿者数 (ユニーク userId。投稿者不明は 0 として1人に数える)
+        ("views", pa.int64()),           # 総再生数
+        ("median_views", pa.float64()),  # 再生数の中央値
+    ]
+)
+# 直近何か月をローリングの窓とするか
+ROLLING_MONTHS = 12
+# 集計上のノイズとして月次系列 (順位推移) から除く (カテゴリ, 年, キャラクター)。年次のキューブには含めます
+SERIES_NOISE_ROWS = [("software_talk", 2013, "東北イタコ")]
+
+SERIES_SCHEMA = pa.schema(
+    [
+        ("category", pa.string()),
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+        ("character", pa.string()),
+        ("posts", pa.int64()),            # その月の投稿数
+        ("views", pa.int64()),            # その月の総再生数
+        ("posters", pa.int64()),          # その月の投稿者数
+        ("posts_12m", pa.int64()),        # 直近12か月 (その月を含む) の投稿数
+        ("views_12m", pa.int64()),        # 直近12か月の総再生数
+        ("posters_12m", pa.int64()),      # 直近12か月の投稿者数 (重複なし)
+        ("share_12m", pa.float64()),      # 直近12か月の投稿数のキャラクター間でのシェア
+    ]
+)
+
+
+def load_characters() -> list[str]:
+    return pd.read_csv(CHARACTERS_PATH)["キャラクター名"].tolist()
+
+
+def cube_path(ignore_case: bool = True) -> Path:
+    # キャラ名の照合で大文字小文字を区別するかどうかで別の表にする
+    return CUBE_DIR / ("character_cube.parquet" if ignore_case else "character_cube_case_sensitive.parquet")
+
+
+def series_path(ignore_case: bool = True) -> Path:
+    return CUBE_DIR / ("character_monthly.parquet" if ignore_case else "character_monthly_case_sensitive.parquet")
+
+
+def cube_categories() -> list[str]:
+    return [c for c in dict.fromkeys([*CUBE_CATEGORIES, *load_category_bits()]) if has_category(c)]
+
+
+def source_signature(ignore_case: bool) -> str:
+    # 元データのファイルのサイズと更新時刻 (取得や取り込みで変わる)
+    parts = [f"v{CUBE_VERSION}", str(ignore_case), ",".join(CUBE_CATEGORIES)]
+    for path in [*sorted(CORPUS_DIR.glob("*.parquet")), VOCAB_PATH, CATEGORIES_PATH, CHARACTERS_PATH]:
+        if path.exists():
+            stat = path.stat()
+            parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def character_videos(category: str, character_names=None, ignore_case: bool = True, columns=("key", "contentId", "userId", "viewCounter", "year")) -> pd.DataFrame:
+    """
+    カテゴリの動画 × キャラクターの出現を縦持ちの表 (columns の列 + character) で返す。
+    software_talk は歌唱系の動画を除きます。1動画に複数キャラがいる場合はそれぞれに行を分けます。
+    """
+    character_names = character_names if character_names is not None else load_characters()
+    df = load_videos(category, columns=[*dict.fromkeys([*columns, "key", "tag_ids"])], start_time=False)
+    if category == "software_talk":
+        df = filter_software_talk(df)
+    found = find_character_rows(df, character_names, ignore_case=ignore_case)
+    exploded = df.iloc[found["row"].to_numpy()][list(columns)].assign(character=found["character"].to_numpy())
+    return exploded.drop_duplicates(["key", "character"] if "key" in columns else None).reset_index(drop=True)
+
+
+def aggregate(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    動画 × キャラクターの表を (year, character) ごとに集計する。
+    """
+    stats = rows.groupby(["year", "character"], sort=True).agg(
+        posts=("key", "nunique"),
+        posters=("userId", "nunique"),
+        views=("viewCounter", "sum"),
+        median_views=("viewCounter", "median"),
+    )
+    return stats.reset_index()
+
+
+def monthly_series(rows: pd.DataFrame, window: int = ROLLING_MONTHS) -> pd.DataFrame:
+    """
+    動画 × キャラクターの表 (key, userId, viewCounter, year, month, character) から、キャラクター × 月の系列を求める。
+    月の軸は最初の月から最後の月までの連続した格子で、月ごとの値を一度の並べ替えと累積和で直近 window か月の値にします。
+    直近の投稿者数は、同じ (キャラクター, 投稿者) の各投稿月から「window か月後」と「次の投稿月」の早い方までを
+    その投稿者が数えられる期間として差分配列に加え、累積和で重複なしの人数にします。
+    """
+    if rows.empty:
+        return pd.DataFrame(columns=[c for c in SERIES_SCHEMA.names if c != "category"])
+    periods = rows["year"].to_numpy(dtype=np.int64) * 12 + rows["month"].to_numpy(dtype=np.int64) - 1
+    first = periods.min()
+    n_months = int(periods.max() - first + 1)
+    months = periods - first
+    chars, labels = pd.factorize(rows["character"], sort=True)
+    n_chars = len(labels)
+    cells = chars * n_months + months
+    size = n_chars * n_months
+
+    posts = np.bincount(cells, minlength=size).reshape(n_chars, n_months)
+    views = np.bincount(cells, weights=rows["viewCounter"].to_numpy(dtype=np.float64), minlength=size).reshape(n_chars, n_months)
+
+    # (キャラクター, 投稿者, 月) を並べ替えて重複を除く
+    users = rows["userId"].to_numpy(dtype=np.int64)
+    order = np.lexsort((months, users, chars))
+    c, u, m = chars[order], users[order], months[order]
+    first_in_month = np.ones(len(c), dtype=bool)
+    first_in_month[1:] = (c[1:] != c[:-1]) | (u[1:] != u[:-1]) | (m[1:] != m[:-1])
+    c, u, m = c[first_in_month], u[first_in_month], m[first_in_month]
+    posters = np.bincount(c * n_months + m, minlength=size).reshape(n_chars, n_months)
+
+    # 同じ (キャラクター, 投稿者) の次の投稿月 (なければ窓の終わり)
+    same_next = np.zeros(len(c), dtype=bool)
+    same_next[:-1] = (c[1:] == c[:-1]) & (u[1:] == u[:-1])
+    next_month = np.where(same_next, np.append(m[1:], 0), m + window)
+    end = np.minimum(m + window, next_month)
+    delta = np.zeros((n_chars, n_months + window + 1), dtype=np.int64)
+    np.add.at(delta, (c, m), 1)
+    np.add.at(delta, (c, end), -1)
+    posters_window = np.cumsum(delta, axis=1)[:, :n_months]
+
+    def rolling(values: np.ndarray) -> np.ndarray:
+        total = np.cumsum(values, axis=1)
+        total[:, window:] -= total[:, :-window].copy()
+        return total
+
+    posts_window = rolling(posts)
+    share = posts_window / np.maximum(posts_window.sum(axis=0, keepdims=True), 1)
+    period = np.arange(n_months) + first
+    keep = (posts_window > 0).ravel()
+    series = pd.DataFrame(
+        {
+            "year": np.tile(period // 12, n_chars),
+            "month": np.tile(period % 12 + 1, n_chars),
+            "character": np.repeat(np.asarray(labels, dtype=object), n_months),
+            "posts": posts.ravel(),
+            "views": views.ravel().astype(np.int64),
+            "posters": posters.ravel(),
+            "posts_12m": posts_window.ravel(),
+            "views_12m": rolling(views).ravel().astype(np.int64),
+            "posters_12m": posters_window.ravel(),
+            "share_12m": share.ravel(),
+        }
+    )
+    return series[keep].reset_index(drop=True)
+
+
+def _write(table: pa.Table, path: Path, signature: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    pq.write_table(table.replace_schema_metadata({"signature": signature}), tmp_path)
+    tmp_path.replace(path)
+
+
+def build_cube(ignore_case: bool = True) -> pa.Table:
+    """
+    全カテゴリのキューブとキャラクター別月次系列を作り直して保存し、キューブを返す。
+    """
+    character_names = load_characters()
+    frames, series_frames = [], []
+    for category in cube_categories():
+        rows = character_videos(category, character_names, ignore_case, columns=("key", "userId", "viewCounter", "year", "month"))
+        frames.append(aggregate(rows).assign(category=category))
+        noise = np.zeros(len(rows), dtype=bool)
+        for noise_category, year, character in SERIES_NOISE_ROWS:
+            if noise_category == category:
+                noise |= (rows["year"] == year).to_numpy() & (rows["character"] == character).to_numpy()
+        # ノイズの投稿は直近12か月の累積に入る前に除く
+        series_frames.append(monthly_series(rows[~noise]).assign(category=category))
+    cube = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CUBE_SCHEMA.names)
+    series = pd.concat(series_frames, ignore_index=True) if series_frames else pd.DataFrame(columns=SERIES_SCHEMA.names)
+    table = pa.Table.from_pandas(cube[CUBE_SCHEMA.names], schema=CUBE_SCHEMA, preserve_index=False)
+
+    # 取り込み (従来の pickle からの移行) で元データが変わることがあるため、署名は読み込みの後に求める
+    signature = source_signature(ignore_case)
+    _write(pa.Table.from_pandas(series[SERIES_SCHEMA.names], schema=SERIES_SCHEMA, preserve_index=False), series_path(ignore_case), signature)
+    _write(table, cube_path(ignore_case), signature)
+    return table
+
+
+def load_cube(categories=None, years=None, ignore_case: bool = True) -> pd.DataFrame:
+    """
+    キューブを DataFrame (category, year, character, posts, posters, views, median_views) として読み込む。
+    保存済みの表が元データより古い場合は作り直します。
+    """
+    path = cube_path(ignore_case)
+    table = pq.read_table(path) if path.exists() else None
+    if table is None or (table.schema.metadata or {}).get(b"signature") != source_signature(ignore_case).encode():
+        table = build_cube(ignore_case)
+    df = table.to_pandas()
+    if categories is not None:
+        df = df[df["category"].isin(list(categories))]
+    if years is not None:
+        df = df[df["year"].isin(list(years))]
+    return df.reset_index(drop=True)
+
+
+def load_series(categories=None, years=None, ignore_case: bool = True) -> pd.DataFrame:
+    """
+    キャラクター別月次系列を DataFrame (SERIES_SCHEMA の列) として読み込む。キューブと一緒に作り直します。
+    """
+    path = series_path(ignore_case)
+    table = pq.read_table(path) if path.exists() else None
+    if table is None or (table.schema.metadata or {}).get(b"signature") != source_signature(ignore_case).encode():
+        build_cube(ignore_case)
+        table = pq.read_table(path)
+    df = table.to_pandas()
+    if categories is not None:
+        df = df[df["category"].isin(list(categories))]
+    if years is not None:
+        df = df[df["year"].isin(list(years))]
+    return df.reset_index(drop=True)
+
+
+def main():
+    for ignore_case in (True, False):
+        t0 = time.perf_counter()
+        table = build_cube(ignore_case)
+        t1 = time.perf_counter()
+        load_cube(ignore_case=ignore_case)
+        t2 = time.perf_counter()
+        print(f"{cube_path(ignore_case)}: {table.num_rows:,} 行 (作成 {t1 - t0:.2f}秒, 読み込み {(t2 - t1) * 1000:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,31 @@
+import numpy as np
 import pandas as pd
 
+# VOCALOID関連を除外（歌唱系が混じるため）
+SOFTWARE_TALK_EXCLUDE = ["VOCALOID", "VOCAROID", "音楽", "歌うボイスロイド", "CeVIOカバー曲", "歌ってみた"]
+
+# 短い名前や一般的な単語と被りやすい名前は完全一致、それ以外は部分一致
+EXACT_MATCH_CHARS = ["RIA", "朱花", "青葉", "銀芽", "金苗", "ナツ", "シロ", "ナコ", "レコ"]
+
 def filter_software_talk(df: pd.DataFrame) -> pd.DataFrame:
     """
     ソフトウェアトークのデータから、歌唱系（VOCALOID等）の動画を除外するフィルタ。
     analyzer.py, character_analyzer.py 等で共通利用されます。
+    ストアから読み込んだ tag_ids 列がある場合は、語彙側で該当タグを求めて整数の照合で判定します。
     """
     if df is None or df.empty:
         return df
     
     before_count = len(df)
-    # VOCALOID関連を除外（歌唱系が混じるため）
-    filter_pattern = "VOCALOID|VOCAROID|音楽|歌うボイスロイド|CeVIOカバー曲|歌ってみた"
-    df = df[~df["tags"].astype(str).str.contains(filter_pattern, case=False, na=False)]
+    if "tag_ids" in df.columns:
+        from tag_index import load_vocabulary, rows_with_any, tag_csr
+
+        vocab = load_vocabulary()
+        excluded = np.unique(np.concatenate([vocab.find(p) for p in SOFTWARE_TALK_EXCLUDE]))
+        df = df[~rows_with_any(*tag_csr(df["tag_ids"]), excluded)]
+    else:
+        filter_pattern = "|".join(SOFTWARE_TALK_EXCLUDE)
+        df = df[~df["tags"].astype(str).str.contains(filter_pattern, case=False, na=False)]
     removed_count = before_count - len(df)
     
     if removed_count > 0:
@@ -19,6 +33,22 @@ def filter_software_talk(df: pd.DataFrame) -> pd.DataFrame:
     
     return df
 
+def add_year_rank(df: pd.DataFrame, column: str = "viewCounter", by: str | None = "year", name: str = "year_rank") -> pd.DataFrame:
+    """
+    by (既定は投稿年) ごとの column の降順の順位 (1始まり) を name 列として付ける。
+    全グループの順位を1回のソートで求めるため、「各年の上位N件」は df[df[name] <= N] のマスクで取り出せます。
+    同値の場合は行順に順位を付けます。by=None の場合は全体での順位です。
+    """
+    values = df[column].to_numpy(dtype=np.float64)
+    groups = df[by].to_numpy() if by is not None else np.zeros(len(df), dtype=np.int8)
+    # lexsort は安定なので、同じグループ・同じ値の行は元の行順に並ぶ
+    order = np.lexsort((-values, groups))
+    sorted_groups = groups[order]
+    starts = np.searchsorted(sorted_groups, sorted_groups, side="left")
+    rank = np.empty(len(df), dtype=np.int64)
+    rank[order] = np.arange(len(df)) - starts + 1
+    return df.assign(**{name: rank})
+
 def find_characters(tags, character_names):
     """
     動画のタグからキャラクターを抽出する共通ロジック。
@@ -40,9 +70,7 @@ def find_characters(tags, character_names):
     tag_list_lower = [t.lower() for t in tag_list]
         
     found = []
-    # 短い名前や一般的な単語と被りやすい名前は完全一致、それ以外は部分一致
-    exact_match_chars = ["RIA", "朱花", "青葉", "銀芽", "金苗", "ナツ", "シロ", "ナコ", "レコ"]
-    exact_match_chars_lower = [c.lower() for c in exact_match_chars]
+    exact_match_chars_lower = [c.lower() for c in EXACT_MATCH_CHARS]
     
     for name in character_names:
         name_lower = name.lower()
@@ -53,3 +81,31 @@ def find_characters(tags, character_names):
             if name_lower in tags_str_lower:
                 found.append(name)
     return found
+
+def find_character_rows(df: pd.DataFrame, character_names, ignore_case=True) -> pd.DataFrame:
+    """
+    find_characters の tag_ids 版。動画 × キャラクターの出現を
+    (row: df 内の行位置, character: キャラクター名) の縦持ちの表で返します。
+    文字列の照合は語彙 (ユニークなタグ) に対して一度だけ行います。
+    """
+    from tag_index import character_incidence, character_tag_ids, decode_tags, load_vocabulary, rows_with_any, tag_csr
+
+    vocab = load_vocabulary()
+    offsets, ids = tag_csr(df["tag_ids"])
+    char_tag_ids = character_tag_ids(vocab, character_names, EXACT_MATCH_CHARS, ignore_case)
+    rows, chars = character_incidence(offsets, ids, char_tag_ids)
+    result = pd.DataFrame({"row": rows, "character": np.asarray(character_names, dtype=object)[chars]})
+
+    # 空白を含む名前は隣り合うタグにまたがってしか一致しないため、候補行だけ文字列で照合する
+    extra = []
+    for name in character_names:
+        parts = name.split()
+        if len(parts) < 2:
+            continue
+        candidates = np.flatnonzero(rows_with_any(offsets, ids, vocab.find(parts[0], ignore_case=ignore_case)))
+        tags_str = pd.Series(decode_tags(df["tag_ids"].iloc[candidates], vocab).to_pandas())
+        hit = tags_str.str.contains(name, case=not ignore_case, regex=False).to_numpy()
+        extra.append(pd.DataFrame({"row": candidates[hit], "character": name}))
+    if extra:
+        result = pd.concat([result, *extra], ignore_index=True).sort_values("row", kind="stable", ignore_index=True)
+    return result
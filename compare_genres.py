@@ -3,6 +3,7 @@
 #   "matplotlib",
 #   "matplotlib-fontja",
 #   "pandas",
+#   "pyarrow",
 #   "seaborn",
 # ]
 # ///
@@ -14,7 +15,6 @@ Processing Overview:
 ボイロ界隈における各ジャンルの規模感や勢いの違いを可視化します。
 """
 
-import pickle
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib_fontja
@@ -22,20 +22,16 @@ import seaborn as sns
 from pathlib import Path
 
 from common_utils import filter_software_talk
+from video_store import category_mask, load_corpus
 
-def load_data(category):
-    pickle_path = Path(f"results/{category}.pickle")
-    if not pickle_path.exists():
-        print(f"Warning: {pickle_path} not found.")
+def load_data(corpus, category):
+    # 統合テーブルからカテゴリのビットが立っている行だけを取り出す
+    mask = category_mask(corpus["categories"], category)
+    if not mask.any():
+        print(f"Warning: {category} not found.")
         return None
     
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    
-    df = pd.json_normalize(recv["data"])
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df["year"] = df["startTime"].dt.year
-    df["viewCounter"] = df["viewCounter"].astype(int)
+    df = corpus[mask]
 
     # ソフトウェアトークの場合、VOCALOID関連を除外（歌唱系が混じるため）
     if category == "software_talk":
@@ -62,9 +58,11 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
     
     print("Loading data...")
+    # 全ジャンルの動画を重複なしで一度だけ読み込む
+    corpus = load_corpus(target_categories, columns=["contentId", "viewCounter", "year", "tag_ids"], start_time=False)
     data_frames = {}
     for cat in target_categories:
-        df = load_data(cat)
+        df = load_data(corpus, cat)
         if df is not None:
             data_frames[cat] = df
             print(f"Loaded {cat}: {len(df)} records")
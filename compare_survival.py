@@ -5,7 +5,6 @@ Processing Overview:
 ジャンルによって投稿者が定着しやすいか、短期間で離脱しやすいかの傾向を可視化します。
 """
 
-import pickle
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib_fontja
@@ -13,24 +12,25 @@ import seaborn as sns
 from pathlib import Path
 
 from common_utils import filter_software_talk
+from snapshot_diff import load_removed
+from video_store import category_mask, load_corpus
 
 # 日本語フォント設定
 matplotlib_fontja.japanize()
 
-def preprocess_data(category):
-    pickle_path = Path(f"results/{category}.pickle")
-    if not pickle_path.exists():
+def preprocess_data(corpus, category):
+    # 統合テーブルからカテゴリのビットが立っている行だけを取り出す
+    mask = category_mask(corpus["categories"], category)
+    if not mask.any():
         return None
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    df = pd.json_normalize(recv["data"])
+    df = corpus[mask]
+    # 削除・非公開で統合テーブルから消えた動画も投稿実績として数える
+    removed = load_removed(category, columns=list(df.columns.drop(["categories", "startTime"])))
+    if len(removed):
+        df = pd.concat([df, removed.drop(columns=["removedAt"])], ignore_index=True)
     
     if category == "software_talk":
         df = filter_software_talk(df)
-    
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df.fillna({"userId": 0}, inplace=True)
-    df["userId"] = df["userId"].astype("uint64")
     return df
 
 def calculate_continuation(df):
@@ -88,9 +88,11 @@ def main():
     continuation_results = {}
     survival_results = {}
     
+    # 全ジャンルの動画を重複なしで一度だけ読み込む
+    corpus = load_corpus(categories, columns=["userId", "startEpoch", "tag_ids"])
     for cat in categories:
         print(f"Analyzing {cat}...")
-        df = preprocess_data(cat)
+        df = preprocess_data(corpus, cat)
         if df is not None:
             continuation_results[labels[cat]] = calculate_continuation(df)
             survival_results[labels[cat]] = calculate_lifespan(df)
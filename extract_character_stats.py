@@ -4,10 +4,7 @@
 # ]
 # ///
 
-import pickle
-import pandas as pd
-from pathlib import Path
-from common_utils import filter_software_talk, find_characters
+from character_cube import load_cube
 
 def get_stats():
     target_characters = [
@@ -27,60 +24,30 @@ def get_stats():
         "fishing": "釣り",
     }
 
-    characters_df = pd.read_csv("characters.csv")
-    character_names = characters_df["キャラクター名"].tolist()
-
     results = {char: {"2025_views": 0, "2025_overall_rank": "-", "total_views": 0, "total_overall_rank": "-", "ranks": {}} for char in target_characters}
     
     # Store overall 2025 rankings to find who is 11th
     top_2025_global = None
 
+    # 集計済みのキューブ (カテゴリ × 年 × キャラクター) を一度だけ読み込む
+    cube = load_cube(categories)
+
     for cat in categories:
-        pickle_path = Path(f"results/{cat}.pickle")
-        if not pickle_path.exists():
-            continue
-            
-        with open(pickle_path, "rb") as f:
-            recv = pickle.load(f)
-        df = pd.json_normalize(recv["data"])
-        
-        if cat == "software_talk":
-            df = filter_software_talk(df)
-            
-        df["startTime"] = pd.to_datetime(df["startTime"])
-        df["year"] = df["startTime"].dt.year
-        df["viewCounter"] = df["viewCounter"].astype(int)
-        
         # Only up to 2025
-        df = df[df["year"] <= 2025]
-        
-        df["found_characters"] = df["tags"].apply(lambda x: find_characters(x, character_names))
-        
-        # Explode to get mapping
-        mapping_data = []
-        for _, row in df.iterrows():
-            for char in row["found_characters"]:
-                mapping_data.append({
-                    "character": char,
-                    "viewCounter": row["viewCounter"],
-                    "year": row["year"]
-                })
-        
-        if not mapping_data:
+        m_df = cube[(cube["category"] == cat) & (cube["year"] <= 2025)]
+        if m_df.empty:
             continue
-            
-        m_df = pd.DataFrame(mapping_data)
         
         # 2025年のデータのみで順位を計算
         m_df_2025 = m_df[m_df["year"] == 2025]
-        views_2025 = m_df_2025.groupby("character")["viewCounter"].sum().sort_values(ascending=False)
+        views_2025 = m_df_2025.groupby("character")["views"].sum().sort_values(ascending=False)
         rankings_2025 = views_2025.rank(ascending=False, method="min").astype(int)
         
         if cat == "software_talk":
             top_2025_global = views_2025
 
         # 通年（〜2025）の順位を計算
-        overall_views = m_df.groupby("character")["viewCounter"].sum().sort_values(ascending=False)
+        overall_views = m_df.groupby("character")["views"].sum().sort_values(ascending=False)
         overall_rankings = overall_views.rank(ascending=False, method="min").astype(int)
 
         # Specific stats for target characters
@@ -115,7 +82,7 @@ def get_stats():
     lines = [
         "# キャラクター別統計レポート (2025年ベース)",
         "",
-        "このレポートは、`software_talk.pickle` を含む各ジャンルのデータを元に、主要キャラクターの再生数と2025年のジャンル別順位をまとめたものです。",
+        "このレポートは、`software_talk` を含む各ジャンルのデータ (キャラクター別集計のキューブ)を元に、主要キャラクターの再生数と2025年のジャンル別順位をまとめたものです。",
         "",
         header,
         separator
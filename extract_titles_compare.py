@@ -1,39 +1,15 @@
-import pickle
-import pandas as pd
-import re
-import sys
-
-# Narrative and temporal indicators of series
-patterns = {
-    'part_style': r'(?i)part\s*(?:\d+|最終|完結|おまけ)',
-    'episode_style': r'(?i)(?:第[一二三四五六七八九十\d]+|最終)(?:話|回|章|節)',
-    'symbol_style': r'(?i)(?:#|No\.?|Vol\.?|vol\.?|v\.?)\s*(?:\d+|最終|last)\b',
-    'bracket_style': r'[【（\(\[［](?!20[12]\d|1080|720|4k|4K)\d{1,3}[】）\)\]］]',
-    'prefix_style': r'(?i)(?:第[一二三四五六七八九十\d]+[回 ]|其の[一二三四五六七八九十\d]+|その\d+(?:\.\d+)?|Phase\s*(?:\d+|last)|SS\.?\s*\d+)',
-    'bare_number_style': r'[\s\-]\d{1,3}$',
-    # Temporal progress indicators
-    'temporal_style': r'(?i)(?:\d+|最終)\s*日目|Day\s*(?:\d+|last)',
-    # Terms that strongly imply a series structure
-    'narrative_style': r'(?i)(?:最終回|プロローグ|エピローグ|オープニング|エンディング|OP邱ｨ|ED邱ｨ|前回|次回)'
-}
-
-def is_series(text):
-    if not isinstance(text, str): return False
-    for p in patterns.values():
-        if re.search(p, text): return True
-    return False
+# Narrative and temporal indicators of series (extended patterns in series_classifier)
+from series_classifier import EXTENDED_STYLES, has_style, series_flags
+from video_store import load_videos
 
 def get_top_titles(df, start_year, end_year, limit=100):
     subset = df[(df['year'] >= start_year) & (df['year'] <= end_year)]
     top = subset.sort_values('viewCounter', ascending=False).head(limit)
-    return top[['title', 'viewCounter', 'startTime']]
-
-with open('results/onboard.pickle', 'rb') as f:
-    data = pickle.load(f)
+    return top[['title', 'viewCounter', 'startTime', 'is_series']]
 
-df = pd.DataFrame(data['data'])
-df['startTime'] = pd.to_datetime(df['startTime'])
-df['year'] = df['startTime'].dt.year
+# 比較する2つの期間のパーティションだけを読み込む
+df = load_videos('onboard', columns=['key', 'title', 'viewCounter', 'startEpoch', 'year'], years=[*range(2015, 2019), *range(2022, 2026)])
+df['is_series'] = has_style(series_flags(df), EXTENDED_STYLES)
 
 # 2015-2018
 top_old = get_top_titles(df, 2015, 2018)
@@ -46,7 +22,7 @@ with open('results/top_titles_comparison.md', 'w', encoding='utf-8') as f:
         f.write("| 順位 | シリーズ判定 | 再生数 | タイトル |\n")
         f.write("|------|---------|------------|-------|\n")
         for i, (idx, row) in enumerate(title_df.iterrows(), 1):
-            series_mark = "✅" if is_series(row['title']) else "❌"
+            series_mark = "✅" if row['is_series'] else "❌"
             # Clean title for markdown table
             title = row['title'].replace('|', '｜')
             f.write(f"| {i} | {series_mark} | {row['viewCounter']:,} | {title} |\n")
@@ -4,42 +4,15 @@
 #   "tabulate",
 # ]
 # ///
-import pickle
 import pandas as pd
-from pathlib import Path
-from common_utils import filter_software_talk, find_characters
+from character_cube import load_cube
 
-def get_top_20_2025(category):
-    pickle_path = Path(f"results/{category}.pickle")
-    if not pickle_path.exists():
+def get_top_20_2025(cube, category):
+    m_df = cube[(cube["category"] == category) & (cube["year"] == 2025)]
+    if m_df.empty:
         return None
         
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    df = pd.json_normalize(recv["data"])
-    
-    if category == "software_talk":
-        df = filter_software_talk(df)
-        
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df["year"] = df["startTime"].dt.year
-    df_2025 = df[df["year"] == 2025]
-    
-    characters_df = pd.read_csv("characters.csv")
-    character_names = characters_df["キャラクター名"].tolist()
-    
-    df_2025["found_characters"] = df_2025["tags"].apply(lambda x: find_characters(x, character_names))
-    
-    mapping_data = []
-    for _, row in df_2025.iterrows():
-        for char in row["found_characters"]:
-            mapping_data.append({"character": char, "contentId": row["contentId"]})
-            
-    if not mapping_data:
-        return None
-        
-    m_df = pd.DataFrame(mapping_data)
-    counts = m_df.groupby("character")["contentId"].nunique().sort_values(ascending=False).head(30).reset_index()
+    counts = m_df.set_index("character")["posts"].sort_values(ascending=False).head(30).reset_index()
     counts.columns = ["キャラクター", "投稿数"]
     return counts
 
@@ -57,9 +30,11 @@ def main():
     }
     
     all_ranks = {}
+    # 集計済みのキューブから2025年の行だけを読み込む
+    cube = load_cube(categories, years=[2025])
     for cat in categories:
         print(f"Processing {cat} for 2025...")
-        top_20 = get_top_20_2025(cat)
+        top_20 = get_top_20_2025(cube, cat)
         if top_20 is not None:
             # Format as "Char (Count)"
             all_ranks[cat_names[cat]] = [f"{row['キャラクター']} ({row['投稿数']})" for _, row in top_20.iterrows()]
@@ -9,7 +9,6 @@
 # ]
 # ///
 
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -20,6 +19,8 @@ from pathlib import Path
 from PIL import Image
 import sys
 
+from rank_tensor import HISTORY_GENRES, character_rank_tensor, monthly_rank_frame
+
 # FFmpeg configuration
 plt.rcParams['animation.ffmpeg_path'] = r"C:\Users\estshorter\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.1-full_build\bin\ffmpeg.exe"
 
@@ -105,8 +106,7 @@ def find_icon(char_name, icon_dir):
             
     return None
 
-def create_animation(category, cat_label):
-    input_path = Path(f"results/history/cache/{category}_processed.csv")
+def create_animation(tensor, category, cat_label):
     icon_dir = Path("icons")
     output_dir = Path(f"results/history")
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -114,23 +114,19 @@ def create_animation(category, cat_label):
     debug_dir = output_dir / "debug_frames"
     debug_dir.mkdir(parents=True, exist_ok=True)
     
-    if not input_path.exists():
-        print(f"Error: Cache data not found at {input_path}.")
+    # 描く対象は順位テンソル (全ジャンルの年ごとの投稿数順位) から選ぶ (ソフトウェアトーク全体のジャンル名は overall)
+    genre = {c: g for g, c in HISTORY_GENRES.items()}[category]
+    if genre not in tensor.genres:
+        print(f"Error: No data for {category}.")
         return
 
     print(f"Loading data for {category}...")
-    df = pd.read_csv(input_path, encoding="utf-8-sig")
-    df = df[(df["year"] >= 2011) & (df["year"] <= 2025)]
-    
-    yearly_counts = df.groupby(["year", "character"])["contentId"].nunique().reset_index()
-    yearly_counts.columns = ["year", "character", "postCount"]
-    df_wide = yearly_counts.pivot(index="year", columns="character", values="postCount")
-    
-    df_rank = df_wide.rank(axis=1, ascending=False, method='min')
+    # 月ごとの直近12か月の投稿数順位 (年の間の動きも実データで描く)
+    df_rank = monthly_rank_frame(genre, "posts")
     df_rank[df_rank > 10] = 11
     
-    target_chars = df_rank.loc[2025][df_rank.loc[2025] <= 10].index.tolist()
-    ever_top10 = df_rank[df_rank <= 10].dropna(how='all', axis=1).columns.tolist()
+    target_chars = tensor.top(genre, "posts", 10, year=2025)
+    ever_top10 = df_rank.columns[(df_rank <= 10).any()].tolist()
     other_chars = [c for c in ever_top10 if c not in target_chars]
     
     char_icons = {}
@@ -152,9 +148,12 @@ def create_animation(category, cat_label):
             if char in target_chars:
                 print(f"  [MISS ] {char} (No icon found)")
 
+    # 月ごとの点の位置 (年 + (月 - 12) / 12。12月が年の目盛りに重なる。月の格子は欠けなし)
     years = sorted(df_rank.index.tolist())
-    steps_per_year = 40
-    frames_main = (len(years) - 1) * steps_per_year + 1
+    # 月の点の間を補間するフレーム数 (1年あたり 12 × 3 = 36 フレーム)
+    steps_per_month = 3
+    frames_main = (len(years) - 1) * steps_per_month + 1
+    year_ticks = list(range(int(np.ceil(years[0])), int(np.floor(years[-1])) + 1))
     hold_frames = 120 
     total_frames = frames_main + hold_frames
     
@@ -182,18 +181,18 @@ def create_animation(category, cat_label):
 
     def update(frame):
         ax.clear()
-        ax.set_xlim(2010.5, 2025.5)
+        ax.set_xlim(2010.0, 2025.5)
         ax.set_ylim(10.5, 0.5)
         ax.set_yticks(range(1, 11))
-        ax.set_xticks(years)
-        ax.set_xticklabels([str(y) for y in years])
+        ax.set_xticks(year_ticks)
+        ax.set_xticklabels([str(y) for y in year_ticks])
         
         effective_frame = min(frame, frames_main - 1)
-        year_idx = effective_frame // steps_per_year
-        alpha = (effective_frame % steps_per_year) / steps_per_year
-        current_year_val = years[year_idx] + alpha
+        year_idx = effective_frame // steps_per_month
+        alpha = (effective_frame % steps_per_month) / steps_per_month
+        current_year_val = years[year_idx] + alpha / 12
         
-        ax.set_title(f"{cat_label} キャラクター人気順位推移 (投稿数) ({int(years[year_idx])}年)", fontsize=28, pad=20)
+        ax.set_title(f"{cat_label} キャラクター人気順位推移 (投稿数) ({int(np.ceil(years[year_idx]))}年)", fontsize=28, pad=20)
         ax.set_xlabel("年", fontsize=18)
         ax.set_ylabel("順位 (1-10位)", fontsize=18)
         ax.grid(True, axis='both', linestyle='--', alpha=0.3)
@@ -279,8 +278,9 @@ def main():
         "onboard": "車載",
         "travel": "旅行"
     }
+    tensor = character_rank_tensor()
     for cat in categories:
-        create_animation(cat, cat_labels[cat])
+        create_animation(tensor, cat, cat_labels[cat])
 
 if __name__ == "__main__":
     main()
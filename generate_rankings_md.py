@@ -4,50 +4,17 @@
 #   "tabulate",
 # ]
 # ///
-import pickle
-import pandas as pd
-from pathlib import Path
-from common_utils import filter_software_talk, find_characters
+from character_cube import load_cube
 
-def get_top_20(category):
-    pickle_path = Path(f"results/{category}.pickle")
-    if not pickle_path.exists():
-        print(f"Warning: {pickle_path} not found.")
-        return None
-        
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    df = pd.json_normalize(recv["data"])
-    
-    if category == "software_talk":
-        df = filter_software_talk(df)
-        
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df["year"] = df["startTime"].dt.year
-    
+def get_top_20(cube, category):
     # 2025年12月31日までのデータに限定（必要に応じて）
-    df = df[df["year"] <= 2025]
-    
-    characters_df = pd.read_csv("characters.csv")
-    character_names = characters_df["キャラクター名"].tolist()
-    
-    df["found_characters"] = df["tags"].apply(lambda x: find_characters(x, character_names))
-    
-    # Explode to get character mapping
-    mapping_data = []
-    for _, row in df.iterrows():
-        for char in row["found_characters"]:
-            mapping_data.append({
-                "contentId": row["contentId"],
-                "character": char
-            })
-            
-    if not mapping_data:
+    m_df = cube[(cube["category"] == category) & (cube["year"] <= 2025)]
+    if m_df.empty:
+        print(f"Warning: {category} has no character data.")
         return None
         
-    m_df = pd.DataFrame(mapping_data)
-    # 投稿数（contentIdのユニーク数）
-    counts = m_df.groupby("character")["contentId"].nunique().sort_values(ascending=False).head(20).reset_index()
+    # 投稿数（ユニーク動画数。動画の投稿年は1つなので年ごとの投稿数の和）
+    counts = m_df.groupby("character")["posts"].sum().sort_values(ascending=False).head(20).reset_index()
     counts.columns = ["キャラクター", "投稿数"]
     return counts
 
@@ -64,10 +31,12 @@ def main():
     }
     
     output_lines = ["# キャラクター投稿数ランキング TOP 20", ""]
+    # 集計済みのキューブを一度だけ読み込む
+    cube = load_cube(categories)
     
     for cat in categories:
         print(f"Processing {cat}...")
-        top_20 = get_top_20(cat)
+        top_20 = get_top_20(cube, cat)
         if top_20 is not None:
             output_lines.append(f"## {cat_names[cat]}")
             output_lines.append("")
@@ -16,6 +16,8 @@ import matplotlib_fontja
 from pathlib import Path
 from PIL import Image
 
+from rank_tensor import character_rank_tensor
+
 def get_icon_color(icon_path):
     """アイコン画像からメインカラーを抽出する (白と濃いグレー#555555を除く)"""
     try:
@@ -38,28 +40,20 @@ def get_icon_color(icon_path):
     return None
 
 def create_thumbnail():
-    input_path = Path("results/history/cache/software_talk_processed.csv")
     icon_dir = Path("icons")
     output_dir = Path("results/history")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    if not input_path.exists():
-        print(f"Error: Cache data not found at {input_path}.")
-        return
-
     print("Loading and preparing data...")
-    df = pd.read_csv(input_path)
-    df = df[(df["year"] >= 2011) & (df["year"] <= 2025)]
-    
-    yearly_views = df.groupby(["year", "character"])["viewCounter"].sum().reset_index()
-    df_wide = yearly_views.pivot(index="year", columns="character", values="viewCounter")
-    df_rank = df_wide.rank(axis=1, ascending=False, method='min')
+    # 全体 (ソフトウェアトーク) の再生数順位は順位テンソルで求めてある
+    tensor = character_rank_tensor(["overall"])
+    df_rank = tensor.rank_frame("overall", "views")
     
     # 11位以下は非表示にするため NaN にする
     df_rank[df_rank > 10] = np.nan
     
     # 2025年のTOP10
-    target_chars = df_rank.loc[2025].dropna().index.tolist()
+    target_chars = tensor.top("overall", "views", 10, year=2025)
     
     print(f"Target characters (Top 10 in 2025): {len(target_chars)}")
     
@@ -1,48 +1,31 @@
-import pickle
-import pandas as pd
-import MeCab
-import unidic_lite
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
-import re
 import os
 
-def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
+from common_utils import add_year_rank
+from title_tokens import title_nouns
+from video_store import load_videos
+
+# Ignore very common generic words to highlight "projects"
+STOP_WORDS = ['車載', '動画', 'VOICEROID', '東北', '星あかり', 'ボイロ', '紲星']
 
-def get_tagger():
-    dic_path = unidic_lite.DICDIR
-    return MeCab.Tagger(f'-d "{dic_path}"')
+def load_data():
+    # 2015〜2025年 のパーティションだけを読み込む
+    df = load_videos('onboard', columns=['key', 'title', 'viewCounter', 'year'], start_time=False, years=range(2015, 2026))
+    # 年ごとの再生数順位を一度だけ求め、各年の上位1000件はマスクで取り出す
+    return add_year_rank(df)
 
-def extract_nouns(text, tagger):
-    nouns = []
-    text = re.sub(r'[【】［］（）()!！?？\[\]]', ' ', text)
-    node = tagger.parseToNode(text)
-    while node:
-        features = node.feature.split(',')
-        if features[0] == '名詞':
-            if len(node.surface) > 1 and not node.surface.isdigit():
-                # Ignore very common generic words to highlight "projects"
-                stop_words = ['車載', '動画', 'VOICEROID', '東北', '星あかり', 'ボイロ', '紲星']
-                if node.surface not in stop_words:
-                    nouns.append(node.surface)
-        node = node.next
-    return " ".join(nouns)
+def extract_nouns(df):
+    # 名詞はタイトルの解析キャッシュから取り出す (未解析のタイトルだけ MeCab にかける)
+    return [" ".join(nouns) for nouns in title_nouns(df, stop_words=STOP_WORDS)]
 
 def generate_wc(df, year_range, filename, title_label):
-    tagger = get_tagger()
     target_df = df[df['year'].isin(year_range)]
     # Use top 1000 by viewCounter for each year in the range
     texts = []
     for year in year_range:
-        year_top = target_df[target_df['year'] == year].sort_values('viewCounter', ascending=False).head(1000)
-        for title in year_top['title']:
-            texts.append(extract_nouns(title, tagger))
+        year_top = target_df[(target_df['year'] == year) & (target_df['year_rank'] <= 1000)].sort_values('year_rank')
+        texts.extend(extract_nouns(year_top))
     
     combined_text = " ".join(texts)
     
@@ -1,80 +1,119 @@
-import pickle
 import pandas as pd
-import MeCab
-import unidic_lite
 from wordcloud import WordCloud
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import re
+import hashlib
+import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
-def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
-
-def get_tagger():
-    dic_path = unidic_lite.DICDIR
-    return MeCab.Tagger(f'-d "{dic_path}"')
-
-def extract_nouns(text, tagger):
-    nouns = []
-    text = re.sub(r'[【】［］（）()!！?？\[\]]', ' ', text)
-    node = tagger.parseToNode(text)
-    while node:
-        features = node.feature.split(',')
-        if features[0] == '名詞':
-            if len(node.surface) > 1 and not node.surface.isdigit():
-                # Ignore very common generic words to highlight "projects"
-                stop_words = ['車載', '動画', 'VOICEROID', '東北', '星あかり', 'ボイロ', '紲星', 'ゆかり', 'あかり', 'マキ']
-                if node.surface not in stop_words:
-                    nouns.append(node.surface)
-        node = node.next
-    return " ".join(nouns)
+from common_utils import add_year_rank
+from title_tokens import noun_frequencies
+from video_store import category_mask, load_category_bits, load_corpus
+
+# Ignore very common generic words to highlight "projects"
+STOP_WORDS = ['車載', '動画', 'VOICEROID', '東北', '星あかり', 'ボイロ', '紲星', 'ゆかり', 'あかり', 'マキ']
+
+# Analyze from 2015 to 2025
+YEARS = range(2015, 2026)
+TOP_N = 1000
+
+OUTPUT_DIR = 'results/wordclouds'
+# 年ごとの頻度表のキャッシュ。頻度と描画設定が前回と同じで画像もある年は描画しない
+CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache')
+RENDER_WORKERS = os.cpu_count() or 1
+
+# Windows standard font
+FONT_PATH = "C:\\Windows\\Fonts\\msgothic.ttc"
+WC_SETTINGS = {
+    'width': 800,
+    'height': 400,
+    'background_color': 'white',
+    'font_path': FONT_PATH,
+    'colormap': 'plasma', # Different colormap for variety
+    'max_words': 80,
+}
+
+def load_data(categories):
+    # 2015〜2025年 のパーティションを全カテゴリ分まとめて1回だけ読み込む
+    corpus = load_corpus(categories, columns=['key', 'title', 'viewCounter', 'year'], start_time=False, years=YEARS)
+    frames = []
+    for category in categories:
+        df = corpus[category_mask(corpus['categories'], category)]
+        # 年ごとの再生数順位を一度だけ求め、各年の上位1000件はマスクで取り出す
+        df = add_year_rank(df)
+        frames.append(df[df['year_rank'] <= TOP_N].assign(category=category))
+    return pd.concat(frames, ignore_index=True)
+
+def _signature(freqs):
+    payload = json.dumps([WC_SETTINGS, sorted(freqs.items())], ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+def _is_unchanged(name, signature):
+    cache_path = os.path.join(CACHE_DIR, f'{name}.json')
+    if not os.path.exists(cache_path) or not os.path.exists(os.path.join(OUTPUT_DIR, f'{name}.png')):
+        return False
+    with open(cache_path, encoding='utf-8') as f:
+        return json.load(f).get('signature') == signature
+
+def _save_cache(name, freqs, signature):
+    with open(os.path.join(CACHE_DIR, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'frequencies': freqs}, f, ensure_ascii=False)
+
+def render_wordcloud(name, freqs, title):
+    # 単語の分割や数え上げは済んでいるので、頻度表から直接配置する
+    wc = WordCloud(**WC_SETTINGS).generate_from_frequencies(freqs)
+
+    plt.figure(figsize=(10, 5))
+    plt.imshow(wc, interpolation='bilinear')
+    plt.title(title, fontsize=20)
+    plt.axis('off')
+    plt.tight_layout()
+    plt.savefig(f'{OUTPUT_DIR}/{name}.png')
+    plt.close() # Close to free memory
+    return name
 
 def generate_wc_yearly(df):
-    tagger = get_tagger()
-    output_dir = 'results/wordclouds'
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Analyze from 2015 to 2025
-    years = sorted([y for y in df['year'].unique() if 2015 <= y <= 2025])
-    
-    # Windows standard font
-    font_path = "C:\\Windows\\Fonts\\msgothic.ttc"
-    
-    for year in tqdm(years, desc="Generating yearly wordclouds"):
-        year_top = df[df['year'] == year].sort_values('viewCounter', ascending=False).head(1000)
-        
-        texts = []
-        for title in year_top['title']:
-            texts.append(extract_nouns(title, tagger))
-        
-        combined_text = " ".join(texts)
-        if not combined_text.strip():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # カテゴリ・年ごとの名詞の頻度表をトークンのキャッシュから一度に集計する
+    names = df['category'] + '_wc_' + df['year'].astype(str)
+    frequencies = noun_frequencies(df, names.to_numpy(), stop_words=STOP_WORDS)
+    titles = {
+        f"{category}_wc_{year}": f"{category.replace('_', ' ').title()} Video Trends - {year}"
+        for category, year in df[['category', 'year']].drop_duplicates().itertuples(index=False)
+    }
+
+    jobs = []
+    for name, freqs in frequencies.items():
+        if not freqs:
+            continue
+        signature = _signature(freqs)
+        if _is_unchanged(name, signature):
             continue
-            
-        wc = WordCloud(
-            width=800, 
-            height=400, 
-            background_color='white', 
-            font_path=font_path,
-            colormap='plasma', # Different colormap for variety
-            max_words=80
-        ).generate(combined_text)
-        
-        plt.figure(figsize=(10, 5))
-        plt.imshow(wc, interpolation='bilinear')
-        plt.title(f"Onboard Video Trends - {year}", fontsize=20)
-        plt.axis('off')
-        plt.tight_layout()
-        plt.savefig(f'{output_dir}/onboard_wc_{year}.png')
-        plt.close() # Close to free memory
+        jobs.append((name, freqs, signature))
+    print(f"Rendering {len(jobs)} of {len(frequencies)} wordclouds (unchanged years are skipped)")
+
+    pending = {name: (freqs, signature) for name, freqs, signature in jobs}
+    if RENDER_WORKERS > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(min(RENDER_WORKERS, len(jobs))) as executor:
+            futures = [executor.submit(render_wordcloud, name, freqs, titles[name]) for name, freqs, _ in jobs]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Generating yearly wordclouds"):
+                name = future.result()
+                _save_cache(name, *pending[name])
+    else:
+        for name, freqs, signature in tqdm(jobs, desc="Generating yearly wordclouds"):
+            render_wordcloud(name, freqs, titles[name])
+            _save_cache(name, freqs, signature)
 
 if __name__ == "__main__":
-    df = load_data()
+    # 引数でカテゴリを指定 (all で登録済みの全カテゴリ、省略時は onboard)
+    categories = sys.argv[1:] or ['onboard']
+    if categories == ['all']:
+        categories = list(load_category_bits())
+    df = load_data(categories)
     generate_wc_yearly(df)
     print("\nYearly wordclouds saved to results/wordclouds/")
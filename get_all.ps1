@@ -1,7 +1 @@
-uv run getter.py travel &&
-uv run getter.py kitchen &&
-uv run getter.py onboard && 
-uv run getter.py explanation && 
-uv run getter.py theater && 
-uv run getter.py game && 
-uv run get_software_talk.py
+uv run getter.py travel kitchen onboard explanation theater game software_talk
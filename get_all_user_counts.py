@@ -1,27 +1,22 @@
-import pickle
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib_fontja
 from pathlib import Path
 from common_utils import filter_software_talk
+from video_store import category_mask, load_corpus
 
 # 日本語フォント設定
 matplotlib_fontja.japanize()
 
-def preprocess_data(category):
-    pickle_path = Path(f"results/{category}.pickle")
-    if not pickle_path.exists():
+def preprocess_data(corpus, category):
+    # 統合テーブルからカテゴリのビットが立っている行だけを取り出す
+    mask = category_mask(corpus["categories"], category)
+    if not mask.any():
         return None
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    df = pd.json_normalize(recv["data"])
+    df = corpus[mask]
     
     if category == "software_talk":
         df = filter_software_talk(df)
-    
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df.fillna({"userId": 0}, inplace=True)
-    df["userId"] = df["userId"].astype("uint64")
     return df
 
 def get_user_counts(df):
@@ -47,8 +42,10 @@ def main():
     print(f"{'ジャンル':<10} | {'全ユーザー':<8} | {'現役':<8} | {'引退':<8} | {'現役率':<5}")
     print("-" * 55)
 
+    # 全ジャンルの動画を重複なしで一度だけ読み込む
+    corpus = load_corpus(categories, columns=["userId", "startEpoch", "tag_ids"])
     for cat in categories:
-        df = preprocess_data(cat)
+        df = preprocess_data(corpus, cat)
         if df is not None:
             active, retired = get_user_counts(df)
             total = active + retired
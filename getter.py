@@ -1,60 +1,68 @@
 # /// script
 # dependencies = [
-#   "nicovideo-api-client",
+#   "orjson",
+#   "pandas",
+#   "pyarrow",
+#   "requests",
 # ]
 # ///
 
 import pickle
 import sys
+import time
 import tomllib
 from pathlib import Path
 
-from nicovideo_api_client.api.v2.snapshot_search_api_v2 import SnapshotSearchAPIV2
-from nicovideo_api_client.constants import FieldType
-
-LIMIT = 10 * 1000 * 1000
-TIMEOUT = 800.0 * 2
-
-def main(category, query):
-    # URL生成
-    request = (
-        SnapshotSearchAPIV2()
-        .tags_exact()
-        .single_query(query)
-        .field(
-            {
-                FieldType.CONTENT_ID,
-                FieldType.TITLE,
-                FieldType.USER_ID,
-                FieldType.VIEW_COUNTER,
-                FieldType.LENGTH_SECONDS,
-                FieldType.START_TIME,
-                FieldType.TAGS
-            }
-        )
-        .sort(FieldType.START_TIME, reverse=True)
-        .no_filter()
-        .limit(LIMIT)
-        .user_agent("NicoApiClient", "2.0.6")
-    )
+from snapshot_api import fetch_pipeline, fetch_snapshot_version, is_up_to_date, save_dataset_meta
+
+# 同時に取得するページ数 (APIへの負荷を考慮して控えめにする)
+NETWORK_WORKERS = 2
+# JSONデコード・列変換を行うスレッド数
+PARSER_WORKERS = 2
+
 
-    # https://api.search.nicovideo.jp/api/v2/snapshot/video/contents/search?targets=tagsExact&q=VOCALOID&fields=contentId%2Ctitle&_sort=-viewCounter
-    # print(request.build_url())
+def main(category, query, targets="tagsExact", snapshot_version=None, force=False):
+    if snapshot_version is None:
+        snapshot_version = fetch_snapshot_version()
 
-    # 実行
-    # API のレスポンスが表示される
-    recv = request.request(timeout=TIMEOUT)
+    if not force and is_up_to_date(category, snapshot_version, query, targets):
+        print(f"{category}: スナップショット ({snapshot_version}) から更新がないためスキップします")
+        return
 
+    # 実行 (ダウンロードと変換・ストアへの追記を並行して行う)
+    t0 = time.perf_counter()
+    data = fetch_pipeline(
+        category, query, targets,
+        network_workers=NETWORK_WORKERS, parser_workers=PARSER_WORKERS, snapshot_version=snapshot_version,
+    )
+    print(f"{category}: 取得・変換 {time.perf_counter() - t0:.1f}s")
+
+    # 未移行のスクリプト向けに従来形式の pickle も保存する
     Path("results").mkdir(exist_ok=True)
     with open(f"results/{category}.pickle", "wb") as f:
-        pickle.dump(recv.json(), f)
+        pickle.dump(data, f)
+
+    # 取得前に確認したバージョンを記録する (取得中に更新された場合は次回再取得される)
+    save_dataset_meta(category, snapshot_version, query, targets, data.get("meta", {}).get("totalCount"))
+    print(f"{category}: {len(data.get('data', []))} 件を保存しました (snapshot: {snapshot_version})")
 
 
 if __name__ == "__main__":
-    args = sys.argv
-    if len(args) == 2:
+    args = sys.argv[1:]
+    force = "--force" in args
+    categories = [a for a in args if a != "--force"]
+    if categories:
         with open("config.toml", "rb") as f:
             cfg = tomllib.load(f)
-        main(args[1], cfg[args[1]]["keywords"])
+        # バージョン確認は全カテゴリで1回だけ行う
+        version = fetch_snapshot_version()
+        for category in categories:
+            main(
+                category,
+                cfg[category]["keywords"],
+                cfg[category].get("targets", "tagsExact"),
+                snapshot_version=version,
+                force=force,
+            )
     else:
         print("コマンドライン引数が少なすぎます")
@@ -1,38 +1,38 @@
-import pickle
-import pandas as pd
+from common_utils import add_year_rank
+from series_index import attach_series
+from video_store import load_videos
 
-def load_data():
-    with open('results/onboard.pickle', 'rb') as f:
-        data = pickle.load(f)
-    df = pd.DataFrame(data['data'])
-    df['startTime'] = pd.to_datetime(df['startTime'])
-    df['year'] = df['startTime'].dt.year
-    return df
+def load_data(year=2025):
+    df = load_videos('onboard', columns=['key', 'title', 'userId', 'viewCounter', 'year'], start_time=False, years=[year])
+    df = attach_series(df, 'onboard')
+    return add_year_rank(df)
 
 def identify_top_3(df, year=2025):
-    print(f"--- Identifying Top 3 'Part' Posters in {year} ---")
+    print(f"--- Identifying Top 3 Series Posters in {year} ---")
     
     year_df = df[df['year'] == year]
     # Top 1000 by viewCounter
-    top_1000 = year_df.sort_values('viewCounter', ascending=False).head(1000)
+    top_1000 = year_df[year_df['year_rank'] <= 1000].sort_values('year_rank')
     
-    # Filter 'Part' videos
-    part_videos = top_1000[top_1000['title'].str.contains('part', case=False, na=False)].copy()
+    # Filter videos belonging to a series
+    series_videos = top_1000[top_1000['series_size'] >= 2].copy()
     
-    if part_videos.empty:
-        print("No 'Part' videos found in the top 1000.")
+    if series_videos.empty:
+        print("No series videos found in the top 1000.")
         return
 
     # Count by userId
-    user_counts = part_videos['userId'].value_counts()
+    user_counts = series_videos['userId'].value_counts()
     top_3_ids = user_counts.head(3).index.tolist()
     
     for i, user_id in enumerate(top_3_ids, 1):
         count = user_counts[user_id]
+        user_videos = series_videos[series_videos['userId'] == user_id]
         # Get sample titles for identification
-        sample_titles = part_videos[part_videos['userId'] == user_id]['title'].head(3).tolist()
+        sample_titles = user_videos['title'].head(3).tolist()
         print(f"\nRank {i}: User ID {user_id}")
         print(f"Video Count in Top 1000: {count}")
+        print(f"Series Count: {user_videos['series_id'].nunique()}")
         print(f"Sample Titles:")
         for title in sample_titles:
             print(f"  - {title}")
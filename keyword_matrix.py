@@ -0,0 +1,163 @@
+"""
+タイトルのキーワード出現行列。
+キーワードの一覧を1つの照合器 (キーワードのトライを正規表現にしたもの) にまとめ、全タイトルを連結した文字列を1回だけ走査して、
+タイトル × キーワードの出現回数を疎行列 (CSR: offsets, ids, counts) として求めます。
+年別・カテゴリ別の出現率や上位N件の集計は、この行列に対する行の絞り込みとグループ集計で行います。
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from tag_index import rows_with_any
+
+# タイトルの区切り (どのキーワードにも含まれない文字)
+_SEPARATOR = "\n"
+
+
+def _trie_pattern(keywords: list[str]) -> str:
+    """
+    キーワードのトライを、共通の接頭辞をまとめた正規表現にする。
+    各位置でトライを1回だけたどり、いずれかのキーワードで終わる最長の経路に一致します。
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for c in keyword:
+            node = node.setdefault(c, {})
+        node[""] = {}
+
+    def emit(node) -> str:
+        branches = []
+        for c, child in sorted(node.items()):
+            if not c:
+                continue
+            tail = emit(child) if len(child) > ("" in child) else ""
+            # キーワードの終わりの後は任意、途中の節点の後は必須
+            branches.append(re.escape(c) + (f"(?:{tail})?" if tail and "" in child else tail))
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return emit(trie)
+
+
+class KeywordMatrix:
+    """
+    タイトル × キーワードの出現回数の疎行列。
+    行 i のキーワードは ids[offsets[i]:offsets[i + 1]] (キーワード番号の昇順)、その出現回数は counts の同じ位置です。
+    """
+
+    def __init__(self, keywords: list[str], offsets: np.ndarray, ids: np.ndarray, counts: np.ndarray, index: pd.Index):
+        self.keywords = keywords
+        self.offsets = offsets
+        self.ids = ids
+        self.counts = counts
+        self.index = index
+        self._positions = {k: i for i, k in enumerate(keywords)}
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _rows(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))
+
+    def column(self, keyword: str) -> pd.Series:
+        """
+        キーワードの各タイトルでの出現回数。
+        """
+        hit = self.ids == self._positions[keyword]
+        values = np.zeros(len(self), dtype=np.int32)
+        values[self._rows()[hit]] = self.counts[hit]
+        return pd.Series(values, index=self.index, name=keyword)
+
+    def contains(self, *keywords: str) -> np.ndarray:
+        """
+        keywords のいずれかを含むタイトルの真偽値マスク。
+        """
+        return rows_with_any(self.offsets, self.ids, np.array([self._positions[k] for k in keywords], dtype=np.int32))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        密な出現回数の DataFrame (タイトル × キーワード)。
+        """
+        dense = np.zeros((len(self), len(self.keywords)), dtype=np.int32)
+        dense[self._rows(), self.ids] = self.counts
+        return pd.DataFrame(dense, index=self.index, columns=self.keywords)
+
+    def document_frequency(self, groups=None, mask=None, share: bool = False) -> pd.DataFrame:
+        """
+        キーワードを含むタイトル数をグループ (年・カテゴリなど、行と同じ長さの配列) ごとに数える。
+        mask で行を絞り込めます (上位N件など)。share=True の場合はグループの行数で割った出現率を返します。
+        """
+        n = len(self)
+        rows = self._rows()
+        keep = np.ones(n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        if groups is None:
+            codes, labels = np.zeros(n, dtype=np.int64), pd.Index(["all"])
+        else:
+            codes, labels = pd.factorize(np.asarray(groups), sort=True)
+            keep &= codes >= 0
+        entry = keep[rows]
+        table = np.bincount(
+            codes[rows[entry]] * len(self.keywords) + self.ids[entry], minlength=len(labels) * len(self.keywords)
+        ).reshape(len(labels), len(self.keywords))
+        result = pd.DataFrame(table, index=labels, columns=self.keywords)
+        if share:
+            sizes = np.bincount(codes[keep], minlength=len(labels))
+            result = result.div(np.maximum(sizes, 1), axis=0)
+        return result
+
+    def top(self, n: int = 20, mask=None) -> pd.Series:
+        """
+        含むタイトル数の多いキーワード上位 n 件。
+        """
+        return self.document_frequency(mask=mask).iloc[0].sort_values(ascending=False, kind="stable").head(n)
+
+
+def build_keyword_matrix(titles, keywords, ignore_case: bool = False) -> KeywordMatrix:
+    """
+    タイトルの列とキーワードの一覧から KeywordMatrix を作る。
+    重なりのある出現もすべて数えます (str.count ではなく、各開始位置での一致を数える)。
+    ignore_case=True の場合は大文字・小文字を区別しません。
+    """
+    titles = pd.Series(titles)
+    index = titles.index
+    keywords = list(dict.fromkeys(keywords))
+    fold = str.lower if ignore_case else (lambda s: s)
+    # 照合する文字列 -> キーワード番号 (ignore_case では大文字・小文字違いのキーワードが同じ文字列になる)
+    positions = {}
+    for i, keyword in enumerate(keywords):
+        positions.setdefault(fold(keyword), []).append(i)
+    texts = titles.astype(object).fillna("").astype(str).str.replace(_SEPARATOR, " ", regex=False).tolist()
+    n = len(texts)
+
+    matched_at, matched_ids = [], []
+    if n and positions:
+        pattern = re.compile(f"(?=({_trie_pattern(list(positions))}))", re.IGNORECASE if ignore_case else 0)
+        # 最長一致の文字列の接頭辞のうちキーワードであるもの (キーワードどうしの包含を数え漏らさない)
+        prefix_ids = {}
+        for match in pattern.finditer(_SEPARATOR.join(texts)):
+            text = fold(match.group(1))
+            ids = prefix_ids.get(text)
+            if ids is None:
+                ids = prefix_ids[text] = [i for j in range(1, len(text) + 1) for i in positions.get(text[:j], ())]
+            matched_at.extend([match.start()] * len(ids))
+            matched_ids.extend(ids)
+
+    starts = np.zeros(n, dtype=np.int64)
+    if n:
+        starts[1:] = np.cumsum(np.fromiter((len(t) + 1 for t in texts[:-1]), dtype=np.int64, count=n - 1))
+    rows = np.searchsorted(starts, np.array(matched_at, dtype=np.int64), side="right") - 1
+    ids = np.array(matched_ids, dtype=np.int32)
+    # (行, キーワード) ごとに出現回数をまとめる
+    pairs, counts = np.unique(rows * max(len(keywords), 1) + ids, return_counts=True)
+    pair_rows = pairs // max(len(keywords), 1)
+    offsets = np.zeros(n + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum(np.bincount(pair_rows, minlength=n))
+    return KeywordMatrix(
+        keywords,
+        offsets,
+        (pairs % max(len(keywords), 1)).astype(np.int32),
+        counts.astype(np.int32),
+        index,
+    )
@@ -0,0 +1,241 @@
+"""
+Processing Overview:
+投稿者数 (重複なしの userId の数) を近似する HyperLogLog のスケッチ。
+(カテゴリ, キャラクター, 投稿月) ごとのスケッチを保存しておき、任意の期間 (直近12か月など) や複数カテゴリの合算の投稿者数を、
+動画の行を読まずにスケッチの併合 (レジスタごとの最大値) だけで求めます。キャラクター名が空文字の行はカテゴリ全体です。
+スケッチは値の入っているレジスタだけを (レジスタ番号, 値) の行として持つ疎な形で保存します。
+公表する年ごとの数値など、正確な値が必要な場合は exact=True で動画の行から数え直せます。
+投稿者不明 (userId が 0) の動画は、キャラクター別集計のキューブ (character_cube.py) の posters と同じく0番の1人として数えます。
+
+使い方:
+    python poster_sketches.py
+    python poster_sketches.py --exact
+"""
+
+import hashlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from character_cube import CUBE_DIR, ROLLING_MONTHS, cube_categories, character_videos, load_characters, source_signature
+from common_utils import filter_software_talk
+from video_store import load_videos
+
+# スケッチの形式を変えた場合は上げる (次回読み込み時に作り直されます)
+SKETCH_VERSION = 2
+# レジスタ数は 2 ** PRECISION (標準誤差はおよそ 1.04 / sqrt(2 ** PRECISION) = 1.6%)
+PRECISION = 12
+# カテゴリ全体を表すキャラクター名
+ALL_CHARACTERS = ""
+
+SKETCH_SCHEMA = pa.schema(
+    [
+        ("category", pa.string()),
+        ("character", pa.string()),
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+        ("register", pa.uint16()),
+        ("rho", pa.uint8()),       # レジスタの値 (ハッシュの残りのビットの先頭の 0 の数 + 1 の最大値)
+    ]
+)
+
+
+def sketch_path(ignore_case: bool = True):
+    return CUBE_DIR / ("poster_sketches.parquet" if ignore_case else "poster_sketches_case_sensitive.parquet")
+
+
+def _signature(ignore_case: bool) -> str:
+    payload = f"{SKETCH_VERSION}|{PRECISION}|{source_signature(ignore_case)}"
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def _hash64(values: np.ndarray) -> np.ndarray:
+    # splitmix64 (userId を 64bit の一様なハッシュにする)
+    z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    x = values.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= np.uint64(1 << shift)
+        n += shift * high
+        x = np.where(high, x >> np.uint64(shift), x)
+    return n + (x > 0)
+
+
+def register_values(user_ids) -> tuple[np.ndarray, np.ndarray]:
+    """
+    userId の配列をレジスタ番号と値 (rho) の配列にする。
+    """
+    h = _hash64(np.asarray(user_ids))
+    registers = (h >> np.uint64(64 - PRECISION)).astype(np.int64)
+    rest = h & np.uint64((1 << (64 - PRECISION)) - 1)
+    rho = (64 - PRECISION) - _bit_length(rest) + 1
+    return registers, rho.astype(np.uint8)
+
+
+def sketch_rows(cells: np.ndarray, user_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    セル番号 (スケッチの単位) と userId の配列から、セルごとの疎なスケッチ (セル, レジスタ, 値) を求める。
+    """
+    registers, rho = register_values(user_ids)
+    order = np.lexsort((rho, registers, cells))
+    cells, registers, rho = cells[order], registers[order], rho[order]
+    # (セル, レジスタ) ごとの最大値 (並べ替え後の各グループの最後)
+    last = np.ones(len(cells), dtype=bool)
+    last[:-1] = (cells[1:] != cells[:-1]) | (registers[1:] != registers[:-1])
+    return cells[last], registers[last], rho[last]
+
+
+def poster_rows(category: str, character_names=None, ignore_case: bool = True) -> pd.DataFrame:
+    """
+    カテゴリの投稿者の行 (userId, year, month, character) を返す。character が ALL_CHARACTERS の行はカテゴリ全体の動画です。
+    software_talk は歌唱系の動画を除きます。投稿者不明の動画は userId 0 の1人の投稿者として含めます (キューブの posters と同じ)。
+    """
+    videos = load_videos(category, columns=["key", "userId", "year", "month", "tag_ids"], start_time=False)
+    if category == "software_talk":
+        videos = filter_software_talk(videos)
+    rows = character_videos(category, character_names, ignore_case, columns=("key", "userId", "year", "month"))
+    frame = pd.concat(
+        [videos[["userId", "year", "month"]].assign(character=ALL_CHARACTERS), rows[["userId", "year", "month", "character"]]],
+        ignore_index=True,
+    )
+    return frame
+
+
+def _category_sketch(category: str, character_names, ignore_case: bool) -> pd.DataFrame:
+    frame = poster_rows(category, character_names, ignore_case)
+    codes, labels = pd.factorize(frame["character"])
+    periods = frame["year"].to_numpy(dtype=np.int64) * 12 + frame["month"].to_numpy(dtype=np.int64) - 1
+    cells, registers, rho = sketch_rows(codes * (1 << 20) + periods, frame["userId"].to_numpy())
+    period = cells % (1 << 20)
+    return pd.DataFrame(
+        {
+            "category": category,
+            "character": np.asarray(labels, dtype=object)[cells >> 20],
+            "year": period // 12,
+            "month": period % 12 + 1,
+            "register": registers,
+            "rho": rho,
+        }
+    )
+
+
+def build_sketches(ignore_case: bool = True) -> pa.Table:
+    """
+    全カテゴリの (カテゴリ, キャラクター, 投稿月) ごとのスケッチを作り直して保存する。
+    """
+    character_names = load_characters()
+    frames = [_category_sketch(category, character_names, ignore_case) for category in cube_categories()]
+    sketches = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SKETCH_SCHEMA.names)
+    table = pa.Table.from_pandas(sketches[SKETCH_SCHEMA.names], schema=SKETCH_SCHEMA, preserve_index=False)
+    # 署名は読み込み (取り込みで元データが変わることがある) の後に求める
+    path = sketch_path(ignore_case)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    pq.write_table(table.replace_schema_metadata({"signature": _signature(ignore_case)}), tmp_path, compression="zstd")
+    tmp_path.replace(path)
+    return table
+
+
+def load_sketches(categories=None, characters=None, years=None, ignore_case: bool = True) -> pd.DataFrame:
+    """
+    保存済みのスケッチの行を読み込む (元データが更新されていれば作り直す)。
+    """
+    path = sketch_path(ignore_case)
+    schema = pq.read_schema(path) if path.exists() else None
+    if schema is None or (schema.metadata or {}).get(b"signature") != _signature(ignore_case).encode():
+        build_sketches(ignore_case)
+    filters = []
+    if categories is not None:
+        filters.append(("category", "in", list(categories)))
+    if characters is not None:
+        filters.append(("character", "in", list(characters)))
+    if years is not None:
+        filters.append(("year", "in", list(years)))
+    return pq.read_table(path, filters=filters or None).to_pandas()
+
+
+def estimate(registers: np.ndarray) -> np.ndarray:
+    """
+    密なレジスタの配列 (グループ × 2 ** PRECISION) から、グループごとの重複なしの数を推定する。
+    """
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    # 少ない場合は linear counting で補正する
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    raw[small] = m * np.log(m / zeros[small])
+    return raw
+
+
+def _exact_rows(categories, characters, years, ignore_case: bool) -> pd.DataFrame:
+    # スケッチと同じ行を動画から作り直す (年ごとの値はキューブの posters と一致します)
+    character_names = load_characters()
+    frame = pd.concat([poster_rows(c, character_names, ignore_case) for c in categories or cube_categories()], ignore_index=True)
+    if characters is not None:
+        frame = frame[frame["character"].isin(list(characters))]
+    if years is not None:
+        frame = frame[frame["year"].isin(list(years))]
+    return frame.reset_index(drop=True)
+
+
+def distinct_posters(categories=None, characters=None, years=None, by: str | None = "year", window: int | None = None, exact: bool = False, ignore_case: bool = True) -> pd.DataFrame:
+    """
+    キャラクター (ALL_CHARACTERS はカテゴリ全体) ごとの投稿者数を、指定したカテゴリを合算して (character, [year, [month,]] posters) の表で返す。
+    by="year" は年ごと、by="month" は月ごと、None は期間全体で集計します。
+    window を指定すると月ごとに直近 window か月 (その月を含む) の投稿者数を返します (期間の最初の window - 1 か月は窓が欠けます)。
+    exact=True の場合はスケッチを使わず動画の行から正確に数えます。
+    """
+    rows = _exact_rows(categories, characters, years, ignore_case) if exact else load_sketches(categories, characters, years, ignore_case)
+    period = rows["year"].to_numpy(dtype=np.int64) * 12 + rows["month"].to_numpy(dtype=np.int64) - 1
+    if window is not None:
+        # 各行を、その月から window - 1 か月後までを終わりとする窓すべてに入れる (データの最後の月より後の窓は作らない)
+        last = period.max() if len(period) else 0
+        rows = rows.loc[rows.index.repeat(window)].reset_index(drop=True)
+        period = (period[:, None] + np.arange(window)).ravel()
+        keep = period <= last
+        rows, period = rows[keep].reset_index(drop=True), period[keep]
+        by = "month"
+
+    keys = {"character": rows["character"].to_numpy(dtype=object)}
+    if by in ("year", "month"):
+        keys["year"] = period // 12
+    if by == "month":
+        keys["month"] = period % 12 + 1
+    index = pd.MultiIndex.from_arrays(list(keys.values()), names=list(keys))
+    if exact:
+        counts = pd.Series(rows["userId"].to_numpy(), index=index).groupby(level=list(keys)).nunique().astype(np.float64)
+    else:
+        codes, groups = index.factorize(sort=True)
+        dense = np.zeros((len(groups), 1 << PRECISION), dtype=np.uint8)
+        np.maximum.at(dense, (codes, rows["register"].to_numpy(dtype=np.int64)), rows["rho"].to_numpy())
+        counts = pd.Series(estimate(dense), index=pd.MultiIndex.from_tuples(groups, names=list(keys)) if len(groups) else index[:0])
+    return counts.rename("posters").reset_index()
+
+
+def main(args):
+    exact = "--exact" in args
+    # キャラクターごとの全カテゴリ合算の投稿者数 (年ごと。カテゴリのキューブでは足し合わせられない値)
+    t0 = time.perf_counter()
+    result = distinct_posters(by="year", exact=exact)
+    t1 = time.perf_counter()
+    table = result.pivot(index="character", columns="year", values="posters").fillna(0).round().astype(int)
+    print(table.sort_values(table.columns.max(), ascending=False).head(20).to_string())
+    # 全カテゴリの直近12か月の投稿者数
+    rolling = distinct_posters(characters=[ALL_CHARACTERS], window=ROLLING_MONTHS, exact=exact)
+    print(rolling.tail(12).round().to_string(index=False))
+    print(f"{'正確な値' if exact else 'スケッチ'}: {(t1 - t0) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,57 +1,95 @@
+"""
+Processing Overview:
+Remotion のイントロ動画 (remotion-intro) が読み込むランキングのデータを書き出します。
+キャラクター別集計のキューブ (character_cube.py) から直接、ジャンルごとの2025年の投稿数順位、
+年ごとの順位の推移、年の間を補間したフレームごとの表示順位を求めます (レポートの Markdown には依存しません)。
+フレームごとの順位は float32 の3次元配列 (ジャンル × フレーム × キャラクター) のバイナリで、
+コンポジションは fetch した ArrayBuffer を Float32Array として添字で引くだけで描画できます。
+
+使い方:
+    python prepare_remotion_data.py
+"""
+
 import json
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+from character_cube import load_cube
+
+# ジャンル名 -> キューブのカテゴリ (全体はソフトウェアトーク全体)
+GENRES = {
+    "overall": "software_talk",
+    "game": "game",
+    "theater": "theater",
+    "explanation": "explanation",
+    "kitchen": "kitchen",
+    "onboard": "onboard",
+    "travel": "travel",
+}
+RANK_YEAR = 2025
+HISTORY_YEARS = list(range(2011, RANK_YEAR + 1))
+TOP_N = 20
+# 動画に出すキャラクター (いずれかのジャンルで TOP10 に入ったキャラクター)
+CHART_TOP_N = 10
+# 圏外の順位 (全体は実際の順位、見つからない場合のみこの値)
+OVERALL_OUT_OF_RANK = 30
+GENRE_OUT_OF_RANK = TOP_N + 1
+# 年の推移のアニメーションで1年あたりに使うフレーム数
+FRAMES_PER_YEAR = 30
+
+OUT_DIR = Path("remotion-intro/src/data")
+FRAMES_PATH = Path("remotion-intro/public/data/rank_frames.bin")
+
+
+def genre_ranks(cube: pd.DataFrame) -> pd.DataFrame:
+    """
+    ジャンル・年ごとの投稿数順位 (genre, year, character, rank)。同数は表の順 (安定ソート) で順位を分けます。
+    """
+    genre_of = {category: genre for genre, category in GENRES.items()}
+    df = cube[cube["category"].isin(genre_of)].assign(genre=lambda d: d["category"].map(genre_of))
+    df = df.sort_values(["genre", "year", "posts"], ascending=[True, True, False], kind="stable")
+    df["rank"] = df.groupby(["genre", "year"]).cumcount() + 1
+    return df[["genre", "year", "character", "rank"]].reset_index(drop=True)
+
+
+def rank_history(ranks: pd.DataFrame, characters: list[str]) -> np.ndarray:
+    """
+    (ジャンル × 年 × キャラクター) の順位の配列。ランキングに出ない年は NaN です。
+    """
+    table = ranks[ranks["character"].isin(characters)].set_index(["genre", "year", "character"])["rank"]
+    index = pd.MultiIndex.from_product([list(GENRES), HISTORY_YEARS, characters])
+    return table.reindex(index).to_numpy(dtype=np.float64).reshape(len(GENRES), len(HISTORY_YEARS), len(characters))
+
+
+def interpolate_frames(history: np.ndarray, frames_per_year: int = FRAMES_PER_YEAR, out_of_rank: float = GENRE_OUT_OF_RANK) -> np.ndarray:
+    """
+    年ごとの順位の配列 (ジャンル × 年 × キャラクター) を、年の間を補間したフレームごとの表示順位にする。
+    圏外 (NaN や TOP_N より下) は out_of_rank に寄せ、年の切り替わりは緩急をつけて (smoothstep) 動かします。
+    """
+    ranks = np.where(np.isnan(history) | (history > TOP_N), out_of_rank, history)
+    n_years = ranks.shape[1]
+    t = np.arange((n_years - 1) * frames_per_year + 1) / frames_per_year
+    lower = np.minimum(t.astype(np.int64), n_years - 2) if n_years > 1 else np.zeros(len(t), dtype=np.int64)
+    upper = np.minimum(lower + 1, n_years - 1)
+    frac = t - lower
+    ease = (frac * frac * (3 - 2 * frac))[None, :, None]
+    return (ranks[:, lower] * (1 - ease) + ranks[:, upper] * ease).astype(np.float32)
+
+
 def generate_remotion_data():
     print("Extracting data for Remotion...")
-    
-    md_path = Path("results/top_20_2025_comparison.md")
-    
-    genres_data = {
-        "overall": [],
-        "game": [],
-        "theater": [],
-        "explanation": [],
-        "kitchen": [],
-        "onboard": [],
-        "travel": []
-    }
-    
-    if md_path.exists():
-        with open(md_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            
-        start_parsing = False
-        for line in lines:
-            if "|    1 |" in line or "| 1 |" in line:
-                start_parsing = True
-            if start_parsing and "|" in line:
-                parts = [p.strip() for p in line.split("|")]
-                if len(parts) >= 8:
-                    def extract_name(text):
-                        if not text: return ""
-                        return text.split("(")[0].strip()
-                    
-                    genres_data["overall"].append(extract_name(parts[2]))
-                    genres_data["game"].append(extract_name(parts[3]))
-                    genres_data["theater"].append(extract_name(parts[4]))
-                    genres_data["explanation"].append(extract_name(parts[5]))
-                    genres_data["kitchen"].append(extract_name(parts[6]))
-                    genres_data["onboard"].append(extract_name(parts[7]))
-                    genres_data["travel"].append(extract_name(parts[8]))
-                    
-                if "|   20 |" in line or "| 20 |" in line:
-                    break
-    else:
-        print(f"File not found: {md_path}")
+
+    cube = load_cube(GENRES.values())
+    if cube.empty:
+        print("No character data found.")
         return
+    ranks = genre_ranks(cube)
+    current = ranks[ranks["year"] == RANK_YEAR]
 
     # TOP10に1度でも登場した全キャラクターをリストアップ
-    top10_chars = set()
-    for genre, ranks_list in genres_data.items():
-        top10_chars.update(ranks_list[:10])
-    
-    if "" in top10_chars:
-        top10_chars.remove("")
+    top10_chars = list(dict.fromkeys(current.loc[current["rank"] <= CHART_TOP_N, "character"]))
 
     # 各キャラクターの色やアイコンの定義
     char_info_map = {
@@ -81,23 +119,23 @@ def generate_remotion_data():
         "ナースロボ_タイプt": {"id": "typet", "color": "#ffcb83", "icon": "ナースロボ_タイプt.png", "display_name": "ナースロボ_タイプT"}, # ホワイト
     }
 
-    # 順位データ構築
+    # 順位データ構築 (全体の順位の順に並べて出力を安定させる)
+    rank_table = current.set_index(["character", "genre"])["rank"]
+    top10_chars.sort(key=lambda c: rank_table.get((c, "overall"), OVERALL_OUT_OF_RANK))
+    history = rank_history(ranks, top10_chars)
     characters = []
-    for char_name in top10_chars:
-        ranks = {}
-        for genre in genres_data.keys():
-            if char_name in genres_data[genre]:
-                rank = genres_data[genre].index(char_name) + 1
+    for i, char_name in enumerate(top10_chars):
+        ranks_by_genre = {}
+        history_by_genre = {}
+        for g, genre in enumerate(GENRES):
+            rank = rank_table.get((char_name, genre))
+            if genre == "overall":
+                # 全体はランキング外でも実際の順位を使う
+                rank = OVERALL_OUT_OF_RANK if rank is None else int(rank)
             else:
-                # 圏外の個別対応
-                if genre == "overall":
-                    if char_name == "花隈千冬": rank = 23
-                    elif char_name == "もち子さん": rank = 28
-                    elif char_name == "ナースロボ_タイプt": rank = 32
-                    else: rank = 30 # デフォルト圏外
-                else:
-                    rank = 21 # ジャンル別圏外
-            ranks[genre] = rank
+                rank = GENRE_OUT_OF_RANK if rank is None or rank > TOP_N else int(rank)
+            ranks_by_genre[genre] = rank
+            history_by_genre[genre] = [None if np.isnan(r) else int(r) for r in history[g, :, i]]
             
         info = char_info_map.get(char_name, {"id": char_name, "color": "#888888", "icon": f"{char_name}.png"})
         
@@ -106,25 +144,34 @@ def generate_remotion_data():
             "name": info.get("display_name", char_name),
             "icon": f"/icons/{info['icon']}",
             "color": info["color"],
-            "ranks": ranks
+            "ranks": ranks_by_genre,
+            "history": history_by_genre,
         })
         
-    # Sort characters by overall rank to keep the output stable
-    characters.sort(key=lambda c: c["ranks"].get("overall", 100))
+    # フレームごとの表示順位 (ジャンル × フレーム × キャラクター、characters と同じ並び)
+    frames = interpolate_frames(history)
+    FRAMES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    frames.tofile(FRAMES_PATH)
 
     remotion_data = {
         "characters": characters,
-        "genres": list(genres_data.keys())
+        "genres": list(GENRES),
+        "years": HISTORY_YEARS,
+        "frames": {
+            "file": "data/" + FRAMES_PATH.name,
+            "dtype": "float32",
+            "shape": list(frames.shape),
+            "framesPerYear": FRAMES_PER_YEAR,
+        },
     }
     
-    out_dir = Path("remotion-intro/src/data")
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_file = out_dir / "ranks.json"
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_file = OUT_DIR / "ranks.json"
     
     with open(out_file, "w", encoding="utf-8") as f:
         json.dump(remotion_data, f, ensure_ascii=False, indent=2)
         
-    print(f"Data saved to {out_file}")
+    print(f"Data saved to {out_file} and {FRAMES_PATH}")
 
 if __name__ == "__main__":
     generate_remotion_data()
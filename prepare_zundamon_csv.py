@@ -4,42 +4,29 @@
 # ]
 # ///
 
-import pickle
 import pandas as pd
-from pathlib import Path
-from common_utils import filter_software_talk, find_characters
+from common_utils import filter_software_talk, find_character_rows
+from video_store import has_category, load_videos
 
 def prepare_csv():
     target_character = "ずんだもん"
     cat = "software_talk"
     
-    characters_df = pd.read_csv("characters.csv")
-    character_names = characters_df["キャラクター名"].tolist()
-
-    pickle_path = Path(f"results/{cat}.pickle")
-    if not pickle_path.exists():
-        print(f"Error: {pickle_path} not found.")
+    if not has_category(cat):
+        print(f"Error: {cat} のデータがありません")
         return
         
-    print(f"Loading {pickle_path}...")
-    with open(pickle_path, "rb") as f:
-        recv = pickle.load(f)
-    df = pd.json_normalize(recv["data"])
+    # 集計対象の 2020〜2025年 のパーティションだけを読み込む
+    print(f"Loading {cat}...")
+    df = load_videos(cat, columns=["viewCounter", "year", "tag_ids"], start_time=False, years=range(2020, 2026))
     
     df = filter_software_talk(df)
-        
-    df["startTime"] = pd.to_datetime(df["startTime"])
-    df["year"] = df["startTime"].dt.year
-    df["viewCounter"] = df["viewCounter"].astype(int)
-    
-    # Up to 2025
-    df = df[df["year"] <= 2025]
     
     print("Finding characters in tags...")
-    df["found_characters"] = df["tags"].apply(lambda x: find_characters(x, character_names))
+    found = find_character_rows(df, [target_character])
     
     # Filter for Zundamon
-    zundamon_df = df[df["found_characters"].apply(lambda chars: target_character in chars)]
+    zundamon_df = df.iloc[found["row"].to_numpy()]
     
     # Group by year
     yearly_stats = zundamon_df.groupby("year")["viewCounter"].sum().reset_index()
@@ -0,0 +1,192 @@
+"""
+Processing Overview:
+バンプチャート (順位推移図) 用の順位テンソル。
+(ジャンル, 指標, 年, 対象) の値をまとめて1つの配列にし、グループ化した rank(method="min") を1回だけ行って
+(ジャンル × 指標 × 年 × 対象) の順位の配列を作ります。対象はキャラクターやキャラクターのペアです。
+最新年の上位N件・過去に1位を取った対象・一度でも上位N件に入った対象の選択は、この配列に対する比較で求めます。
+バンプチャート (analyze_character_history.py, analyze_pairing_history.py)、順位推移のアニメーション、
+サムネイルはすべてこのテンソルから順位を引きます。
+アニメーションの年の間の動きには、キャラクター別月次系列 (直近12か月の値) の月ごとの順位 (monthly_rank_frame) を使います。
+
+使い方:
+    python rank_tensor.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from character_cube import character_videos, load_cube, load_series
+
+# 順位推移の対象期間
+HISTORY_YEARS = range(2011, 2026)
+# 指標 (値の大きい順に 1 位)
+RANK_METRICS = ["views", "posts", "posters"]
+# ジャンル名 -> キューブのカテゴリ (全体はソフトウェアトーク全体)
+HISTORY_GENRES = {
+    "overall": "software_talk",
+    "game": "game",
+    "onboard": "onboard",
+    "explanation": "explanation",
+    "kitchen": "kitchen",
+    "theater": "theater",
+    "travel": "travel",
+    "fishing": "fishing",
+}
+# 集計上のノイズとして除く (ジャンル, 年, キャラクター)。月次系列では character_cube.SERIES_NOISE_ROWS で除いています
+NOISE_ROWS = [("overall", 2013, "東北イタコ")]
+
+
+def _history_years(stats: pd.DataFrame) -> list[int]:
+    present = set(stats["year"].unique())
+    return [y for y in HISTORY_YEARS if y in present]
+
+
+class RankTensor:
+    """
+    values / ranks は (ジャンル × 指標 × 年 × 対象) の配列で、その年のデータがない箇所は NaN です。
+    """
+
+    def __init__(self, genres: list[str], metrics: list[str], years: list[int], entities: list[str], values: np.ndarray, ranks: np.ndarray):
+        self.genres = genres
+        self.metrics = metrics
+        self.years = years
+        self.entities = entities
+        self.values = values
+        self.ranks = ranks
+
+    def _slice(self, array: np.ndarray, genre: str, metric: str) -> np.ndarray:
+        return array[self.genres.index(genre), self.metrics.index(metric)]
+
+    def _present(self, genre: str, metric: str) -> np.ndarray:
+        # そのジャンルで一度でもデータがある対象
+        return ~np.isnan(self._slice(self.values, genre, metric)).all(axis=0)
+
+    def _frame(self, array: np.ndarray, genre: str, metric: str) -> pd.DataFrame:
+        present = self._present(genre, metric)
+        return pd.DataFrame(
+            self._slice(array, genre, metric)[:, present],
+            index=pd.Index(self.years, name="year"),
+            columns=pd.Index(np.asarray(self.entities, dtype=object)[present], name="character"),
+        )
+
+    def value_frame(self, genre: str, metric: str) -> pd.DataFrame:
+        """
+        年 × 対象 の値 (従来の pivot と同じ形。データのない対象の列は含めない)。
+        """
+        return self._frame(self.values, genre, metric)
+
+    def rank_frame(self, genre: str, metric: str) -> pd.DataFrame:
+        """
+        年 × 対象 の順位 (value_frame と同じ形)。
+        """
+        return self._frame(self.ranks, genre, metric)
+
+    def top(self, genre: str, metric: str, n: int, year: int | None = None) -> list[str]:
+        """
+        year (既定は最新年) の上位 n 件を順位の順に返す。
+        """
+        ranks = self._slice(self.ranks, genre, metric)[self.years.index(year if year is not None else self.years[-1])]
+        hit = np.flatnonzero(ranks <= n)
+        return [self.entities[i] for i in hit[np.argsort(ranks[hit], kind="stable")]]
+
+    def ever_top(self, genre: str, metric: str, n: int) -> list[str]:
+        """
+        いずれかの年で上位 n 件に入った対象 (n=1 で過去に1位を取った対象)。
+        """
+        hit = (self._slice(self.ranks, genre, metric) <= n).any(axis=0)
+        return [self.entities[i] for i in np.flatnonzero(hit)]
+
+    def bump_targets(self, genre: str, metric: str, top_n: int) -> list[str]:
+        """
+        バンプチャートに描く対象 (最新年の上位 top_n 件と、過去に1位を取った対象)。
+        """
+        leaders = self.ever_top(genre, metric, 1)
+        return list(dict.fromkeys([*self.top(genre, metric, top_n), *leaders]))
+
+
+def build_rank_tensor(stats: pd.DataFrame, metrics=RANK_METRICS, years=None) -> RankTensor:
+    """
+    (genre, year, entity, 指標の列) の表から順位テンソルを作る。
+    全ジャンル・全指標・全年の順位は、縦持ちにした表のグループ化した rank 1回で求めます。
+    years を省略した場合はデータのある年 (HISTORY_YEARS の範囲内) を使います。
+    """
+    metrics = list(metrics)
+    years = _history_years(stats) if years is None else list(years)
+    long = stats[stats["year"].isin(years)].melt(id_vars=["genre", "year", "entity"], value_vars=metrics, var_name="metric")
+    long = long.dropna(subset=["value"])
+    long["rank"] = long.groupby(["genre", "metric", "year"])["value"].rank(ascending=False, method="min")
+
+    genres = list(dict.fromkeys(stats["genre"]))
+    entities = sorted(long["entity"].unique())
+    g = pd.Index(genres).get_indexer(long["genre"])
+    m = pd.Index(metrics).get_indexer(long["metric"])
+    y = pd.Index(years).get_indexer(long["year"])
+    e = pd.Index(entities).get_indexer(long["entity"])
+    shape = (len(genres), len(metrics), len(years), len(entities))
+    values = np.full(shape, np.nan)
+    ranks = np.full(shape, np.nan)
+    values[g, m, y, e] = long["value"].to_numpy(dtype=np.float64)
+    ranks[g, m, y, e] = long["rank"].to_numpy(dtype=np.float64)
+    return RankTensor(genres, metrics, [int(v) for v in years], entities, values, ranks)
+
+
+def character_rank_tensor(genres=None) -> RankTensor:
+    """
+    キャラクター別集計のキューブ (キャラ名の大文字小文字を区別) から、キャラクターの順位テンソルを作る。
+    """
+    genres = {g: HISTORY_GENRES[g] for g in (genres or HISTORY_GENRES)}
+    cube = load_cube(genres.values(), ignore_case=False)
+    genre_of = {category: genre for genre, category in genres.items()}
+    stats = cube.assign(genre=cube["category"].map(genre_of)).rename(columns={"character": "entity"})
+    noise = pd.MultiIndex.from_tuples(NOISE_ROWS)
+    stats = stats[~pd.MultiIndex.from_frame(stats[["genre", "year", "entity"]]).isin(noise)]
+    return build_rank_tensor(stats)
+
+
+def monthly_rank_frame(genre: str, metric: str) -> pd.DataFrame:
+    """
+    月 × キャラクター の直近12か月の指標 (views / posts / posters) の順位 (各月の行で rank(method="min"))。
+    行の位置は窓の終わりの 年 + (月 - 12) / 12 で、12月の値 (その年の年間の値と同じ) が年の目盛りに重なります。
+    行は最初の月から最後の月まで欠けのない月の格子です (どのキャラクターも投稿のない月は全て NaN の行)。
+    ノイズの投稿 (NOISE_ROWS) は月次系列の作成時に直近12か月の累積から除かれています。
+    """
+    series = load_series([HISTORY_GENRES[genre]], years=HISTORY_YEARS, ignore_case=False)
+    period = series["year"].astype(np.int64) * 12 + series["month"].astype(np.int64) - 1
+    wide = series.assign(period=period).pivot(index="period", columns="character", values=f"{metric}_12m")
+    if len(wide):
+        wide = wide.reindex(range(wide.index.min(), wide.index.max() + 1))
+    ranks = wide.rank(axis=1, ascending=False, method="min")
+    # 年 * 12 + 月 - 1 -> 年 + (月 - 12) / 12
+    ranks.index = pd.Index((ranks.index.to_numpy(dtype=np.float64) - 11) / 12, name="position")
+    return ranks
+
+
+def pair_stats(category: str) -> pd.DataFrame:
+    """
+    2人以上のキャラクターが出る動画から、キャラクターのペア ("A & B") ごとの年別の再生数・投稿数を求める。
+    """
+    rows = character_videos(category, ignore_case=False, columns=("key", "viewCounter", "year"))
+    both = rows.merge(rows[["key", "character"]], on="key", suffixes=("", "_other"))
+    both = both[both["character"] < both["character_other"]]
+    pairs = both.assign(entity=both["character"] + " & " + both["character_other"])
+    stats = pairs.groupby(["year", "entity"]).agg(views=("viewCounter", "sum"), posts=("key", "nunique")).reset_index()
+    return stats
+
+
+def pair_rank_tensor(genres=("game",)) -> RankTensor:
+    """
+    キャラクターのペアの順位テンソル (指標は再生数と投稿数)。
+    """
+    stats = pd.concat([pair_stats(HISTORY_GENRES[g]).assign(genre=g) for g in genres], ignore_index=True)
+    return build_rank_tensor(stats, metrics=["views", "posts"])
+
+
+def main():
+    tensor = character_rank_tensor()
+    print(f"ジャンル {len(tensor.genres)} × 指標 {len(tensor.metrics)} × 年 {len(tensor.years)} × キャラクター {len(tensor.entities)}")
+    for genre in tensor.genres:
+        print(f"{genre}: {', '.join(tensor.top(genre, 'views', 5))}")
+
+
+if __name__ == "__main__":
+    main()
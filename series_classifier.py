@@ -0,0 +1,126 @@
+"""
+シリーズ物のタイトル判定。
+各スクリプトで少しずつ異なっていた連番表記のパターンを1か所にまとめ、
+全パターンを名前付きグループの1つの正規表現にコンパイルして、タイトル1件につき1回の照合で
+一致した表記の種類をビットマスク (uint32) として求めます。
+判定結果は動画キーとタイトルのハッシュごとにストアへ保存し、タイトルやパターンが変わった動画だけを判定し直します。
+"""
+
+import hashlib
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from title_tokens import title_hashes
+from video_store import STORE_DIR
+
+SERIES_PATH = STORE_DIR / "series_styles.parquet"
+
+_NUM = r"[一二三四五六七八九十\d]"
+
+# 表記の名前 -> 正規表現。ビット位置はこの並び順 (追加は末尾に、最大32個)
+STYLES = {
+    # analyze_strict_trends.py の厳密な判定
+    "part": r"(?i:part\s*\d+)",
+    "episode": rf"第{_NUM}+話|{_NUM}+話",
+    "symbol": r"#\d{1,3}\b|No\.\d{1,3}\b|vol\.\d{1,3}\b",
+    "bracket": r"[【（\(\[［](?!20[12]\d|1080|720|4k|4K)\d{1,3}[】）\)\]］]",
+    "prefix": rf"第{_NUM}+[回 ]|其の{_NUM}+|その\d+(?:\.\d+)?|Phase\s*\d+|SS\.\d+",
+    # 末尾の1〜3桁の数字 (空白かハイフンの後。2024 などの年は含めない)
+    "bare_number": r"[\s\-]\d{1,3}$",
+    # extract_titles_compare.py の拡張判定 (最終回・日目などの物語的・時間的な表記を含む)
+    "part_ext": r"(?i:part\s*(?:\d+|最終|完結|おまけ))",
+    "episode_ext": rf"(?i:(?:第{_NUM}+|最終)(?:話|回|章|節))",
+    "symbol_ext": r"(?i:(?:#|No\.?|Vol\.?|vol\.?|v\.?)\s*(?:\d+|最終|last)\b)",
+    "prefix_ext": rf"(?i:第{_NUM}+[回 ]|其の{_NUM}+|その\d+(?:\.\d+)?|Phase\s*(?:\d+|last)|SS\.?\s*\d+)",
+    "temporal": r"(?i:(?:\d+|最終)\s*日目|Day\s*(?:\d+|last))",
+    "narrative": r"(?i:最終回|プロローグ|エピローグ|オープニング|エンディング|OP邱ｨ|ED邱ｨ|前回|次回)",
+    # analyze_hidden_series.py / analyze_series_naming_trends.py の緩い判定 (大文字小文字を区別しない)
+    "part_loose": r"(?i:part)",
+    "episode_loose": r"(?i:\d+話|[一二三四五六七八九十]+話|第.+話)",
+    "symbol_loose": r"(?i:#\d+|No\.\d+|vol\.\d+)",
+    "bracket_loose": r"(?i:[【（\(\[［]\d+[】）\)\]］])",
+    "prefix_loose": r"(?i:第\d+[回 ]|其の[一二三四五六七八九十\d]+)",
+    "suffix_num_loose": r"(?i:\s\d{1,3}$)",
+}
+
+# スクリプトごとの「シリーズ物」とみなす表記の組
+STRICT_STYLES = ["part", "episode", "symbol", "bracket", "prefix", "bare_number"]
+EXTENDED_STYLES = ["part_ext", "episode_ext", "symbol_ext", "bracket", "prefix_ext", "bare_number", "temporal", "narrative"]
+LOOSE_STYLES = ["part_loose", "episode_loose", "symbol_loose", "bracket_loose", "prefix_loose", "suffix_num_loose"]
+
+# 各表記を「先頭から探す先読み」にして並べ、1回の照合で一致したすべての表記のグループを埋める
+_COMBINED = re.compile("".join(f"(?:(?=(?s:.*?)(?P<{name}>{pattern}))|)" for name, pattern in STYLES.items()))
+_lock = threading.Lock()
+
+
+def style_mask(names) -> np.uint32:
+    """
+    表記名のリストに対応するビットの和。
+    """
+    order = list(STYLES)
+    return np.uint32(sum(1 << order.index(name) for name in names))
+
+
+def has_style(flags, names) -> np.ndarray:
+    """
+    フラグ (series_flags の結果) が names のいずれかに一致する行の真偽値マスク。
+    """
+    return (np.asarray(flags, dtype=np.uint32) & style_mask(names)) != 0
+
+
+def classify_titles(titles) -> np.ndarray:
+    """
+    タイトルの列を1回走査して、一致した表記のビットマスク (uint32) を返す。
+    """
+    titles = pd.Series(titles, dtype=object).fillna("").astype(str)
+    matched = titles.str.extract(_COMBINED, expand=True).notna().to_numpy()
+    weights = np.left_shift(np.uint32(1), np.arange(len(STYLES), dtype=np.uint32))
+    return (matched.astype(np.uint32) * weights).sum(axis=1, dtype=np.uint32)
+
+
+def patterns_signature() -> str:
+    return hashlib.blake2b(repr(list(STYLES.items())).encode(), digest_size=8).hexdigest()
+
+
+def series_flags(df: pd.DataFrame) -> np.ndarray:
+    """
+    df (key, title 列が必要) の各行のフラグを行順で返す。
+    保存済みの判定結果を使い、新しい動画とタイトル・パターンが変わった動画だけを判定します。
+    """
+    keys = df["key"].to_numpy(dtype=np.int64)
+    titles = pd.Series(df["title"], dtype=object).fillna("").astype(str).to_numpy(dtype=object)
+    hashes = title_hashes(titles, patterns_signature())
+
+    with _lock:
+        store = pq.read_table(SERIES_PATH) if SERIES_PATH.exists() else None
+        flags = np.zeros(len(keys), dtype=np.uint32)
+        cached = np.zeros(len(keys), dtype=bool)
+        if store is not None and store.num_rows:
+            store_keys = store.column("key").to_numpy()
+            pos = np.minimum(np.searchsorted(store_keys, keys), store.num_rows - 1)
+            cached = (store_keys[pos] == keys) & (store.column("title_hash").to_numpy()[pos] == hashes)
+            flags[cached] = store.column("flags").to_numpy()[pos[cached]]
+        stale = ~cached
+        if not stale.any():
+            return flags
+        flags[stale] = classify_titles(titles[stale])
+
+        # 判定し直した行で置き換えて、キー順に保存する
+        fresh_keys, first = np.unique(keys[stale], return_index=True)
+        fresh = pa.table(
+            {"key": fresh_keys, "title_hash": hashes[stale][first], "flags": flags[stale][first]}
+        )
+        parts = [fresh]
+        if store is not None:
+            parts.insert(0, store.filter(pa.array(~np.isin(store.column("key").to_numpy(), fresh_keys))))
+        merged = pa.concat_tables(parts).sort_by("key")
+        SERIES_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = SERIES_PATH.with_suffix(".parquet.tmp")
+        pq.write_table(merged, tmp_path)
+        tmp_path.replace(SERIES_PATH)
+    return flags
@@ -0,0 +1,328 @@
+"""
+投稿者ごとのシリーズの再構成。
+タイトルから part・話・# などの話数表記を取り除いて正規化し、文字 3-gram の MinHash を LSH (バンドごとのバケット) にかけて、
+同じ投稿者の動画のうちタイトルが似ているものを同じシリーズにまとめます。
+候補の比較は同じ投稿者・同じバケットの中だけで行うため、動画数に対してほぼ線形の時間で動きます。
+結果 (動画キー -> シリーズID・話数) はカテゴリごとにストアへ保存し、動画やタイトルが変わった投稿者の分だけ作り直します。
+
+使い方:
+    python series_index.py software_talk
+"""
+
+import re
+import sys
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from title_tokens import title_hashes
+from video_store import STORE_DIR, load_videos
+
+SERIES_DIR = STORE_DIR / "series"
+# 正規化や MinHash の設定を変えた場合は上げる (全件が作り直されます)
+SERIES_VERSION = 1
+
+NGRAM = 3
+NUM_PERM = 32
+BANDS = 8
+# MinHash の一致率 (Jaccard 係数の推定値) がこれ以上なら同じシリーズとみなす
+SIMILARITY = 0.5
+# 最終投稿からこの日数以上続きが投稿されていないシリーズを「途絶」とみなす
+ABANDON_DAYS = 180
+# 一度に MinHash を計算するタイトル数
+CHUNK_SIZE = 100_000
+
+SERIES_SCHEMA = pa.schema(
+    [
+        ("key", pa.int64()),            # content_keys() と同じ動画キー
+        ("userId", pa.uint32()),
+        ("title_hash", pa.uint64()),    # タイトル + 設定のハッシュ
+        ("series_id", pa.int64()),      # シリーズ内で最小の動画キー
+        ("episode", pa.int32()),        # タイトルから取り出した話数 (なければ -1)
+    ]
+)
+
+_KANJI_DIGITS = {c: i for i, c in enumerate("〇一二三四五六七八九")}
+_NUM = r"\d+|[一二三四五六七八九十]+"
+# 話数表記 (NFKC・小文字化の後で照合する)。数字の部分を取り出して話数にします
+_EPISODE = re.compile(
+    rf"part\s*({_NUM})"
+    rf"|第\s*({_NUM})\s*[話回章]|({_NUM})\s*話"
+    rf"|(?:#|no\.|vol\.|ep\.?|その|其の)\s*({_NUM})"
+    r"|[【(\[]\s*(\d{1,3})\s*[】)\]]"
+    r"|[\s\-_](\d{1,3})$"
+)
+_DIGITS = re.compile(r"\d+")
+_SYMBOLS = re.compile(r"[\W_]+")
+# 最終話であることを示す表記 (これがあるシリーズは途絶とみなさない)
+_FINAL = re.compile(r"最終|完結|(?i:\bfinal\b)")
+
+# MinHash の順列 (multiply-shift ハッシュの係数)。保存データに影響するため固定の乱数列を使う
+_rng = np.random.default_rng(20240101)
+_PERM_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+_lock = threading.Lock()
+
+
+def _kanji_to_int(text: str) -> int:
+    if text.isdigit():
+        return int(text)
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return _KANJI_DIGITS.get(tens, 1) * 10 + _KANJI_DIGITS.get(ones, 0)
+    value = 0
+    for c in text:
+        value = value * 10 + _KANJI_DIGITS.get(c, 0)
+    return value
+
+
+def normalize_title(title: str) -> tuple[str, int]:
+    """
+    タイトルを (シリーズ名の部分, 話数) に分ける。
+    話数表記があればその前の部分 (なければ表記を除いた全体) から数字と記号を除いたものをシリーズ名とします。
+    """
+    text = unicodedata.normalize("NFKC", title).lower()
+    match = _EPISODE.search(text)
+    episode = -1
+    if match:
+        episode = _kanji_to_int(next(g for g in match.groups() if g is not None))
+        head = _SYMBOLS.sub("", _DIGITS.sub("", text[: match.start()]))
+        if len(head) >= NGRAM:
+            return head, episode
+        text = _EPISODE.sub(" ", text)
+    return _SYMBOLS.sub("", _DIGITS.sub("", text)), episode
+
+
+def minhash_signatures(stems) -> np.ndarray:
+    """
+    文字列ごとの文字 n-gram 集合の MinHash (n × NUM_PERM の uint32)。
+    n-gram は符号位置 (21bit) を並べた整数として一意に表すため、n-gram 自体の衝突はありません。
+    NGRAM 文字に満たない文字列は末尾を埋めて1つの n-gram にします。
+    """
+    stems = [s.ljust(NGRAM, "\0") for s in stems]
+    lengths = np.fromiter((len(s) for s in stems), dtype=np.int64, count=len(stems))
+    codes = np.frombuffer("".join(stems).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    counts = lengths - NGRAM + 1
+    ends = np.cumsum(lengths)
+    # 各文字列の n-gram の開始位置
+    pos = np.repeat(ends - lengths, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    grams = np.zeros(len(pos), dtype=np.uint64)
+    for i in range(NGRAM):
+        grams |= codes[pos + i] << np.uint64(21 * i)
+    starts = np.cumsum(counts) - counts
+
+    signatures = np.empty((len(stems), NUM_PERM), dtype=np.uint32)
+    for j in range(NUM_PERM):
+        hashed = ((grams * _PERM_A[j] + _PERM_B[j]) >> np.uint64(32)).astype(np.uint32)
+        signatures[:, j] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def _band_hashes(signatures: np.ndarray) -> np.ndarray:
+    rows = NUM_PERM // BANDS
+    bands = signatures.reshape(len(signatures), BANDS, rows).astype(np.uint64)
+    h = np.full(bands.shape[:2], np.uint64(0xCBF29CE484222325))
+    for r in range(rows):
+        h = (h ^ bands[:, :, r]) * np.uint64(0x100000001B3)
+    return h
+
+
+def _components(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    辺 (a[i], b[i]) でつながる連結成分のラベル (成分内で最小の番号)。
+    根どうしを小さい方へつなぎ、ポインタジャンプで経路を縮める操作を辺が閉じるまで繰り返します。
+    """
+    labels = np.arange(n)
+    while len(a):
+        la, lb = labels[a], labels[b]
+        pending = la != lb
+        if not pending.any():
+            break
+        a, b, la, lb = a[pending], b[pending], la[pending], lb[pending]
+        low = np.minimum(la, lb)
+        np.minimum.at(labels, la, low)
+        np.minimum.at(labels, lb, low)
+        while True:
+            jumped = labels[labels]
+            if (jumped == labels).all():
+                break
+            labels = jumped
+    return labels
+
+
+def cluster_series(keys: np.ndarray, titles, user_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    動画をシリーズに分け、行順に (シリーズID, 話数) を返す。
+    シリーズIDはシリーズ内で最小の動画キーです。投稿者不明 (userId == 0) の動画はそれぞれ単独のシリーズにします。
+    """
+    n = len(keys)
+    keys = np.asarray(keys, dtype=np.int64)
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    normalized = [normalize_title(t) for t in titles]
+    episodes = np.fromiter((e for _, e in normalized), dtype=np.int32, count=n)
+    if n == 0:
+        return keys.copy(), episodes
+
+    signatures = np.empty((n, NUM_PERM), dtype=np.uint32)
+    for start in range(0, n, CHUNK_SIZE):
+        signatures[start : start + CHUNK_SIZE] = minhash_signatures([s for s, _ in normalized[start : start + CHUNK_SIZE]])
+    bands = _band_hashes(signatures)
+
+    # バンドごとに (投稿者, バンドのハッシュ) が同じ動画をバケットの先頭の動画と比べる
+    known = np.flatnonzero(user_ids != 0)
+    pair_a, pair_b = [], []
+    for band in range(BANDS):
+        order = known[np.lexsort((bands[known, band], user_ids[known]))]
+        boundary = np.ones(len(order), dtype=bool)
+        boundary[1:] = (user_ids[order[1:]] != user_ids[order[:-1]]) | (bands[order[1:], band] != bands[order[:-1], band])
+        first = order[np.flatnonzero(boundary)[np.cumsum(boundary) - 1]]
+        candidate = first != order
+        a, b = first[candidate], order[candidate]
+        similar = (signatures[a] == signatures[b]).mean(axis=1) >= SIMILARITY
+        pair_a.append(a[similar])
+        pair_b.append(b[similar])
+    labels = _components(n, np.concatenate(pair_a), np.concatenate(pair_b))
+
+    series_ids = keys.copy()
+    np.minimum.at(series_ids, labels, keys)
+    return series_ids[labels], episodes
+
+
+def _signature() -> str:
+    return f"series-v{SERIES_VERSION}-{NGRAM}-{NUM_PERM}-{BANDS}-{SIMILARITY}"
+
+
+def series_path(category: str):
+    return SERIES_DIR / f"{category}.parquet"
+
+
+def build_series(category: str) -> pa.Table:
+    """
+    カテゴリのシリーズ表 (SERIES_SCHEMA, キー順) を作成・更新して返す。
+    保存済みの表と比べて、動画の追加・削除やタイトルの変更があった投稿者の動画だけをまとめ直します。
+    """
+    videos = load_videos(category, columns=["key", "title", "userId"], start_time=False)
+    videos = videos.sort_values("key", kind="stable").drop_duplicates("key")
+    keys = videos["key"].to_numpy(dtype=np.int64)
+    user_ids = videos["userId"].to_numpy(dtype=np.int64)
+    titles = videos["title"].astype(object).fillna("").astype(str).to_numpy(dtype=object)
+    hashes = title_hashes(titles, _signature())
+    path = series_path(category)
+
+    with _lock:
+        store = pq.read_table(path) if path.exists() else None
+        series_ids = np.zeros(len(keys), dtype=np.int64)
+        episodes = np.full(len(keys), -1, dtype=np.int32)
+        dirty = np.ones(len(keys), dtype=bool)
+        if store is not None and store.num_rows:
+            store_keys = store.column("key").to_numpy()
+            store_users = store.column("userId").to_numpy().astype(np.int64)
+            pos = np.minimum(np.searchsorted(store_keys, keys), store.num_rows - 1)
+            same = (
+                (store_keys[pos] == keys)
+                & (store.column("title_hash").to_numpy()[pos] == hashes)
+                & (store_users[pos] == user_ids)
+            )
+            # 変更のあった動画と、削除された動画の投稿者はまとめ直す
+            changed_users = np.union1d(user_ids[~same], store_users[~np.isin(store_keys, keys[same])])
+            dirty = np.isin(user_ids, changed_users)
+            series_ids[~dirty] = store.column("series_id").to_numpy()[pos[~dirty]]
+            episodes[~dirty] = store.column("episode").to_numpy()[pos[~dirty]]
+            if not dirty.any() and store.num_rows == len(keys):
+                return store
+        if dirty.any():
+            series_ids[dirty], episodes[dirty] = cluster_series(keys[dirty], titles[dirty], user_ids[dirty])
+
+        table = pa.table(
+            {"key": keys, "userId": user_ids.astype(np.uint32), "title_hash": hashes, "series_id": series_ids, "episode": episodes},
+            schema=SERIES_SCHEMA,
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        pq.write_table(table, tmp_path)
+        tmp_path.replace(path)
+    return table
+
+
+def load_series(category: str) -> pd.DataFrame:
+    """
+    動画キーごとのシリーズID・話数・シリーズの動画数 (series_size) を返す。
+    """
+    table = build_series(category)
+    df = table.select(["key", "series_id", "episode"]).to_pandas()
+    df["series_size"] = df.groupby("series_id")["key"].transform("size").astype(np.int32)
+    return df
+
+
+def attach_series(df: pd.DataFrame, category: str) -> pd.DataFrame:
+    """
+    df (key 列が必要) に series_id, episode, series_size 列を付けて返す。
+    """
+    series = load_series(category)
+    series_keys = series["key"].to_numpy()
+    keys = df["key"].to_numpy(dtype=np.int64)
+    pos = np.minimum(np.searchsorted(series_keys, keys), max(len(series_keys) - 1, 0))
+    if len(keys) and not (series_keys[pos] == keys).all():
+        raise KeyError(f"{category} のシリーズ表にない動画があります")
+    return df.assign(**{c: series[c].to_numpy()[pos] for c in ("series_id", "episode", "series_size")})
+
+
+def series_stats(category: str, min_videos: int = 2) -> pd.DataFrame:
+    """
+    シリーズごとの集計 (投稿者・動画数・再生数・動画の長さ・投稿期間・途絶したかどうか)。
+    途絶 (abandoned) は、カテゴリの最新の投稿より ABANDON_DAYS 日以上前に最後の動画が投稿され、
+    その最後の動画のタイトルに最終回・完結などの表記がないシリーズです。
+    """
+    videos = load_videos(category, columns=["key", "title", "userId", "viewCounter", "lengthSeconds", "startEpoch"], start_time=False)
+    videos = attach_series(videos.drop_duplicates("key"), category)
+    videos = videos[videos["series_size"] >= min_videos].sort_values(["series_id", "startEpoch"], kind="stable")
+
+    grouped = videos.groupby("series_id", sort=True)
+    stats = grouped.agg(
+        userId=("userId", "first"),
+        videos=("key", "size"),
+        total_views=("viewCounter", "sum"),
+        mean_views=("viewCounter", "mean"),
+        mean_length=("lengthSeconds", "mean"),
+        first_post=("startEpoch", "min"),
+        last_post=("startEpoch", "max"),
+        max_episode=("episode", "max"),
+        first_title=("title", "first"),
+        last_title=("title", "last"),
+    )
+    latest = videos["startEpoch"].max() if len(videos) else 0
+    inactive = stats["last_post"] < latest - ABANDON_DAYS * 86400
+    finished = stats["last_title"].astype(str).str.contains(_FINAL, na=False)
+    stats["abandoned"] = inactive & ~finished
+    return stats
+
+
+def abandonment_rate(stats: pd.DataFrame) -> pd.DataFrame:
+    """
+    シリーズの開始年 (JST) ごとの途絶率。
+    """
+    year = pd.to_datetime(stats["first_post"], unit="s", utc=True).dt.tz_convert("Asia/Tokyo").dt.year
+    return stats.groupby(year.rename("start_year")).agg(series=("abandoned", "size"), abandoned=("abandoned", "sum"), rate=("abandoned", "mean"))
+
+
+def main(category: str):
+    series = load_series(category)
+    in_series = series["series_size"] >= 2
+    print(f"{category}: {len(series)} 本, シリーズ {series.loc[in_series, 'series_id'].nunique()} 件 (シリーズ物の割合 {in_series.mean():.1%})")
+
+    stats = series_stats(category)
+    print("\n--- 再生数の多いシリーズ ---")
+    print(stats.sort_values("total_views", ascending=False).head(20)[["userId", "videos", "total_views", "max_episode", "first_title"]].to_string())
+    print("\n--- 開始年ごとの途絶率 ---")
+    print(abandonment_rate(stats).to_string())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        main(sys.argv[1])
+    else:
+        print("コマンドライン引数が少なすぎます")
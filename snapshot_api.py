@@ -0,0 +1,257 @@
+"""
+スナップショット検索API v2 まわりの共通処理。
+データセットごとに取得元スナップショットのバージョン (last_modified) を記録し、
+バージョンが変わっていないカテゴリの再取得をスキップするために使います。
+
+fetch_pipeline は投稿日時の区間ごとにページを並列ダウンロードし、
+別スレッドで JSON のデコード・型付き列への変換・ストアへの追記を行います。
+"""
+
+import datetime
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+import pyarrow.parquet as pq
+import requests
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+from tag_index import load_vocabulary
+from snapshot_diff import save_snapshot
+from value_sketches import update_value_sketches
+from view_history import record_snapshot
+from video_store import FIELDS, StoreWriter, merge_category, records_to_table, staging_path
+
+SNAPSHOT_VERSION_URL = "https://snapshot.search.nicovideo.jp/api/v2/snapshot/version"
+SNAPSHOT_SEARCH_URL = "https://snapshot.search.nicovideo.jp/api/v2/snapshot/video/contents/search"
+USER_AGENT = "nico-analyzer"
+
+RESULTS_DIR = Path("results")
+
+
+def fetch_snapshot_version(timeout: float = 10.0) -> str:
+    """
+    現在公開されているスナップショットの更新日時 (last_modified) を取得する。
+    レスポンスは数十バイトなので、毎回の取得前に呼んでも負荷はほぼありません。
+    """
+    r = requests.get(SNAPSHOT_VERSION_URL, headers={"User-Agent": USER_AGENT}, timeout=timeout)
+    r.raise_for_status()
+    return r.json()["last_modified"]
+
+
+def meta_path(category: str) -> Path:
+    return RESULTS_DIR / f"{category}.meta.json"
+
+
+def load_dataset_meta(category: str) -> dict | None:
+    path = meta_path(category)
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_dataset_meta(category: str, snapshot_version: str, query: str, targets: str, total_count: int | None = None):
+    """
+    取得したデータセットの由来 (スナップショットのバージョン・検索条件) を保存する。
+    """
+    RESULTS_DIR.mkdir(exist_ok=True)
+    meta = {
+        "category": category,
+        "snapshot_version": snapshot_version,
+        "query": query,
+        "targets": targets,
+        "total_count": total_count,
+        "fetched_at": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+    }
+    with open(meta_path(category), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def is_up_to_date(category: str, snapshot_version: str, query: str, targets: str) -> bool:
+    """
+    保存済みのデータが指定したスナップショット・検索条件のものであれば True。
+    検索条件 (config.toml の keywords) が変わった場合は再取得が必要とみなします。
+    """
+    if not (RESULTS_DIR / f"{category}.pickle").exists():
+        return False
+    meta = load_dataset_meta(category)
+    if meta is None:
+        return False
+    return (
+        meta.get("snapshot_version") == snapshot_version
+        and meta.get("query") == query
+        and meta.get("targets") == targets
+    )
+
+
+# APIの仕様上の上限 (_offset は最大100,000、_limit は最大100)
+MAX_OFFSET = 100_000
+PAGE_SIZE = 100
+# ニコニコ動画のサービス開始 (最初の区間の開始日時)
+FIRST_START_TIME = datetime.datetime(2007, 3, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=9)))
+MAX_RETRIES = 5
+
+
+def _month_windows(start: datetime.datetime, end: datetime.datetime):
+    """
+    [start, end) を月単位の区間に分割する。
+    """
+    cur = start
+    while cur < end:
+        nxt = (cur.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        yield cur, min(nxt, end)
+        cur = nxt
+
+
+def _search(session: requests.Session, query: str, targets: str, window, offset: int, limit: int) -> bytes:
+    """
+    1ページ分を取得し、デコードせずにレスポンス本文を返す。
+    メンテナンス中 (503) などの一時的なエラーは待ってからリトライします。
+    """
+    gte, lt = window
+    params = {
+        "q": query,
+        "targets": targets,
+        "fields": ",".join(FIELDS),
+        "_sort": "-startTime",
+        "_offset": offset,
+        "_limit": limit,
+        "_context": USER_AGENT,
+        "filters[startTime][gte]": gte.isoformat(),
+        "filters[startTime][lt]": lt.isoformat(),
+    }
+    for attempt in range(MAX_RETRIES):
+        try:
+            r = session.get(SNAPSHOT_SEARCH_URL, params=params, timeout=60)
+            if r.status_code == 200:
+                return r.content
+            if r.status_code not in (429, 500, 503):
+                r.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES - 1:
+                raise
+        time.sleep(2 ** attempt)
+    r.raise_for_status()
+    raise RuntimeError(f"検索APIの取得に失敗しました: {window} offset={offset}")
+
+
+def fetch_pipeline(category: str, query: str, targets: str = "tagsExact", network_workers: int = 2, parser_workers: int = 2, snapshot_version: str | None = None):
+    """
+    検索結果を全件取得して統合テーブル (results/store/videos.parquet) に反映し、
+    従来形式 ({"meta": ..., "data": [...]}) の辞書も返す。
+
+    ネットワークスレッドは生のページ (bytes) をキューに積むだけで、
+    JSON のデコードと列への変換・追記はパーサースレッドが並行して行うため、
+    全体の所要時間はおおよそ max(通信時間, 変換時間) になります。
+    """
+    vocab = load_vocabulary()
+    tasks = queue.Queue()
+    pages = queue.Queue(maxsize=network_workers * 8)
+    records = []
+    records_lock = threading.Lock()
+    errors = []
+
+    def network_worker():
+        session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+        while True:
+            task = tasks.get()
+            if task is None:
+                tasks.task_done()
+                return
+            kind, window = task[0], task[1]
+            try:
+                if not errors:
+                    if kind == "count":
+                        # 件数のみ取得し、ページ取得タスクに展開する
+                        meta = _json_loads(_search(session, query, targets, window, 0, 0))["meta"]
+                        total = meta["totalCount"]
+                        if total > MAX_OFFSET + PAGE_SIZE:
+                            # offset の上限を超える区間は半分に分割する
+                            gte, lt = window
+                            mid = gte + (lt - gte) / 2
+                            tasks.put(("count", (gte, mid)))
+                            tasks.put(("count", (mid, lt)))
+                        else:
+                            for offset in range(0, total, PAGE_SIZE):
+                                tasks.put(("page", window, offset))
+                    else:
+                        pages.put(_search(session, query, targets, window, task[2], PAGE_SIZE))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                tasks.task_done()
+
+    def parser_worker(writer: StoreWriter):
+        while True:
+            raw = pages.get()
+            if raw is None:
+                pages.task_done()
+                return
+            try:
+                data = _json_loads(raw)["data"]
+                if data:
+                    writer.append(records_to_table(data, vocab))
+                    with records_lock:
+                        records.extend(data)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                pages.task_done()
+
+    end = datetime.datetime.now(FIRST_START_TIME.tzinfo) + datetime.timedelta(days=1)
+    for window in _month_windows(FIRST_START_TIME, end):
+        tasks.put(("count", window))
+
+    with StoreWriter(staging_path(category)) as writer:
+        net_threads = [threading.Thread(target=network_worker, daemon=True) for _ in range(network_workers)]
+        parse_threads = [threading.Thread(target=parser_worker, args=(writer,), daemon=True) for _ in range(parser_workers)]
+        for t in net_threads + parse_threads:
+            t.start()
+
+        tasks.join()
+        for _ in net_threads:
+            tasks.put(None)
+        pages.join()
+        for _ in parse_threads:
+            pages.put(None)
+        for t in net_threads + parse_threads:
+            t.join()
+
+        if errors:
+            raise errors[0]
+
+        if writer.rows != len(records):
+            raise RuntimeError("ストアへの書き込み件数が一致しません")
+
+        # ストアが未知のタグIDを参照しないよう、置き換える前に語彙を保存する
+        vocab.save()
+
+    # 取得したカテゴリの全件で統合テーブルを更新する
+    table = pq.read_table(staging_path(category))
+    merge_category(category, table)
+    # 再生数・動画の長さの分布のスケッチに差分を反映する
+    sketched = update_value_sketches(category)
+    print(f"{category}: 分布のスケッチを {sketched:,} 件更新しました")
+    # 前回から再生数が変わった動画だけを時系列ストアに追記する
+    if snapshot_version is not None:
+        changed = record_snapshot(table, snapshot_version, category)
+        print(f"{category}: 再生数の変化 {changed:,} 件を記録しました")
+        # 前回のスナップショットと突き合わせ、消えた動画を消失ログに残す
+        diff = save_snapshot(category, table, snapshot_version)
+        if diff is not None:
+            print(f"{category}: 前回との差分 {diff.summary()}")
+    staging_path(category).unlink()
+
+    # 区間ごとに並列取得しているため、従来通り投稿日時の降順に並べ直す
+    records.sort(key=lambda r: r["startTime"], reverse=True)
+    return {"meta": {"status": 200, "totalCount": len(records)}, "data": records}
@@ -0,0 +1,281 @@
+"""
+Processing Overview:
+カテゴリの取得結果をスナップショットとして保存し、2つのスナップショットの差分
+(新規 / 消失 (削除・非公開) / タグの変更 / 再生数の増分) を求めます。
+スナップショットは動画キー順に並べて保存するため、突き合わせは辞書を作らずに
+ソート済み配列のマージ結合 (O(n)) で行えます。
+消失した動画は消失ログ (removed.parquet) に残し、投稿者の生存率などの解析で
+統合テーブルから消えた動画も活動として数えられるようにします。
+
+使い方:
+    python snapshot_diff.py software_talk
+    python snapshot_diff.py software_talk [古いスナップショット] [新しいスナップショット]
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from tag_index import load_vocabulary, tag_csr
+from video_store import RESULTS_DIR, SCHEMA, STORE_DIR, content_keys, table_to_frame
+from view_history import _to_epoch
+
+SNAPSHOTS_DIR = STORE_DIR / "snapshots"
+# カテゴリごとに残すスナップショットの数 (差分は取得のたびに消失ログへ反映するので直近数回分で足りる)
+KEEP_SNAPSHOTS = 3
+REMOVED_NAME = "removed.parquet"
+REMOVED_SCHEMA = SCHEMA.append(pa.field("removedAt", pa.int64()))
+
+
+def _sorted_by_key(table: pa.Table) -> tuple[pa.Table, np.ndarray]:
+    keys = content_keys(table)
+    if len(keys) and not (keys[1:] > keys[:-1]).all():
+        order = np.argsort(keys, kind="stable")
+        table, keys = table.take(order), keys[order]
+    return table, keys
+
+
+def list_snapshots(category: str) -> list[int]:
+    """
+    保存済みスナップショットの更新日時 (UNIX時刻) を古い順に返す。
+    """
+    directory = SNAPSHOTS_DIR / category
+    if not directory.exists():
+        return []
+    return sorted(int(p.stem) for p in directory.glob("*.parquet") if p.stem.isdigit())
+
+
+def read_snapshot(category: str, snapshot=None) -> pa.Table:
+    """
+    スナップショットを読み込む (キー順)。snapshot を省略した場合は最新のものです。
+    """
+    snapshots = list_snapshots(category)
+    if not snapshots:
+        raise FileNotFoundError(f"{category} のスナップショットがありません")
+    epoch = snapshots[-1] if snapshot is None else _to_epoch(snapshot)
+    return pq.read_table(SNAPSHOTS_DIR / category / f"{epoch}.parquet")
+
+
+def merge_join(old_keys: np.ndarray, new_keys: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    昇順・重複なしの2つのキー配列を突き合わせ、(共通の旧側の位置, 共通の新側の位置, 消失した旧側の位置, 新規の新側の位置) を返す。
+    連結した配列は昇順の2つの run からなるため、安定ソート (timsort) は run の併合1回の O(n) で済みます。
+    """
+    n_old = len(old_keys)
+    merged = np.concatenate([old_keys, new_keys])
+    order = np.argsort(merged, kind="stable")
+    merged = merged[order]
+    # 各側に重複はないので、等しい隣接ペアは必ず (旧, 新) の順に並ぶ
+    same = merged[1:] == merged[:-1]
+    old_idx = order[:-1][same]
+    new_idx = order[1:][same] - n_old
+    in_old = np.zeros(n_old, dtype=bool)
+    in_old[old_idx] = True
+    in_new = np.zeros(len(new_keys), dtype=bool)
+    in_new[new_idx] = True
+    return old_idx, new_idx, np.flatnonzero(~in_old), np.flatnonzero(~in_new)
+
+
+def _tag_changes(old_tags, new_tags) -> tuple[np.ndarray, pa.Array, pa.Array]:
+    """
+    対応する行同士のタグを比較し、(変化した行の位置, 追加されたタグID, 外されたタグID) を返す。
+    長さと並びが同じ行は要素ごとの比較だけで除外し、残った行だけを集合として比較します。
+    """
+    old_off, old_ids = tag_csr(old_tags)
+    new_off, new_ids = tag_csr(new_tags)
+    old_len, new_len = np.diff(old_off), np.diff(new_off)
+    n = len(old_len)
+
+    candidate = old_len != new_len
+    same_len = np.flatnonzero(~candidate)
+    if len(same_len):
+        # 長さが同じ行の要素を並べると両側の位置が揃うので、一度に比較できる
+        lengths = old_len[same_len]
+        rows = np.repeat(same_len, lengths)
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        differs = old_ids[old_off[rows] + within] != new_ids[new_off[rows] + within]
+        candidate[rows[differs]] = True
+
+    changed = np.flatnonzero(candidate)
+    width = np.int64(max(old_ids.max(initial=0), new_ids.max(initial=0)) + 1)
+
+    def codes(offsets, ids, lengths):
+        # (行の位置, タグID) を1つの int64 にまとめる
+        rows = np.repeat(changed, lengths[changed])
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(lengths[changed]) - lengths[changed], lengths[changed])
+        return rows * width + ids[offsets[rows] + within]
+
+    old_codes = codes(old_off, old_ids, old_len)
+    new_codes = codes(new_off, new_ids, new_len)
+    added = np.setdiff1d(new_codes, old_codes)
+    removed = np.setdiff1d(old_codes, new_codes)
+
+    def to_lists(pair_codes):
+        rows = pair_codes // width
+        offsets = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n), out=offsets[1:])
+        return pa.ListArray.from_arrays(pa.array(offsets), pa.array((pair_codes % width).astype(np.int32)))
+
+    # 並び替えだけの行は集合としては変わっていない
+    touched = np.zeros(n, dtype=bool)
+    touched[added // width] = True
+    touched[removed // width] = True
+    return np.flatnonzero(touched), to_lists(added), to_lists(removed)
+
+
+class SnapshotDiff:
+    """
+    2つのスナップショットの差分。
+      added    : 新しいスナップショットにだけある動画 (保存形式の Arrow Table)
+      removed  : 古いスナップショットにだけある動画 (削除・非公開など)
+      retagged : タグが変わった動画 (key, added_tag_ids, removed_tag_ids)
+      views    : 再生数が変わった動画 (key, before, after, delta)
+    """
+
+    def __init__(self, old: pa.Table, new: pa.Table):
+        old, old_keys = _sorted_by_key(old)
+        new, new_keys = _sorted_by_key(new)
+        old_idx, new_idx, removed_idx, added_idx = merge_join(old_keys, new_keys)
+        self.new = new
+        self.added = new.take(added_idx)
+        self.removed = old.take(removed_idx)
+
+        keys = new_keys[new_idx]
+        before = old.column("viewCounter").to_numpy(zero_copy_only=False)[old_idx].astype(np.int64)
+        after = new.column("viewCounter").to_numpy(zero_copy_only=False)[new_idx].astype(np.int64)
+        moved = before != after
+        self.views = pa.table({"key": keys[moved], "before": before[moved], "after": after[moved], "delta": (after - before)[moved]})
+
+        rows, tags_added, tags_removed = _tag_changes(old.column("tag_ids").take(old_idx), new.column("tag_ids").take(new_idx))
+        self.retagged = pa.table(
+            {"key": keys[rows], "added_tag_ids": tags_added.take(rows), "removed_tag_ids": tags_removed.take(rows)}
+        )
+
+    def summary(self) -> dict[str, int]:
+        return {
+            "added": self.added.num_rows,
+            "removed": self.removed.num_rows,
+            "retagged": self.retagged.num_rows,
+            "views_changed": self.views.num_rows,
+        }
+
+    def rising(self, n: int = 50) -> pd.DataFrame:
+        """
+        期間中の再生数の増分が大きい動画のランキング。
+        """
+        top = self.views.take(np.argsort(-self.views.column("delta").to_numpy(), kind="stable")[:n])
+        pos = np.searchsorted(content_keys(self.new), top.column("key").to_numpy())
+        videos = table_to_frame(self.new.take(pos), ["contentId", "title", "userId", "startEpoch"])
+        return pd.concat([videos, top.select(["before", "after", "delta"]).to_pandas()], axis=1)
+
+    def tag_changes(self, n: int = 20) -> pd.DataFrame:
+        """
+        タグの付け外しが多かったタグの一覧。
+        """
+        vocab = load_vocabulary().to_arrow()
+        counts = {}
+        for name in ("added_tag_ids", "removed_tag_ids"):
+            ids = self.retagged.column(name).combine_chunks().flatten().to_numpy(zero_copy_only=False)
+            counts[name.split("_")[0]] = pd.Series(ids).value_counts()
+        df = pd.DataFrame(counts).fillna(0).astype(np.int64)
+        df = df.loc[(df["added"] + df["removed"]).sort_values(ascending=False).index[:n]]
+        df.index = vocab.take(pa.array(df.index.to_numpy(dtype=np.int32))).to_pylist()
+        return df
+
+
+def diff_snapshots(category: str, old=None, new=None) -> SnapshotDiff:
+    """
+    保存済みの2つのスナップショットの差分。省略時は直近の2つを比較します。
+    """
+    snapshots = list_snapshots(category)
+    if new is None:
+        if len(snapshots) < 2:
+            raise FileNotFoundError(f"{category} の比較できるスナップショットが2つ以上ありません")
+        new = snapshots[-1]
+    if old is None:
+        old = max(s for s in snapshots if s < _to_epoch(new))
+    return SnapshotDiff(read_snapshot(category, old), read_snapshot(category, new))
+
+
+def save_snapshot(category: str, table: pa.Table, snapshot_version) -> SnapshotDiff | None:
+    """
+    取得結果をスナップショットとして保存し、前回のスナップショットとの差分を消失ログに反映する。
+    前回のスナップショットがない場合は None を返します。
+    """
+    epoch = _to_epoch(snapshot_version)
+    directory = SNAPSHOTS_DIR / category
+    directory.mkdir(parents=True, exist_ok=True)
+    table, _ = _sorted_by_key(table.select(SCHEMA.names).cast(SCHEMA))
+    tmp_path = directory / f".{epoch}.parquet.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    tmp_path.replace(directory / f"{epoch}.parquet")
+
+    snapshots = list_snapshots(category)
+    previous = [s for s in snapshots if s < epoch]
+    diff = SnapshotDiff(read_snapshot(category, previous[-1]), table) if previous else None
+    if diff is not None:
+        _update_removed(category, diff, epoch)
+    for s in snapshots[:-KEEP_SNAPSHOTS]:
+        (directory / f"{s}.parquet").unlink()
+    return diff
+
+
+def _update_removed(category: str, diff: SnapshotDiff, epoch: int):
+    path = SNAPSHOTS_DIR / category / REMOVED_NAME
+    removed = diff.removed.append_column("removedAt", pa.array(np.full(diff.removed.num_rows, epoch, dtype=np.int64)))
+    parts = [removed.cast(REMOVED_SCHEMA)]
+    if path.exists():
+        parts.insert(0, pq.read_table(path))
+    log = pa.concat_tables(parts)
+    # 同じスナップショットを取り直した場合などに重複する動画は、最初に消失を検出した行だけを残す
+    keys = content_keys(log)
+    order = np.lexsort((log.column("removedAt").to_numpy(), keys))
+    log, keys = log.take(order), keys[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    log, keys = log.filter(pa.array(first)), keys[first]
+    # 再公開されて戻ってきた動画はログから外す
+    restored = np.isin(keys, content_keys(diff.added))
+    log = log.filter(pa.array(~restored))
+    tmp_path = path.parent / f".{path.name}.tmp"
+    pq.write_table(log, tmp_path, compression="zstd")
+    tmp_path.replace(path)
+
+
+def load_removed(category: str, columns: list[str] | None = None, start_time: bool = True) -> pd.DataFrame:
+    """
+    統合テーブルから消えた (削除・非公開になった) 動画を load_videos と同じ形式で読み込む。
+    removedAt 列は消失を検出したスナップショットの更新日時 (UNIX時刻) です。
+    """
+    path = SNAPSHOTS_DIR / category / REMOVED_NAME
+    table = pq.read_table(path) if path.exists() else REMOVED_SCHEMA.empty_table()
+    if columns is not None:
+        columns = [*columns, "removedAt"]
+    return table_to_frame(table, columns, start_time)
+
+
+def main(category, old=None, new=None):
+    diff = diff_snapshots(category, old, new)
+    print(f"{category}: {diff.summary()}")
+    output_dir = RESULTS_DIR / "diff"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    removed = table_to_frame(diff.removed, ["contentId", "title", "userId", "viewCounter", "startEpoch"])
+    removed.to_csv(output_dir / f"{category}_removed.csv", index=False)
+    rising = diff.rising()
+    rising.to_csv(output_dir / f"{category}_rising.csv", index=False)
+
+    print("\n再生数の伸び Top 10")
+    print(rising.head(10)[["contentId", "title", "delta"]].to_string(index=False))
+    print("\nタグの付け外しが多いタグ")
+    print(diff.tag_changes().to_string())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(*sys.argv[1:4])
+    else:
+        print("コマンドライン引数が少なすぎます")
@@ -0,0 +1,206 @@
+"""
+タグの辞書エンコード。
+全カテゴリ共通のタグ語彙 (タグ文字列 <-> int32 のID) を持ち、各動画のタグは
+ID の可変長配列 (CSR: offsets + ids) としてストアに保存します。
+タグの包含判定・キャラクター抽出などは語彙側で一度だけ文字列照合を行い、
+動画単位では整数集合の演算だけで済むようにします。
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+VOCAB_PATH = Path("results") / "store" / "tag_vocab.parquet"
+
+
+class TagVocabulary:
+    """
+    タグ文字列と ID の対応表。ID は追加順に振られ、一度振った ID は変わりません。
+    フェッチ時は複数のパーサースレッドから encode されるためロックで保護します。
+    """
+
+    def __init__(self, tags=()):
+        self.tags = list(tags)
+        self.ids = {t: i for i, t in enumerate(self.tags)}
+        self._lock = threading.Lock()
+        self._saved_size = len(self.tags)
+        self._arrow = None
+
+    def __len__(self):
+        return len(self.tags)
+
+    def encode(self, tag_lists) -> tuple[np.ndarray, np.ndarray]:
+        """
+        タグのリスト (または空白区切りの文字列) の列を CSR (offsets, ids) に変換する。
+        未知のタグには新しい ID を割り当てます。
+        """
+        offsets = np.zeros(len(tag_lists) + 1, dtype=np.int32)
+        ids = []
+        with self._lock:
+            for i, tags in enumerate(tag_lists):
+                if isinstance(tags, str):
+                    tags = tags.split()
+                elif not tags:
+                    tags = ()
+                for t in tags:
+                    tid = self.ids.get(t)
+                    if tid is None:
+                        tid = self.ids[t] = len(self.tags)
+                        self.tags.append(t)
+                    ids.append(tid)
+                offsets[i + 1] = len(ids)
+        return offsets, np.asarray(ids, dtype=np.int32)
+
+    def to_arrow(self) -> pa.Array:
+        """
+        ID 順のタグ文字列 (Arrow 配列)。語彙が増えるまではキャッシュを使います。
+        """
+        if self._arrow is None or len(self._arrow) != len(self.tags):
+            self._arrow = pa.array(self.tags, type=pa.string())
+        return self._arrow
+
+    def find(self, pattern: str, exact: bool = False, ignore_case: bool = True) -> np.ndarray:
+        """
+        pattern に一致するタグの ID (昇順) を返す。
+        exact=False の場合はタグ文字列への部分一致です。
+        """
+        vocab = self.to_arrow()
+        if exact:
+            if ignore_case:
+                mask = pc.equal(pc.utf8_lower(vocab), pattern.lower())
+            else:
+                mask = pc.equal(vocab, pattern)
+        else:
+            mask = pc.match_substring(vocab, pattern, ignore_case=ignore_case)
+        return np.flatnonzero(mask.to_numpy(zero_copy_only=False)).astype(np.int32)
+
+    def save(self, path: Path = VOCAB_PATH):
+        if len(self.tags) == self._saved_size and path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        pq.write_table(pa.table({"tag": self.to_arrow()}), tmp_path)
+        tmp_path.replace(path)
+        self._saved_size = len(self.tags)
+
+
+_vocabulary = None
+
+
+def load_vocabulary(path: Path = VOCAB_PATH) -> TagVocabulary:
+    """
+    保存済みの語彙を読み込む (プロセス内で共有)。
+    """
+    global _vocabulary
+    if _vocabulary is None:
+        tags = pq.read_table(path).column("tag").to_pylist() if path.exists() else []
+        _vocabulary = TagVocabulary(tags)
+    return _vocabulary
+
+
+def tag_csr(tag_ids) -> tuple[np.ndarray, np.ndarray]:
+    """
+    DataFrame の tag_ids 列 (list<int32>) から CSR (offsets, ids) を取り出す。
+    行の絞り込み後でも offsets は 0 始まりに揃えて返します。
+    """
+    arr = tag_ids.array.__arrow_array__() if hasattr(tag_ids, "array") else tag_ids
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks() if arr.num_chunks else pa.array([], type=pa.list_(pa.int32()))
+    offsets = arr.offsets.to_numpy()
+    return (offsets - offsets[0]).astype(np.int32), arr.flatten().to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+
+
+def rows_with_any(offsets: np.ndarray, ids: np.ndarray, tag_ids: np.ndarray) -> np.ndarray:
+    """
+    tag_ids のいずれかを持つ行の真偽値マスクを返す。
+    """
+    n = len(offsets) - 1
+    hit = np.isin(ids, tag_ids)
+    mask = np.zeros(n, dtype=bool)
+    if hit.any():
+        rows = np.repeat(np.arange(n, dtype=np.int32), np.diff(offsets))
+        mask[rows[hit]] = True
+    return mask
+
+
+def decode_tags(tag_ids, vocab: TagVocabulary | None = None) -> pa.Array:
+    """
+    tag_ids 列を従来の空白区切りタグ文字列に戻す (未移行の処理向け)。
+    """
+    vocab = vocab or load_vocabulary()
+    offsets, ids = tag_csr(tag_ids)
+    names = pc.take(vocab.to_arrow(), pa.array(ids))
+    lists = pa.ListArray.from_arrays(pa.array(offsets), names)
+    return pc.binary_join(lists, " ")
+
+
+def character_tag_ids(vocab: TagVocabulary, character_names, exact_match_chars, ignore_case: bool = True) -> list[np.ndarray]:
+    """
+    各キャラクター名に該当するタグ ID の集合を語彙から求める。
+    exact_match_chars に含まれる名前はタグの完全一致、それ以外は部分一致です。
+    """
+    if ignore_case:
+        exact = {c.lower() for c in exact_match_chars}
+        return [vocab.find(name, exact=name.lower() in exact) for name in character_names]
+    exact = set(exact_match_chars)
+    return [vocab.find(name, exact=name in exact, ignore_case=False) for name in character_names]
+
+
+def character_incidence(offsets: np.ndarray, ids: np.ndarray, char_tag_ids: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    動画 × キャラクターの出現ペア (行番号, キャラクター番号) を行番号順に返す。
+    1動画に同じキャラクターのタグが複数あっても1件として数えます。
+    """
+    n_chars = len(char_tag_ids)
+    if n_chars == 0 or len(ids) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+
+    # (タグID, キャラクター番号) の対応をタグID順に並べる (1タグが複数キャラに該当する場合もある)
+    pair_tag = np.concatenate(char_tag_ids).astype(np.int32)
+    pair_char = np.concatenate([np.full(len(t), ci, dtype=np.int32) for ci, t in enumerate(char_tag_ids)])
+    order = np.argsort(pair_tag, kind="stable")
+    pair_tag, pair_char = pair_tag[order], pair_char[order]
+
+    rows_all = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+    hit = np.isin(ids, pair_tag)
+    hit_rows, hit_ids = rows_all[hit], ids[hit]
+    lo = np.searchsorted(pair_tag, hit_ids, side="left")
+    cnt = np.searchsorted(pair_tag, hit_ids, side="right") - lo
+    rows = np.repeat(hit_rows, cnt)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+    chars = pair_char[np.repeat(lo, cnt) + within]
+
+    # (行, キャラ) の重複を除く
+    key = np.unique(rows * n_chars + chars)
+    return key // n_chars, (key % n_chars).astype(np.int32)
+
+
+def memory_report(category: str):
+    """
+    タグ列のメモリ使用量を、空白区切り文字列 (従来) と CSR + 語彙 (現在) で比較する。
+    """
+    from video_store import read_category
+
+    table = read_category(category, ["tag_ids"])
+    vocab = load_vocabulary()
+    tag_ids = table.column("tag_ids")
+    as_strings = decode_tags(tag_ids, vocab)
+    # Python の str オブジェクトとして持っていた場合 (json_normalize 後の object 列) の概算
+    py_bytes = sum(sys.getsizeof(s) for s in as_strings.to_pylist()) + 8 * len(as_strings)
+    csr_bytes = tag_ids.nbytes
+    vocab_bytes = vocab.to_arrow().nbytes
+    n = max(table.num_rows, 1)
+    print(f"{category}: {table.num_rows:,} 動画, 語彙 {len(vocab):,} タグ")
+    print(f"  before (object str 列) : {py_bytes / 2**20:8.1f} MiB ({py_bytes / n:6.1f} B/動画)")
+    print(f"  before (Arrow 文字列)  : {as_strings.nbytes / 2**20:8.1f} MiB ({as_strings.nbytes / n:6.1f} B/動画)")
+    print(f"  after  (CSR int32)     : {csr_bytes / 2**20:8.1f} MiB ({csr_bytes / n:6.1f} B/動画) + 語彙 {vocab_bytes / 2**20:.1f} MiB (全カテゴリ共通)")
+
+
+if __name__ == "__main__":
+    for category in sys.argv[1:] or ["software_talk"]:
+        memory_report(category)
@@ -0,0 +1,221 @@
+"""
+Processing Overview:
+タグの組み合わせの頻出パターン (頻出アイテムセット) の抽出。
+カテゴリの動画を投稿年 (JST) ごとに分け、年ごとに別プロセスで、タグ ID の集合に対して Eclat (縦型の深さ優先探索) を行います。
+各タグを持つ動画の集合はビット列 (uint64) で持ち、候補の支持度は AND とビット数の数え上げでまとめて求めます。
+支持度・lift の条件を満たし、同じ支持度の上位集合を持たない (閉じた) 組み合わせのうち、
+既存のカテゴリのキーワードで拾えていないものを config.toml に貼り付けられるカテゴリ定義の候補として出力します。
+
+使い方:
+    python tag_itemsets.py software_talk
+    python tag_itemsets.py software_talk --years 2023-2025 --min-support 0.005 --min-lift 3
+"""
+
+import os
+import sys
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from common_utils import SOFTWARE_TALK_EXCLUDE
+from tag_index import load_vocabulary, rows_with_any, tag_csr
+from video_store import read_category
+
+MINING_WORKERS = os.cpu_count() or 1
+# 支持度の下限 (その年の動画数に対する割合)
+MIN_SUPPORT = 0.005
+# これより多くの動画に付くタグはカテゴリの定義そのもの (VOICEROID など) とみなして組み合わせに使わない
+MAX_ITEM_SUPPORT = 0.3
+# 組み合わせの lift (各タグが独立に付く場合に比べて何倍一緒に付くか) の下限
+MIN_LIFT = 2.0
+# 組み合わせるタグの最大数
+MAX_ITEMSET_SIZE = 3
+
+ITEMSET_COLUMNS = ["year", "items", "count", "support", "lift"]
+
+
+def _bitsets(offsets: np.ndarray, ids: np.ndarray, items: np.ndarray) -> np.ndarray:
+    """
+    items の各タグを持つ行のビット列 (len(items) × ワード数 の uint64)。
+    """
+    n = len(offsets) - 1
+    position = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int64)
+    position[items] = np.arange(len(items))
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets))
+    hit = position[ids] >= 0
+    dense = np.zeros((len(items), (n + 63) // 64 * 64), dtype=bool)
+    dense[position[ids[hit]], rows[hit]] = True
+    return np.packbits(dense, axis=1, bitorder="little").view(np.uint64)
+
+
+def mine_itemsets(offsets: np.ndarray, ids: np.ndarray, min_support: float = MIN_SUPPORT, max_item_support: float = MAX_ITEM_SUPPORT, max_size: int = MAX_ITEMSET_SIZE) -> list[tuple[tuple[int, ...], int]]:
+    """
+    タグの CSR (offsets, ids) から頻出アイテムセットを (タグ ID のタプル, 動画数) のリストで返す (1個のタグも含む)。
+    """
+    n = len(offsets) - 1
+    if n == 0 or len(ids) == 0:
+        return []
+    min_count = max(int(np.ceil(min_support * n)), 1)
+    counts = np.bincount(ids)
+    items = np.flatnonzero((counts >= min_count) & (counts <= max_item_support * n))
+    bits = _bitsets(offsets, ids, items)
+
+    results = []
+
+    def extend(prefix: tuple[int, ...], prefix_bits: np.ndarray | None, candidates: np.ndarray):
+        inter = bits[candidates] if prefix_bits is None else bits[candidates] & prefix_bits
+        support = np.bitwise_count(inter).sum(axis=1, dtype=np.int64)
+        frequent = np.flatnonzero(support >= min_count)
+        for k, j in enumerate(frequent):
+            itemset = (*prefix, int(items[candidates[j]]))
+            results.append((itemset, int(support[j])))
+            if len(itemset) < max_size and k + 1 < len(frequent):
+                extend(itemset, inter[j], candidates[frequent[k + 1:]])
+
+    extend((), None, np.arange(len(items)))
+    return results
+
+
+def _closed(itemsets: dict[tuple[int, ...], int]) -> set[tuple[int, ...]]:
+    # 同じ支持度の上位集合がある組み合わせ (上位集合で代表できる) を除く
+    covered = set()
+    for itemset, support in itemsets.items():
+        if len(itemset) < 2:
+            continue
+        for i in range(len(itemset)):
+            subset = itemset[:i] + itemset[i + 1:]
+            if itemsets.get(subset) == support:
+                covered.add(subset)
+    return set(itemsets) - covered
+
+
+def _mine_year(args) -> pd.DataFrame:
+    year, offsets, ids, min_support, max_item_support, max_size = args
+    n = len(offsets) - 1
+    itemsets = dict(mine_itemsets(offsets, ids, min_support, max_item_support, max_size))
+    rows = []
+    for itemset in _closed(itemsets):
+        if len(itemset) < 2:
+            continue
+        support = itemsets[itemset]
+        expected = np.prod([itemsets[(t,)] / n for t in itemset])
+        rows.append({"year": year, "items": itemset, "count": support, "support": support / n, "lift": support / n / expected})
+    return pd.DataFrame(rows, columns=ITEMSET_COLUMNS)
+
+
+def mine_by_year(category: str, years=None, min_support: float = MIN_SUPPORT, min_lift: float = MIN_LIFT, max_item_support: float = MAX_ITEM_SUPPORT, max_size: int = MAX_ITEMSET_SIZE, workers: int | None = None) -> pd.DataFrame:
+    """
+    カテゴリの動画を投稿年ごとに分けて、年ごとの閉じた頻出アイテムセット (2個以上のタグ) を求める。
+    年ごとの探索は別プロセスで並列に行います。software_talk は歌唱系の動画を除きます (common_utils.filter_software_talk と同じ条件)。
+    """
+    table = read_category(category, ["tag_ids", "year"], years)
+    if category == "software_talk":
+        vocab = load_vocabulary()
+        excluded = np.unique(np.concatenate([vocab.find(p) for p in SOFTWARE_TALK_EXCLUDE]))
+        table = table.filter(pa.array(~rows_with_any(*tag_csr(table.column("tag_ids")), excluded)))
+    all_years = table.column("year").to_numpy()
+    offsets, ids = tag_csr(table.column("tag_ids"))
+    tasks = []
+    for year in np.unique(all_years):
+        rows = np.flatnonzero(all_years == year)
+        lengths = np.diff(offsets)[rows]
+        year_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=year_offsets[1:])
+        year_ids = ids[np.repeat(offsets[rows], lengths) + np.arange(year_offsets[-1]) - np.repeat(year_offsets[:-1], lengths)]
+        tasks.append((int(year), year_offsets, year_ids, min_support, max_item_support, max_size))
+
+    workers = min(workers or MINING_WORKERS, max(len(tasks), 1))
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            frames = list(executor.map(_mine_year, tasks))
+    else:
+        frames = [_mine_year(task) for task in tasks]
+    result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ITEMSET_COLUMNS)
+    return result[result["lift"] >= min_lift].sort_values(["year", "support"], ascending=[True, False], kind="stable").reset_index(drop=True)
+
+
+def _configured_tags(cfg: dict) -> set[str]:
+    # 既存のカテゴリのキーワードに含まれるタグ (小文字化)
+    tags = set()
+    for section in cfg.values():
+        if isinstance(section, dict) and "keywords" in section:
+            tags.update(t.lower() for t in section["keywords"].replace("(", " ").replace(")", " ").split() if t not in ("OR", "AND", "NOT"))
+    return tags
+
+
+def candidate_categories(itemsets: pd.DataFrame, cfg: dict, top: int = 10) -> pd.DataFrame:
+    """
+    年ごとのアイテムセットから、既存のカテゴリで拾えていないタグの組み合わせを新しいカテゴリの候補として選ぶ。
+    最新の年に現れる組み合わせを、対象期間で現れた年数・平均支持度の大きい順に並べます。
+    """
+    vocab = load_vocabulary()
+    configured = _configured_tags(cfg)
+    latest = itemsets["year"].max()
+    summary = itemsets.groupby("items").agg(
+        years=("year", "nunique"), last_year=("year", "max"), count=("count", "sum"), support=("support", "mean"), lift=("lift", "mean")
+    )
+    summary = summary[summary["last_year"] == latest]
+    summary["tags"] = [[vocab.tags[t] for t in items] for items in summary.index]
+    summary = summary[[not any(t.lower() in configured for t in tags) for tags in summary["tags"]]]
+    return summary.sort_values(["years", "support"], ascending=False, kind="stable").head(top).reset_index(drop=True)
+
+
+def _toml_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def to_toml(candidates: pd.DataFrame, prefix: str = "candidate") -> str:
+    """
+    候補を config.toml のカテゴリ定義の書式にする (keywords の空白区切りは AND)。
+    """
+    sections = []
+    for i, row in enumerate(candidates.itertuples(index=False), 1):
+        sections.append(
+            "\n".join(
+                [
+                    f"# {row.years} 年で頻出 / 平均支持度 {row.support:.2%} / lift {row.lift:.1f}",
+                    f"[{prefix}_{i:02d}]",
+                    f"title = {_toml_string('ニコニコ ' + ' '.join(row.tags) + ' 動画 年次統計')}",
+                    f"keywords = {_toml_string(' '.join(row.tags))}",
+                    "dist_ylim = [0, 20000]",
+                ]
+            )
+        )
+    return "\n\n".join(sections) + "\n"
+
+
+def _parse_years(text: str):
+    start, _, end = text.partition("-")
+    return range(int(start), int(end or start) + 1)
+
+
+def main(args):
+    category = args[0]
+    years = _parse_years(args[args.index("--years") + 1]) if "--years" in args else None
+    min_support = float(args[args.index("--min-support") + 1]) if "--min-support" in args else MIN_SUPPORT
+    min_lift = float(args[args.index("--min-lift") + 1]) if "--min-lift" in args else MIN_LIFT
+
+    itemsets = mine_by_year(category, years, min_support, min_lift)
+    print(f"{category}: {len(itemsets):,} 件の組み合わせ (支持度 {min_support:.2%} 以上, lift {min_lift} 以上)")
+    if itemsets.empty:
+        return
+    with open("config.toml", "rb") as f:
+        cfg = tomllib.load(f)
+    candidates = candidate_categories(itemsets, cfg)
+    text = to_toml(candidates)
+    out_path = f"results/{category}_tag_candidates.toml"
+    os.makedirs("results", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(text)
+    print(f"{out_path} に保存しました")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(sys.argv[1:])
+    else:
+        print("コマンドライン引数が少なすぎます")
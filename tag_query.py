@@ -0,0 +1,188 @@
+"""
+Processing Overview:
+保存済みのコーパスに対するタグの転置インデックス (タグID -> 動画の行番号の昇順リスト) と、
+config.toml の keywords と同じ書式 (A OR B、空白/AND、NOT/-、括弧) の検索式の評価器です。
+APIを再検索せずに、software_talk などの上位集合から任意のカテゴリをローカルで切り出せます。
+
+使い方:
+    python tag_query.py software_talk "VOICEROID車載 OR VOICEPEAK車載"
+    python tag_query.py software_talk "ずんだもん -VOICEVOX実況プレイ" --partial --save zunda_misc
+"""
+
+import re
+import sys
+import time
+
+import numpy as np
+
+from tag_index import TagVocabulary, load_vocabulary, tag_csr
+from video_store import merge_category, read_category
+
+
+class TagIndex:
+    """
+    タグの転置インデックス。postings[offsets[t]:offsets[t+1]] がタグ t を持つ行番号 (昇順) です。
+    """
+
+    def __init__(self, offsets: np.ndarray, postings: np.ndarray, n_rows: int):
+        self.offsets = offsets
+        self.postings = postings
+        self.n_rows = n_rows
+
+    @classmethod
+    def build(cls, tag_offsets: np.ndarray, tag_ids: np.ndarray, n_tags: int) -> "TagIndex":
+        """
+        動画ごとのタグ (CSR) から転置インデックスを作る。
+        安定ソートなので各ポスティングリストは行番号の昇順になります。
+        """
+        n_rows = len(tag_offsets) - 1
+        rows = np.repeat(np.arange(n_rows, dtype=np.int32), np.diff(tag_offsets))
+        order = np.argsort(tag_ids, kind="stable")
+        counts = np.bincount(tag_ids, minlength=n_tags)
+        offsets = np.zeros(n_tags + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # 同じ動画に同じタグが重複して付くことはないため、そのままポスティングリストになる
+        return cls(offsets, rows[order], n_rows)
+
+    @classmethod
+    def from_store(cls, category: str, vocab: TagVocabulary | None = None) -> "TagIndex":
+        vocab = vocab or load_vocabulary()
+        table = read_category(category, ["tag_ids"])
+        offsets, ids = tag_csr(table.column("tag_ids"))
+        return cls.build(offsets, ids, len(vocab))
+
+    def posting(self, tag_id: int) -> np.ndarray:
+        if tag_id >= len(self.offsets) - 1:
+            return np.zeros(0, dtype=np.int32)
+        return self.postings[self.offsets[tag_id]:self.offsets[tag_id + 1]]
+
+    def rows_with_any(self, tag_ids: np.ndarray) -> np.ndarray:
+        """
+        tag_ids のいずれかを持つ行番号 (昇順・重複なし)。
+        """
+        lists = [self.posting(t) for t in tag_ids]
+        if not lists:
+            return np.zeros(0, dtype=np.int32)
+        if len(lists) == 1:
+            return lists[0]
+        return np.unique(np.concatenate(lists))
+
+
+_TOKEN_RE = re.compile(r'\(|\)|"[^"]*"|[^\s()]+')
+
+
+def tokenize(query: str) -> list[str]:
+    return _TOKEN_RE.findall(query)
+
+
+def parse_query(query: str):
+    """
+    検索式を構文木 (タプル) に変換する。
+      or_expr  := and_expr ("OR" and_expr)*
+      and_expr := unary (["AND"] unary)*     (空白区切りは AND)
+      unary    := ("NOT" | "-") unary | "(" or_expr ")" | 語
+    """
+    tokens = tokenize(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def or_expr():
+        node = and_expr()
+        while peek() == "OR":
+            take()
+            node = ("or", node, and_expr())
+        return node
+
+    def and_expr():
+        node = unary()
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                take()
+            node = ("and", node, unary())
+        return node
+
+    def unary():
+        tok = peek()
+        if tok is None:
+            raise ValueError(f"検索式が途中で終わっています: {query!r}")
+        if tok == "NOT":
+            take()
+            return ("not", unary())
+        if tok == "(":
+            take()
+            node = or_expr()
+            if take() != ")":
+                raise ValueError(f"括弧が閉じていません: {query!r}")
+            return node
+        take()
+        if tok.startswith("-") and len(tok) > 1:
+            return ("not", ("term", tok[1:].strip('"')))
+        return ("term", tok.strip('"'))
+
+    node = or_expr()
+    if peek() is not None:
+        raise ValueError(f"解釈できない語があります: {peek()!r} in {query!r}")
+    return node
+
+
+def evaluate(node, index: TagIndex, vocab: TagVocabulary, partial: bool = False) -> np.ndarray:
+    """
+    構文木を評価し、該当する行番号 (昇順) を返す。
+    partial=False はタグの完全一致 (tagsExact)、True はタグへの部分一致 (targets=tags) です。
+    いずれも大文字小文字は区別しません。
+    """
+    kind = node[0]
+    if kind == "term":
+        return index.rows_with_any(vocab.find(node[1], exact=not partial))
+    if kind == "or":
+        return np.union1d(evaluate(node[1], index, vocab, partial), evaluate(node[2], index, vocab, partial))
+    if kind == "and":
+        left = evaluate(node[1], index, vocab, partial)
+        # 右辺が NOT の場合は全行との差集合をとらずに直接引く
+        if node[2][0] == "not":
+            return np.setdiff1d(left, evaluate(node[2][1], index, vocab, partial), assume_unique=True)
+        return np.intersect1d(left, evaluate(node[2], index, vocab, partial), assume_unique=True)
+    if kind == "not":
+        return np.setdiff1d(np.arange(index.n_rows, dtype=np.int32), evaluate(node[1], index, vocab, partial), assume_unique=True)
+    raise ValueError(f"unknown node: {node!r}")
+
+
+def query_rows(category: str, query: str, partial: bool = False, index: TagIndex | None = None) -> np.ndarray:
+    """
+    カテゴリのストアに対して検索式を評価し、該当する行番号を返す。
+    """
+    vocab = load_vocabulary()
+    index = index or TagIndex.from_store(category, vocab)
+    return evaluate(parse_query(query), index, vocab, partial)
+
+
+def main(args):
+    source, query = args[0], args[1]
+    partial = "--partial" in args
+    save_as = args[args.index("--save") + 1] if "--save" in args else None
+
+    t0 = time.perf_counter()
+    vocab = load_vocabulary()
+    index = TagIndex.from_store(source, vocab)
+    t1 = time.perf_counter()
+    rows = evaluate(parse_query(query), index, vocab, partial)
+    t2 = time.perf_counter()
+    print(f"{source}: {len(rows):,} / {index.n_rows:,} 件が該当 (インデックス構築 {(t1 - t0) * 1000:.0f}ms, 検索 {(t2 - t1) * 1000:.1f}ms)")
+
+    if save_as:
+        merge_category(save_as, read_category(source).take(rows))
+        print(f"{save_as} として統合テーブルに登録しました")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3:
+        main(sys.argv[1:])
+    else:
+        print("コマンドライン引数が少なすぎます")
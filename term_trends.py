@@ -0,0 +1,247 @@
+"""
+タイトルの語 (名詞の 1-gram と、タイトル内で隣り合う2つの名詞の 2-gram) の年別出現数ストアと、前年比で伸びた語の抽出。
+カテゴリ・投稿年ごとに「その語を含む動画数」を保存し、更新時は新しい動画の分だけを足し込みます。
+タイトルが変わった動画や削除された動画がある年だけは、その年を数え直します。
+語は title_tokens の名詞の ID で持つため、語彙を引くのは結果を表示するときだけです。
+
+使い方:
+    python term_trends.py 2025 2024
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from tag_index import tag_csr
+from title_tokens import dictionary_signature, load_title_tokens, load_token_vocabulary, title_hashes
+from video_store import STORE_DIR, load_category_bits, load_videos
+
+TERMS_DIR = STORE_DIR / "term_counts"
+# 数え方を変えた場合は上げる (全件が数え直されます)
+TERMS_VERSION = 2
+# 連続する名詞の何語までを1つの語とみなすか (1 または 2)
+MAX_NGRAM = 2
+# term == VIDEOS_TERM の行はその年の動画数
+VIDEOS_TERM = -1
+
+COUNTS_SCHEMA = pa.schema(
+    [
+        ("year", pa.int16()),
+        ("term", pa.int64()),     # 1-gram は語の ID、2-gram は (1語目の ID + 1) << 32 | 2語目の ID
+        ("count", pa.int64()),    # その語を含む動画数
+    ]
+)
+COUNTED_SCHEMA = pa.schema(
+    [
+        ("key", pa.int64()),
+        ("year", pa.int16()),
+        ("title_hash", pa.uint64()),
+    ]
+)
+
+
+def counts_path(category: str):
+    return TERMS_DIR / f"{category}.parquet"
+
+
+def counted_path(category: str):
+    # 数え済みの動画 (キー・投稿年・タイトルのハッシュ)
+    return TERMS_DIR / f"{category}.counted.parquet"
+
+
+def _signature() -> str:
+    return f"{TERMS_VERSION}|{MAX_NGRAM}|{dictionary_signature()}"
+
+
+def video_terms(offsets: np.ndarray, ids: np.ndarray, positions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    名詞の CSR (offsets, ids) とタイトル内の位置から、各行に含まれる語を重複なしで (行番号, 語) の配列として返す。
+    2-gram は位置が連続する (間に助詞などを挟まない) 名詞の組だけです。
+    """
+    rows = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+    terms = [ids.astype(np.int64)]
+    term_rows = [rows]
+    if MAX_NGRAM >= 2 and len(ids) > 1:
+        # 同じタイトル内で実際に隣り合う2語
+        pair = (rows[:-1] == rows[1:]) & (positions[1:] == positions[:-1] + 1)
+        terms.append(((ids[:-1][pair].astype(np.int64) + 1) << 32) | ids[1:][pair].astype(np.int64))
+        term_rows.append(rows[:-1][pair])
+    terms, term_rows = np.concatenate(terms), np.concatenate(term_rows)
+    order = np.lexsort((terms, term_rows))
+    terms, term_rows = terms[order], term_rows[order]
+    first = np.ones(len(terms), dtype=bool)
+    first[1:] = (terms[1:] != terms[:-1]) | (term_rows[1:] != term_rows[:-1])
+    return term_rows[first], terms[first]
+
+
+def count_terms(df: pd.DataFrame) -> pa.Table:
+    """
+    df (key, title, year 列が必要) の動画を年・語ごとに数えた表 (COUNTS_SCHEMA、動画数の行を含む)。
+    """
+    if len(df) == 0:
+        return COUNTS_SCHEMA.empty_table()
+    years = df["year"].to_numpy(dtype=np.int16)
+    tokens = load_title_tokens(df)
+    offsets, ids = tag_csr(tokens.column("surface_ids"))
+    _, positions = tag_csr(tokens.column("positions"))
+    rows, terms = video_terms(offsets, ids, positions)
+    table = pa.table({"year": years[rows], "term": terms})
+    counts = table.group_by(["year", "term"]).aggregate([("term", "count")])
+    counts = pa.table({"year": counts.column("year"), "term": counts.column("term"), "count": counts.column("term_count")})
+    video_years, video_counts = np.unique(years, return_counts=True)
+    totals = pa.table({"year": video_years, "term": np.full(len(video_years), VIDEOS_TERM, dtype=np.int64), "count": video_counts.astype(np.int64)})
+    return pa.concat_tables([counts.cast(COUNTS_SCHEMA), totals.cast(COUNTS_SCHEMA)])
+
+
+def _merge(tables: list[pa.Table]) -> pa.Table:
+    table = pa.concat_tables(tables)
+    merged = table.group_by(["year", "term"]).aggregate([("count", "sum")])
+    merged = pa.table({"year": merged.column("year"), "term": merged.column("term"), "count": merged.column("count_sum")})
+    return merged.cast(COUNTS_SCHEMA).sort_by([("year", "ascending"), ("term", "ascending")])
+
+
+def _write(table: pa.Table, path, signature: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    pq.write_table(table.replace_schema_metadata({"signature": signature}), tmp_path, compression="zstd")
+    tmp_path.replace(path)
+
+
+def update_term_counts(category: str) -> int:
+    """
+    カテゴリの年別出現数を最新の動画データに合わせて更新し、数えた動画数を返す。
+    新しい動画は差分として足し込み、タイトル・投稿年が変わった動画や削除された動画がある年はその年全体を数え直します。
+    """
+    videos = load_videos(category, columns=["key", "title", "year"], start_time=False).drop_duplicates("key")
+    keys = videos["key"].to_numpy(dtype=np.int64)
+    years = videos["year"].to_numpy(dtype=np.int16)
+    hashes = title_hashes(videos["title"].astype(object).fillna("").astype(str).to_numpy(dtype=object), dictionary_signature())
+    signature = _signature()
+
+    path, done_path = counts_path(category), counted_path(category)
+    stored = None
+    if path.exists() and done_path.exists():
+        stored = pq.read_table(path)
+        if (stored.schema.metadata or {}).get(b"signature") != signature.encode():
+            stored = None
+
+    if stored is None:
+        recount = np.ones(len(keys), dtype=bool)
+        base = []
+    else:
+        done = pq.read_table(done_path)
+        done_keys = done.column("key").to_numpy()
+        order = np.argsort(done_keys)
+        done_keys = done_keys[order]
+        done_years = done.column("year").to_numpy()[order]
+        done_hashes = done.column("title_hash").to_numpy()[order]
+        pos = np.minimum(np.searchsorted(done_keys, keys), max(len(done_keys) - 1, 0))
+        found = (done_keys[pos] == keys) if len(done_keys) else np.zeros(len(keys), dtype=bool)
+        same = found & (done_years[pos] == years) & (done_hashes[pos] == hashes)
+        # 変更された動画の新旧の年と、削除された動画の年は数え直す
+        removed = ~np.isin(done_keys, keys)
+        dirty_years = np.union1d(np.union1d(years[found & ~same], done_years[pos[found & ~same]]), done_years[removed])
+        recount = np.isin(years, dirty_years) | ~found
+        # 年の動画がすべて削除された場合は数え直す動画がなくても、その年を除いて書き直す
+        if len(dirty_years) == 0 and not recount.any():
+            return 0
+        base = [stored.filter(pc.invert(pc.is_in(stored.column("year"), pa.array(dirty_years, type=pa.int16()))))]
+
+    delta = count_terms(videos[recount])
+    _write(_merge([*base, delta]), path, signature)
+    _write(pa.table({"key": keys, "year": years, "title_hash": hashes}, schema=COUNTED_SCHEMA), done_path, signature)
+    return int(recount.sum())
+
+
+def load_term_counts(categories=None, years=None) -> pd.DataFrame:
+    """
+    保存済みの年別出現数を (category, year, term, count) の DataFrame として読み込む。
+    """
+    categories = categories or list(load_category_bits())
+    filters = [("year", "in", list(years))] if years is not None else None
+    frames = []
+    for category in categories:
+        path = counts_path(category)
+        if path.exists():
+            frames.append(pq.read_table(path, filters=filters).to_pandas().assign(category=category))
+    if not frames:
+        return pd.DataFrame({"category": pd.Series(dtype=object), "year": pd.Series(dtype=np.int16), "term": pd.Series(dtype=np.int64), "count": pd.Series(dtype=np.int64)})
+    return pd.concat(frames, ignore_index=True)[["category", "year", "term", "count"]]
+
+
+def term_labels(terms) -> list[str]:
+    """
+    語の番号を表示用の文字列 (2-gram は空白区切り) に変換する。
+    """
+    words = load_token_vocabulary().tags
+    labels = []
+    for term in np.asarray(terms, dtype=np.int64):
+        first = term >> 32
+        labels.append(words[term] if first == 0 else f"{words[first - 1]} {words[term & 0xFFFFFFFF]}")
+    return labels
+
+
+def emerging_terms(year: int, base_year: int | None = None, categories=None, min_support: int = 10, min_length: int = 2, stop_words=(), top: int = 30, combined: bool = False) -> pd.DataFrame:
+    """
+    year の出現率が base_year (既定は前年) に比べて伸びた語を、カテゴリごとに伸び率 (lift) の大きい順に返す。
+    lift は (year の動画数に対する出現率) / (base_year の出現率) で、0 件の語も比べられるよう両方に 1 を足して求めます。
+    year で min_support 本未満の語や、min_length 文字未満・数字だけ・stop_words の語を含む語は除きます。
+    combined=True の場合はカテゴリを合算して1つの順位にします (複数カテゴリに属する動画は重複して数えます)。
+    """
+    base_year = year - 1 if base_year is None else base_year
+    counts = load_term_counts(categories, years=[year, base_year])
+    if combined:
+        counts = counts.assign(category="all").groupby(["category", "year", "term"], as_index=False)["count"].sum()
+    table = counts.pivot_table(index=["category", "term"], columns="year", values="count", aggfunc="sum", fill_value=0)
+    table = table.reindex(columns=[base_year, year], fill_value=0)
+    totals = table.xs(VIDEOS_TERM, level="term") if len(table) else pd.DataFrame(columns=[base_year, year])
+    table = table.drop(index=VIDEOS_TERM, level="term", errors="ignore")
+    table = table[table[year] >= min_support]
+
+    # 語の条件は語彙 (ユニークな語) に対して一度だけ判定する
+    words = load_token_vocabulary().tags
+    stop_words = set(stop_words)
+    allowed = np.fromiter((len(w) >= min_length and not w.isdigit() and w not in stop_words for w in words), dtype=bool, count=len(words))
+    terms = table.index.get_level_values("term").to_numpy()
+    first = terms >> 32
+    ok = allowed[terms & 0xFFFFFFFF] & ((first == 0) | allowed[np.maximum(first - 1, 0)])
+    table = table[ok]
+
+    category = table.index.get_level_values("category")
+    n_year = totals[year].reindex(category).to_numpy(dtype=np.float64)
+    n_base = totals[base_year].reindex(category).to_numpy(dtype=np.float64)
+    result = pd.DataFrame(
+        {
+            "category": category,
+            "term": table.index.get_level_values("term"),
+            "count": table[year].to_numpy(),
+            "base_count": table[base_year].to_numpy(),
+            "share": table[year].to_numpy() / np.maximum(n_year, 1),
+            "base_share": table[base_year].to_numpy() / np.maximum(n_base, 1),
+        }
+    )
+    result["lift"] = ((result["count"] + 1) / (n_year + 1)) / ((result["base_count"] + 1) / (n_base + 1))
+    result = result.sort_values(["category", "lift"], ascending=[True, False], kind="stable").groupby("category").head(top)
+    result.insert(2, "word", term_labels(result["term"]))
+    return result.reset_index(drop=True)
+
+
+def main(year: int, base_year: int | None = None):
+    for category in load_category_bits():
+        updated = update_term_counts(category)
+        print(f"{category}: {updated} 本を集計")
+    result = emerging_terms(year, base_year)
+    for category, rows in result.groupby("category", sort=False):
+        print(f"\n--- {category}: {year} vs {base_year or year - 1} ---")
+        print(rows.drop(columns=["category", "term"]).to_string(index=False))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) >= 3 else None)
+    else:
+        print("コマンドライン引数が少なすぎます")
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import term_trends
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+    term_trends の保存先を一時ディレクトリにし、動画とタイトルの名詞を差し替える。
+    タイトルは空白区切りの語で、"/" で始まる語は名詞以外 (助詞など) として扱います。
+    """
+    state = {"videos": pd.DataFrame(columns=["key", "title", "year"])}
+    words = {}
+
+    def load_videos(category, columns=None, start_time=True):
+        return state["videos"][columns].copy()
+
+    def load_title_tokens(df):
+        tokens = [[(i, w) for i, w in enumerate(title.split()) if not w.startswith("/")] for title in df["title"]]
+        ids = [[words.setdefault(w, len(words)) for _, w in t] for t in tokens]
+        positions = [[i for i, _ in t] for t in tokens]
+        return pa.table(
+            {"surface_ids": pa.array(ids, type=pa.list_(pa.int32())), "positions": pa.array(positions, type=pa.list_(pa.int16()))}
+        )
+
+    monkeypatch.setattr(term_trends, "TERMS_DIR", tmp_path)
+    monkeypatch.setattr(term_trends, "dictionary_signature", lambda: "test")
+    monkeypatch.setattr(term_trends, "load_videos", load_videos)
+    monkeypatch.setattr(term_trends, "load_title_tokens", load_title_tokens)
+    return state
+
+
+def _videos(rows):
+    return pd.DataFrame(rows, columns=["key", "title", "year"])
+
+
+def test_removing_every_video_of_a_year_drops_that_year(store):
+    store["videos"] = _videos(
+        [
+            (1, "東京 大阪", 2012),
+            (2, "東京", 2012),
+            (3, "大阪", 2013),
+            (4, "東京 名古屋", 2013),
+        ]
+    )
+    assert term_trends.update_term_counts("onboard") == 4
+
+    # 2012年の動画をすべて削除する (新しい動画も変更された動画もない)
+    store["videos"] = store["videos"][store["videos"]["year"] != 2012]
+    term_trends.update_term_counts("onboard")
+
+    counts = term_trends.load_term_counts(["onboard"])
+    assert 2012 not in set(counts["year"])
+    totals = counts[counts["term"] == term_trends.VIDEOS_TERM].set_index("year")["count"]
+    assert totals.to_dict() == {2013: 2}
+    counted = pq.read_table(term_trends.counted_path("onboard"))
+    assert np.sort(counted.column("key").to_numpy()).tolist() == [3, 4]
+
+    # 以降の更新では何も変わらない
+    assert term_trends.update_term_counts("onboard") == 0
+    assert term_trends.load_term_counts(["onboard"]).equals(counts)
+
+
+def test_bigrams_only_pair_adjacent_nouns(store):
+    store["videos"] = _videos([(1, "東京 /から 大阪 旅行", 2013)])
+    term_trends.update_term_counts("onboard")
+    counts = term_trends.load_term_counts(["onboard"])
+    terms = set(counts["term"]) - {term_trends.VIDEOS_TERM}
+
+    words = {w: i for i, w in enumerate(["東京", "大阪", "旅行"])}
+    # 助詞を挟む「東京 大阪」は組にせず、隣り合う「大阪 旅行」だけを組にする
+    assert terms == {words["東京"], words["大阪"], words["旅行"], ((words["大阪"] + 1) << 32) | words["旅行"]}
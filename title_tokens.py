@@ -0,0 +1,310 @@
+"""
+動画タイトルの形態素解析結果 (名詞) のキャッシュ。
+タイトルを MeCab (unidic-lite) で解析した名詞の表層形・原形 (語彙素)・品詞を、共通の語彙に対する
+int32 の ID 配列として動画キーごとに保存します。名詞ごとにタイトル内の位置 (名詞以外も含めた語の通し番号) も持ち、
+名詞が実際に隣り合っているか (助詞などを挟んでいないか) を判定できるようにします。
+各行にはタイトルと辞書のハッシュを持ち、新しい動画やタイトル・辞書が変わった動画だけを解析し直します。
+解析はタイトルを複数プロセスに分けて行い、各プロセスは Tagger (unidic-lite) を一度だけ読み込みます。
+
+使い方 (ワーカー数ごとの解析速度の計測):
+    python title_tokens.py onboard
+"""
+
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from tag_index import TagVocabulary, tag_csr
+from video_store import STORE_DIR
+
+TOKENS_PATH = STORE_DIR / "title_tokens.parquet"
+# 表層形・原形・品詞の文字列を共通で持つ語彙
+TOKEN_VOCAB_PATH = STORE_DIR / "token_vocab.parquet"
+# 前処理や保存する内容を変えた場合は上げる (全件が解析し直されます)
+TOKENIZER_VERSION = 2
+
+TOKENS_SCHEMA = pa.schema(
+    [
+        ("key", pa.int64()),                       # content_keys() と同じ動画キー
+        ("title_hash", pa.uint64()),               # タイトル + 辞書のハッシュ
+        ("surface_ids", pa.list_(pa.int32())),     # 名詞の表層形
+        ("lemma_ids", pa.list_(pa.int32())),       # 名詞の原形 (語彙素)
+        ("pos_ids", pa.list_(pa.int32())),         # 品詞 (例: 名詞-固有名詞-地名)
+        ("positions", pa.list_(pa.int16())),       # タイトル内の位置 (名詞以外も含めた語の通し番号)
+    ]
+)
+
+# 括弧や感嘆符は区切りとして空白に置き換えてから解析する (改行・タブは出力の区切りと衝突するため同様に置き換える)
+_CLEAN_RE = re.compile(r'[【】［］（）()!！?？\[\]\t\r\n]')
+# 解析に使うプロセス数と、1プロセスに渡すタイトル数
+TOKENIZE_WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 2000
+# これより少ない件数はプロセスを起動せずに解析する
+MIN_PARALLEL_TITLES = 5000
+
+# parse の出力を「品詞大分類 \t 表層形 \t 原形 \t 品詞」の1行1語にする (未知語は原形を表層形で代用)
+_OUTPUT_FORMAT = (
+    r'-O "" --node-format=%f[0]\\t%m\\t%f[7]\\t%F-[0,1,2,3]\\n'
+    r' --unk-format=%f[0]\\t%m\\t%m\\t%F-[0,1,2,3]\\n --eos-format=EOS\\n'
+)
+
+
+def get_tagger(bulk: bool = False):
+    """
+    unidic-lite の Tagger を作る。bulk=True の場合は parse の出力が _OUTPUT_FORMAT になります。
+    """
+    import MeCab
+    import unidic_lite
+
+    return MeCab.Tagger(f'-d "{unidic_lite.DICDIR}"' + (" " + _OUTPUT_FORMAT if bulk else ""))
+
+
+def dictionary_signature() -> str:
+    """
+    解析結果を左右するもの (前処理の版・MeCab・辞書のバージョン) をまとめた文字列。
+    """
+    versions = [metadata.version(p) for p in ("mecab-python3", "unidic-lite")]
+    return "|".join([str(TOKENIZER_VERSION), *versions])
+
+
+def title_hashes(titles, signature: str) -> np.ndarray:
+    prefix = signature.encode() + b"\0"
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(prefix + t.encode(), digest_size=8).digest(), "little") for t in titles),
+        dtype=np.uint64,
+        count=len(titles),
+    )
+
+
+# ワーカープロセスごとの Tagger
+_tagger = None
+
+
+def _init_worker():
+    global _tagger
+    _tagger = get_tagger(bulk=True)
+
+
+def _tokenize_chunk(titles) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    タイトルの塊を解析し、(この塊内の語彙, offsets, (表層形, 原形, 品詞) の ID の n×3 配列, タイトル内の位置) を返す。
+    プロセス間では文字列のリストではなく、塊内の語彙と整数配列だけを受け渡します。
+    """
+    if _tagger is None:
+        _init_worker()
+    words, local = [], {}
+    offsets = np.zeros(len(titles) + 1, dtype=np.int32)
+    ids, positions = [], []
+    for i, title in enumerate(titles):
+        position = 0
+        for line in _tagger.parse(_CLEAN_RE.sub(" ", title)).split("\n"):
+            if not line or line == "EOS":
+                continue
+            if line.startswith("名詞\t"):
+                for w in line.split("\t")[1:]:
+                    wid = local.get(w)
+                    if wid is None:
+                        wid = local[w] = len(words)
+                        words.append(w)
+                    ids.append(wid)
+                positions.append(position)
+            position += 1
+        offsets[i + 1] = len(ids) // 3
+    return words, offsets, np.asarray(ids, dtype=np.int32).reshape(-1, 3), np.asarray(positions, dtype=np.int16)
+
+
+def tokenize_titles(titles, vocab: TagVocabulary, workers: int | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    タイトルの名詞を解析し、(offsets, (表層形, 原形, 品詞) の語彙 ID の n×3 配列, タイトル内の位置) を返す。
+    workers (既定は TOKENIZE_WORKERS) が2以上で件数が多い場合はプロセスプールで並列に解析します。
+    """
+    titles = list(titles)
+    workers = workers or TOKENIZE_WORKERS
+    chunks = [titles[i:i + CHUNK_SIZE] for i in range(0, len(titles), CHUNK_SIZE)]
+    if workers > 1 and len(titles) >= MIN_PARALLEL_TITLES:
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as executor:
+            results = list(executor.map(_tokenize_chunk, chunks))
+    else:
+        results = [_tokenize_chunk(chunk) for chunk in chunks]
+
+    offsets = [np.zeros(1, dtype=np.int64)]
+    tokens = [np.zeros((0, 3), dtype=np.int32)]
+    positions = [np.zeros(0, dtype=np.int16)]
+    for words, chunk_offsets, chunk_ids, chunk_positions in results:
+        # 塊内の ID を共通の語彙の ID に読み替える
+        _, mapping = vocab.encode([words])
+        offsets.append(chunk_offsets[1:] + offsets[-1][-1])
+        tokens.append(mapping[chunk_ids])
+        positions.append(chunk_positions)
+    return np.concatenate(offsets).astype(np.int32), np.concatenate(tokens), np.concatenate(positions)
+
+
+_vocabulary = None
+_lock = threading.Lock()
+
+
+def load_token_vocabulary() -> TagVocabulary:
+    """
+    保存済みのトークン語彙を読み込む (プロセス内で共有)。
+    """
+    global _vocabulary
+    if _vocabulary is None:
+        tags = pq.read_table(TOKEN_VOCAB_PATH).column("tag").to_pylist() if TOKEN_VOCAB_PATH.exists() else []
+        _vocabulary = TagVocabulary(tags)
+    return _vocabulary
+
+
+def _read_tokens() -> pa.Table:
+    if TOKENS_PATH.exists():
+        store = pq.read_table(TOKENS_PATH)
+        # 列の構成が古いキャッシュは使わない (全件を解析し直す)
+        if store.schema.equals(TOKENS_SCHEMA, check_metadata=False):
+            return store
+    return TOKENS_SCHEMA.empty_table()
+
+
+def _lookup(store_keys: np.ndarray, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # キー順のストアから keys の位置を探す (見つからない場合は found=False)
+    pos = np.minimum(np.searchsorted(store_keys, keys), max(len(store_keys) - 1, 0))
+    found = store_keys[pos] == keys if len(store_keys) else np.zeros(len(keys), dtype=bool)
+    return pos, found
+
+
+def update_title_tokens(keys, titles) -> int:
+    """
+    キャッシュにない (またはタイトル・辞書が変わった) 動画のタイトルだけを解析して保存する。
+    解析した件数を返します。
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    titles = pd.Series(titles).fillna("").astype(str).to_numpy(dtype=object)
+    keys, first = np.unique(keys, return_index=True)
+    titles = titles[first]
+    hashes = title_hashes(titles, dictionary_signature())
+
+    with _lock:
+        store = _read_tokens()
+        pos, found = _lookup(store.column("key").to_numpy(), keys)
+        cached = found & (store.column("title_hash").to_numpy()[pos] == hashes) if store.num_rows else found
+        stale = ~cached
+        if not stale.any():
+            return 0
+
+        vocab = load_token_vocabulary()
+        offsets, tokens, positions = tokenize_titles(titles[stale], vocab)
+        columns = {"key": keys[stale], "title_hash": hashes[stale]}
+        for i, name in enumerate(("surface_ids", "lemma_ids", "pos_ids")):
+            columns[name] = pa.ListArray.from_arrays(pa.array(offsets), pa.array(np.ascontiguousarray(tokens[:, i])))
+        columns["positions"] = pa.ListArray.from_arrays(pa.array(offsets), pa.array(positions))
+        fresh = pa.table(columns, schema=TOKENS_SCHEMA)
+
+        # 解析し直した動画の古い行を除いて、キー順に並べ直す
+        keep = np.ones(store.num_rows, dtype=bool)
+        keep[pos[found & stale]] = False
+        merged = pa.concat_tables([store.filter(pa.array(keep)), fresh]).sort_by("key")
+
+        # ストアが未知の ID を参照しないよう、先に語彙を保存する
+        vocab.save(TOKEN_VOCAB_PATH)
+        TOKENS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = TOKENS_PATH.with_suffix(".parquet.tmp")
+        pq.write_table(merged, tmp_path, compression="zstd")
+        tmp_path.replace(TOKENS_PATH)
+    return int(stale.sum())
+
+
+def load_title_tokens(df: pd.DataFrame) -> pa.Table:
+    """
+    df (key, title 列が必要) の各行に対応するトークン (surface_ids, lemma_ids, pos_ids, positions) を行順で返す。
+    未解析のタイトルはこのときに解析してキャッシュに追加します。
+    """
+    keys = df["key"].to_numpy(dtype=np.int64)
+    update_title_tokens(keys, df["title"])
+    store = _read_tokens()
+    pos, _ = _lookup(store.column("key").to_numpy(), keys)
+    return store.take(pa.array(pos)).select(["surface_ids", "lemma_ids", "pos_ids", "positions"])
+
+
+def title_nouns(df: pd.DataFrame, stop_words=(), min_length: int = 2, field: str = "surface") -> list[list[str]]:
+    """
+    df の各行のタイトルに含まれる名詞のリスト。
+    従来の extract_nouns と同様に、min_length 文字未満・数字だけの語と stop_words は除きます。
+    field="lemma" で表層形の代わりに原形を返します。
+    """
+    if len(df) == 0:
+        return []
+    vocab = load_token_vocabulary()
+    offsets, ids = tag_csr(load_title_tokens(df).column(f"{field}_ids"))
+    keep = _allowed_words(vocab, stop_words, min_length)[ids]
+    counts = np.bincount(np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[keep], minlength=len(offsets) - 1)
+    words = np.asarray(vocab.tags, dtype=object)[ids[keep]]
+    return [list(w) for w in np.split(words, np.cumsum(counts)[:-1])]
+
+
+def _allowed_words(vocab: TagVocabulary, stop_words, min_length: int) -> np.ndarray:
+    # 除外判定は語彙 (ユニークな語) に対して一度だけ行う
+    stop_words = set(stop_words)
+    return np.fromiter(
+        (len(w) >= min_length and not w.isdigit() and w not in stop_words for w in vocab.tags),
+        dtype=bool,
+        count=len(vocab),
+    )
+
+
+def noun_frequencies(df: pd.DataFrame, groups, stop_words=(), min_length: int = 2, field: str = "surface") -> dict:
+    """
+    groups (行と同じ長さの配列) の値ごとの名詞の出現回数 {グループ: {語: 回数}}。
+    title_nouns と同じ語を数えますが、行ごとのリストは作らずに語彙の ID のまま一度に集計します。
+    """
+    codes, labels = pd.factorize(np.asarray(groups), sort=True)
+    result = {label: {} for label in labels}
+    if len(df) == 0:
+        return result
+    vocab = load_token_vocabulary()
+    offsets, ids = tag_csr(load_title_tokens(df).column(f"{field}_ids"))
+    rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    keep = _allowed_words(vocab, stop_words, min_length)[ids] & (codes[rows] >= 0)
+    # (グループ, 語) の組ごとに数える
+    pairs, counts = np.unique(codes[rows[keep]].astype(np.int64) * len(vocab) + ids[keep], return_counts=True)
+    group_codes, word_ids = np.divmod(pairs, len(vocab))
+    bounds = np.searchsorted(group_codes, np.arange(len(labels) + 1))
+    words = np.asarray(vocab.tags, dtype=object)
+    for i, label in enumerate(labels):
+        sel = slice(bounds[i], bounds[i + 1])
+        result[label] = dict(zip(words[word_ids[sel]].tolist(), counts[sel].tolist()))
+    return result
+
+
+def benchmark(titles, worker_counts=None):
+    """
+    ワーカー数ごとの解析速度 (タイトル/秒) を表示する。プロセスの起動時間も含みます。
+    """
+    worker_counts = worker_counts or sorted({1, 2, 4, TOKENIZE_WORKERS})
+    print(f"{len(titles):,} タイトル")
+    for workers in worker_counts:
+        t0 = time.perf_counter()
+        if workers == 1:
+            results = [_tokenize_chunk(titles[i:i + CHUNK_SIZE]) for i in range(0, len(titles), CHUNK_SIZE)]
+            tokens = sum(len(ids) for _, _, ids, _ in results)
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker) as executor:
+                chunks = [titles[i:i + CHUNK_SIZE] for i in range(0, len(titles), CHUNK_SIZE)]
+                tokens = sum(len(ids) for _, _, ids, _ in executor.map(_tokenize_chunk, chunks))
+        elapsed = time.perf_counter() - t0
+        print(f"  workers={workers:>2}: {len(titles) / elapsed:10,.0f} タイトル/秒 ({elapsed:.2f}秒, 名詞 {tokens:,} 語)")
+
+
+if __name__ == "__main__":
+    from video_store import load_videos
+
+    category = sys.argv[1] if len(sys.argv) > 1 else "onboard"
+    titles = load_videos(category, columns=["title"], start_time=False)["title"].fillna("").tolist()
+    benchmark(titles)
@@ -0,0 +1,267 @@
+"""
+Processing Overview:
+再生数・動画の長さの分布のスケッチ (カテゴリ × 投稿年)。
+値を相対誤差 ACCURACY の対数の区間 (バケット) に分けた度数分布として保存し、
+年ごとの中央値などの分位点やバイオリン図の密度を、動画の行を読まずに求めます。
+更新は差分で行います。動画ごとに前回数えたバケットを覚えておき、バケットが変わった動画 (再生数が伸びた動画など)・
+新しい動画・削除された動画の分だけ度数を増減します。取得 (snapshot_api.fetch_pipeline) の後に取得したカテゴリを更新し、
+他のカテゴリは次に読み込むときに統合テーブルの更新を検知して更新します。
+software_talk は歌唱系の動画を除きます。
+
+使い方:
+    python value_sketches.py software_talk
+"""
+
+import hashlib
+import secrets
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common_utils import SOFTWARE_TALK_EXCLUDE, filter_software_talk
+from video_store import CATEGORIES_PATH, CORPUS_DIR, STORE_DIR, load_videos
+
+SKETCHES_DIR = STORE_DIR / "value_sketches"
+# 数え方を変えた場合は上げる (全件が数え直されます)
+SKETCH_VERSION = 1
+# 分位点の相対誤差 (バケットの幅は (1 + ACCURACY) / (1 - ACCURACY) 倍ずつ)
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+# スケッチを持つ列
+VALUE_COLUMNS = ["viewCounter", "lengthSeconds"]
+
+COUNTS_SCHEMA = pa.schema(
+    [
+        ("year", pa.int16()),
+        ("column", pa.string()),
+        ("bucket", pa.int16()),   # 0 は値 0、b >= 1 は (GAMMA ** (b - 2), GAMMA ** (b - 1)] の区間
+        ("count", pa.int64()),
+    ]
+)
+COUNTED_SCHEMA = pa.schema(
+    [
+        ("key", pa.int64()),
+        ("year", pa.int16()),
+        *[(column, pa.int16()) for column in VALUE_COLUMNS],
+    ]
+)
+
+
+def counts_path(category: str):
+    return SKETCHES_DIR / f"{category}.parquet"
+
+
+def counted_path(category: str):
+    # 数え済みの動画 (キー・投稿年・列ごとのバケット)
+    return SKETCHES_DIR / f"{category}.counted.parquet"
+
+
+def _signature() -> str:
+    return f"{SKETCH_VERSION}|{ACCURACY}|{','.join(SOFTWARE_TALK_EXCLUDE)}"
+
+
+def _source_signature() -> str:
+    # 統合テーブルのファイルのサイズと更新時刻 (取得で変わる)
+    parts = []
+    for path in [*sorted(CORPUS_DIR.glob("*.parquet")), CATEGORIES_PATH]:
+        if path.exists():
+            stat = path.stat()
+            parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def bucket_index(values) -> np.ndarray:
+    """
+    値 (0 以上) をバケット番号にする。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    buckets = np.zeros(len(values), dtype=np.int16)
+    positive = values > 0
+    buckets[positive] = np.ceil(np.log(values[positive]) / np.log(GAMMA)).astype(np.int16) + 1
+    return buckets
+
+
+def bucket_values(buckets) -> np.ndarray:
+    """
+    バケットの代表値 (区間内のどの値に対しても相対誤差 ACCURACY 以内)。
+    """
+    buckets = np.asarray(buckets, dtype=np.float64)
+    return np.where(buckets > 0, 2 * GAMMA ** (buckets - 1) / (GAMMA + 1), 0.0)
+
+
+def _bucket_counts(years: np.ndarray, buckets: dict[str, np.ndarray], sign: int) -> pd.DataFrame:
+    frames = [pd.DataFrame({"year": years, "column": column, "bucket": values, "count": sign}) for column, values in buckets.items()]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _write(table: pa.Table, path, signature: str, source: str, generation: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    metadata = {"signature": signature, "source": source, "generation": generation}
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path, compression="zstd")
+    tmp_path.replace(path)
+
+
+def update_value_sketches(category: str) -> int:
+    """
+    カテゴリのスケッチを最新の動画データに合わせて更新し、度数を増減した動画数を返す。
+    バケットが変わらない動画 (再生数の伸びが区間内に収まった動画など) は数え直しません。
+    度数と数え済みの動画の2つのファイルには同じ世代番号を付け、数え済みの動画を先に書きます。
+    途中で止まって世代番号が食い違う場合は、差分を使わずに全件を数え直します。
+    """
+    source = _source_signature()
+    signature = _signature()
+    columns = ["key", "year", *VALUE_COLUMNS] + (["tag_ids"] if category == "software_talk" else [])
+    videos = load_videos(category, columns=columns, start_time=False)
+    if category == "software_talk":
+        videos = filter_software_talk(videos)
+    videos = videos.drop_duplicates("key")
+    keys = videos["key"].to_numpy(dtype=np.int64)
+    years = videos["year"].to_numpy(dtype=np.int16)
+    buckets = {column: bucket_index(videos[column].to_numpy(dtype=np.float64, na_value=0)) for column in VALUE_COLUMNS}
+
+    path, done_path = counts_path(category), counted_path(category)
+    stored = None
+    if path.exists() and done_path.exists():
+        stored = pq.read_table(path)
+        metadata = stored.schema.metadata or {}
+        done_metadata = pq.read_schema(done_path).metadata or {}
+        if metadata.get(b"signature") != signature.encode() or metadata.get(b"generation") != done_metadata.get(b"generation"):
+            stored = None
+
+    if stored is None:
+        changed = len(keys)
+        counts = _bucket_counts(years, buckets, 1)
+    else:
+        done = pq.read_table(done_path)
+        done_keys = done.column("key").to_numpy()
+        order = np.argsort(done_keys)
+        done_keys = done_keys[order]
+        done_years = done.column("year").to_numpy()[order]
+        done_buckets = {column: done.column(column).to_numpy()[order] for column in VALUE_COLUMNS}
+        pos = np.minimum(np.searchsorted(done_keys, keys), max(len(done_keys) - 1, 0))
+        found = (done_keys[pos] == keys) if len(done_keys) else np.zeros(len(keys), dtype=bool)
+        same = found & (done_years[pos] == years)
+        for column in VALUE_COLUMNS:
+            same &= done_buckets[column][pos] == buckets[column]
+        # 変わった動画は前回の分を引いて今回の分を足す。削除された動画は前回の分を引く
+        added = ~same
+        removed = ~np.isin(done_keys, keys)
+        subtracted = removed.copy()
+        subtracted[pos[found & ~same]] = True
+        changed = int(added.sum() + removed.sum())
+        if changed == 0:
+            _write(stored, path, signature, source, (stored.schema.metadata or {})[b"generation"].decode())
+            return 0
+        counts = pd.concat(
+            [
+                stored.to_pandas(),
+                _bucket_counts(years[added], {c: b[added] for c, b in buckets.items()}, 1),
+                _bucket_counts(done_years[subtracted], {c: b[subtracted] for c, b in done_buckets.items()}, -1),
+            ],
+            ignore_index=True,
+        )
+
+    merged = counts.groupby(["year", "column", "bucket"], as_index=False)["count"].sum()
+    merged = merged[merged["count"] != 0]
+    table = pa.Table.from_pandas(merged[COUNTS_SCHEMA.names], schema=COUNTS_SCHEMA, preserve_index=False)
+    generation = secrets.token_hex(8)
+    _write(pa.table({"key": keys, "year": years, **buckets}, schema=COUNTED_SCHEMA), done_path, signature, source, generation)
+    _write(table, path, signature, source, generation)
+    return changed
+
+
+def load_value_sketches(category: str, column: str = "viewCounter", years=None) -> pd.DataFrame:
+    """
+    スケッチを (year, bucket, count) の DataFrame として読み込む。統合テーブルが更新されていれば先に差分を反映します。
+    """
+    path = counts_path(category)
+    schema = pq.read_schema(path) if path.exists() else None
+    metadata = (schema.metadata or {}) if schema is not None else {}
+    if metadata.get(b"signature") != _signature().encode() or metadata.get(b"source") != _source_signature().encode():
+        update_value_sketches(category)
+    filters = [("column", "=", column)]
+    if years is not None:
+        filters.append(("year", "in", list(years)))
+    return pq.read_table(path, filters=filters, columns=["year", "bucket", "count"]).to_pandas()
+
+
+def _histograms(category: str, column: str, years) -> tuple[pd.Index, np.ndarray]:
+    # 年 × バケット の度数の配列
+    sketch = load_value_sketches(category, column, years)
+    width = int(sketch["bucket"].max()) + 1 if len(sketch) else 1
+    year_index = pd.Index(sorted(sketch["year"].unique()), name="year")
+    counts = np.zeros((len(year_index), width), dtype=np.int64)
+    counts[year_index.get_indexer(sketch["year"]), sketch["bucket"].to_numpy(dtype=np.int64)] = sketch["count"].to_numpy()
+    return year_index, counts
+
+
+def quantiles(category: str, q=0.5, column: str = "viewCounter", years=None) -> pd.Series | pd.DataFrame:
+    """
+    年ごとの分位点 (pandas の quantile と同じく順位の線形補間、値の相対誤差は ACCURACY 以内)。
+    q がスカラーの場合は年を index とする Series、リストの場合は年 × q の DataFrame を返します。
+    """
+    qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    year_index, counts = _histograms(category, column, years)
+    values = bucket_values(np.arange(counts.shape[1]))
+    cumulative = np.cumsum(counts, axis=1)
+    n = cumulative[:, -1]
+    position = qs[None, :] * (n[:, None] - 1)
+    lower, upper = np.floor(position), np.ceil(position)
+
+    def value_at(rank: np.ndarray) -> np.ndarray:
+        # 順位 (0 始まり) の値が入っているバケットの代表値
+        return values[np.array([np.searchsorted(c, r, side="right") for c, r in zip(cumulative, rank)]).reshape(rank.shape)]
+
+    result = value_at(lower) + (value_at(upper) - value_at(lower)) * (position - lower)
+    if np.ndim(q) == 0:
+        return pd.Series(result[:, 0], index=year_index, name=column)
+    return pd.DataFrame(result, index=year_index, columns=list(qs))
+
+
+def densities(category: str, column: str = "viewCounter", years=None, upper: float | None = None, gridsize: int = 100) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """
+    年ごとのバイオリン図の密度 (ガウスカーネル、バンド幅は Scott の規則) を {年: (値の格子, 密度)} で返す。
+    格子はその年の最小値から最大値まで (upper を指定した場合はそこまで) です。
+    """
+    year_index, counts = _histograms(category, column, years)
+    values = bucket_values(np.arange(counts.shape[1]))
+    result = {}
+    for year, weights in zip(year_index, counts):
+        present = np.flatnonzero(weights)
+        if len(present) == 0:
+            continue
+        v, w = values[present], weights[present].astype(np.float64)
+        n = w.sum()
+        mean = np.sum(w * v) / n
+        bandwidth = np.sqrt(np.sum(w * (v - mean) ** 2) / max(n - 1, 1)) * n ** (-1 / 5)
+        high = v[-1] if upper is None else min(v[-1], upper)
+        grid = np.linspace(v[0], max(high, v[0]), gridsize)
+        if bandwidth > 0:
+            z = (grid[:, None] - v[None, :]) / bandwidth
+            density = (np.exp(-0.5 * z * z) @ w) / (n * bandwidth * np.sqrt(2 * np.pi))
+        else:
+            density = np.ones(gridsize)
+        result[int(year)] = (grid, density)
+    return result
+
+
+def main(category: str):
+    t0 = time.perf_counter()
+    updated = update_value_sketches(category)
+    t1 = time.perf_counter()
+    table = pd.DataFrame({column: quantiles(category, 0.5, column) for column in VALUE_COLUMNS})
+    t2 = time.perf_counter()
+    print(f"{category}: {updated:,} 本を更新 ({t1 - t0:.2f}秒), 中央値の算出 {(t2 - t1) * 1000:.0f}ms")
+    print(table.round(1).to_string())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        main(sys.argv[1])
+    else:
+        print("コマンドライン引数が少なすぎます")
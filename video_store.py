@@ -0,0 +1,483 @@
+"""
+取得した動画データの列指向ストア (Parquet)。
+フェッチャーがページ単位で型付きの列に変換して追記し、各解析スクリプトは
+pd.json_normalize を経由せずに DataFrame を直接読み込みます。
+
+全カテゴリの動画は contentId で重複を除いた1つの表にまとめ、
+各動画がどのカテゴリに属するかを categories 列のビットマスクで持ちます。
+カテゴリごとのデータはこのマスクで絞り込んだものです。
+表は投稿年 (JST) ごとのファイル (results/store/videos/{year}.parquet) に分けて保存し、
+年の範囲を指定した読み込みでは該当する年のファイルだけを読みます。
+"""
+
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from tag_index import TagVocabulary, decode_tags, load_vocabulary
+
+RESULTS_DIR = Path("results")
+STORE_DIR = RESULTS_DIR / "store"
+# 統合テーブルの年パーティション ({year}.parquet、各ファイル内は動画キー順)
+CORPUS_DIR = STORE_DIR / "videos"
+# 年で分割する前の単一ファイル (見つかった場合は読み込み時に分割し直す)
+LEGACY_CORPUS_PATH = STORE_DIR / "videos.parquet"
+# カテゴリ名 -> ビット位置 の対応 (一度割り当てたビットは変えない)
+CATEGORIES_PATH = STORE_DIR / "categories.json"
+# フェッチ中のカテゴリを一時的に書き出す場所 (取得完了後に統合テーブルへマージする)
+STAGING_DIR = STORE_DIR / "staging"
+MAX_CATEGORIES = 32
+
+# APIから取得するフィールド
+FIELDS = ["contentId", "title", "userId", "viewCounter", "lengthSeconds", "startTime", "tags"]
+
+# startTime は取り込み時に一度だけ解析し、UNIX時刻 (秒) と JST の年・月として保存する
+JST_OFFSET = 9 * 3600
+
+# contentId の接頭辞 (sm/so/nm など)。コードは保存データに書き込まれるため並びを変えないこと
+CONTENT_ID_PREFIXES = [
+    "sm", "so", "nm", "ax", "ca", "cd", "cw", "fx", "fz", "ig", "na", "om", "sd", "sk", "yk", "yo", "za", "zb", "zc", "zd", "ze",
+]
+
+# 保存時の列。contentId は接頭辞コードと番号に分け、userId は欠損を null (Arrow の validity bitmap) で持つ
+SCHEMA = pa.schema(
+    [
+        ("cid_prefix", pa.uint8()),
+        ("cid_num", pa.uint32()),
+        ("title", pa.string()),
+        ("userId", pa.uint32()),
+        ("viewCounter", pa.uint32()),
+        ("lengthSeconds", pa.uint32()),
+        ("startEpoch", pa.int64()),
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+        ("tag_ids", pa.list_(pa.int32())),
+    ]
+)
+
+
+def staging_path(category: str) -> Path:
+    return STAGING_DIR / f"{category}.parquet"
+
+
+def load_category_bits() -> dict[str, int]:
+    if not CATEGORIES_PATH.exists():
+        return {}
+    with open(CATEGORIES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def category_bit(category: str, create: bool = False) -> int | None:
+    """
+    カテゴリに対応するビット (1 << 位置) を返す。未登録の場合は create=True なら割り当てます。
+    """
+    bits = load_category_bits()
+    if category not in bits:
+        if not create:
+            return None
+        free = sorted(set(range(MAX_CATEGORIES)) - set(bits.values()))
+        if not free:
+            raise RuntimeError(f"カテゴリは最大{MAX_CATEGORIES}個までです")
+        bits[category] = free[0]
+        STORE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(CATEGORIES_PATH, "w", encoding="utf-8") as f:
+            json.dump(bits, f, ensure_ascii=False, indent=2)
+    return 1 << bits[category]
+
+
+def _days_from_civil(y, m, d):
+    # 西暦の年月日 -> 1970-01-01 からの日数 (H. Hinnant の days_from_civil をベクトル化)
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + np.where(m > 2, -3, 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _civil_from_days(days):
+    # 1970-01-01 からの日数 -> (年, 月)
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    m = mp + np.where(mp < 10, 3, -9)
+    y = yoe + era * 400 + (m <= 2)
+    return y, m
+
+
+def parse_start_time(values) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    "2024-01-02T03:04:05+09:00" 形式の文字列を固定レイアウトとしてまとめて解析し、
+    (UNIX時刻[int64], JSTの年[int16], JSTの月[int8]) を返す。
+    形式が異なる値が含まれる場合は pd.to_datetime にフォールバックします。
+    """
+    raw = np.asarray(values, dtype="S25")
+    b = raw.view(np.uint8).reshape(len(raw), 25).astype(np.int64)
+    well_formed = (
+        (b[:, 4] == ord("-")) & (b[:, 7] == ord("-")) & (b[:, 10] == ord("T"))
+        & (b[:, 13] == ord(":")) & (b[:, 16] == ord(":")) & (b[:, 22] == ord(":"))
+        & ((b[:, 19] == ord("+")) | (b[:, 19] == ord("-")))
+    )
+    if len(raw) and well_formed.all():
+        sign = np.where(b[:, 19] == ord("-"), -1, 1)
+        b = b - ord("0")
+
+        def num(start, width):
+            v = b[:, start]
+            for i in range(1, width):
+                v = v * 10 + b[:, start + i]
+            return v
+
+        days = _days_from_civil(num(0, 4), num(5, 2), num(8, 2))
+        offset = sign * (num(20, 2) * 3600 + num(23, 2) * 60)
+        epoch = days * 86400 + num(11, 2) * 3600 + num(14, 2) * 60 + num(17, 2) - offset
+    else:
+        ts = pd.to_datetime(pd.Series(values), utc=True, format="ISO8601")
+        epoch = ((ts - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy(np.int64)
+
+    year, month = _civil_from_days((epoch + JST_OFFSET) // 86400)
+    return epoch, year.astype(np.int16), month.astype(np.int8)
+
+
+def split_content_id(values) -> tuple[pa.Array, pa.Array]:
+    """
+    "sm12345" 形式の contentId を (接頭辞コード[uint8], 番号[uint32]) に分ける。
+    """
+    values = pa.array(values, type=pa.string()) if not isinstance(values, (pa.Array, pa.ChunkedArray)) else values
+    prefix = pc.index_in(pc.utf8_slice_codeunits(values, 0, 2), value_set=pa.array(CONTENT_ID_PREFIXES))
+    if prefix.null_count:
+        unknown = pc.filter(values, pc.is_null(prefix))
+        raise ValueError(f"未知の contentId 接頭辞です: {unknown[0]}")
+    num = pc.cast(pc.utf8_slice_codeunits(values, 2), pa.uint32())
+    return pc.cast(prefix, pa.uint8()), num
+
+
+def join_content_id(prefix, num) -> pa.Array:
+    """
+    split_content_id の逆変換。
+    """
+    names = pc.take(pa.array(CONTENT_ID_PREFIXES), prefix)
+    return pc.binary_join_element_wise(names, pc.cast(num, pa.string()), "")
+
+
+def content_keys(table: pa.Table) -> np.ndarray:
+    """
+    動画を一意に表す int64 のキー (接頭辞コード << 32 | 番号)。統合テーブルはこの順に並んでいます。
+    """
+    prefix = table.column("cid_prefix").to_numpy().astype(np.int64)
+    return (prefix << 32) | table.column("cid_num").to_numpy().astype(np.int64)
+
+
+def records_to_table(records: list[dict], vocab: TagVocabulary) -> pa.Table:
+    """
+    APIレスポンスの data 配列を型付きの列 (Arrow Table) に変換する。
+    userId が欠損している動画 (チャンネル動画など) は null とし、読み込み時に従来通り 0 として扱います。
+    タグは語彙で ID に変換し、list<int32> (CSR) として持ちます。
+    """
+    columns = {name: [r.get(name) for r in records] for name in FIELDS}
+    columns["cid_prefix"], columns["cid_num"] = split_content_id(columns.pop("contentId"))
+    columns["userId"] = [None if u is None else int(u) for u in columns["userId"]]
+    offsets, ids = vocab.encode(columns.pop("tags"))
+    columns["tag_ids"] = pa.ListArray.from_arrays(pa.array(offsets), pa.array(ids))
+    columns["startEpoch"], columns["year"], columns["month"] = parse_start_time(columns.pop("startTime"))
+    return pa.table(columns, schema=SCHEMA)
+
+
+def add_start_time(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    startEpoch から JST の startTime (tz-aware datetime) 列を復元する。
+    整数からの変換なので文字列の解析に比べて十分高速です。
+    """
+    df["startTime"] = pd.to_datetime(df["startEpoch"], unit="s", utc=True).dt.tz_convert("Asia/Tokyo")
+    return df
+
+
+class StoreWriter:
+    """
+    ページ単位の Arrow Table を Parquet の row group として追記する。
+    複数のパーサースレッドから append されるためロックで直列化し、
+    close 時に一時ファイルを置き換えることで途中失敗時も既存ファイルを壊しません。
+    """
+
+    def __init__(self, path: Path, schema: pa.Schema = SCHEMA):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.tmp_path = path.with_suffix(".parquet.tmp")
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._writer = pq.ParquetWriter(self.tmp_path, schema)
+
+    def append(self, table: pa.Table):
+        with self._lock:
+            self._writer.write_table(table)
+            self.rows += table.num_rows
+
+    def close(self, commit: bool = True):
+        self._writer.close()
+        if commit:
+            os.replace(self.tmp_path, self.path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+
+CORPUS_SCHEMA = SCHEMA.append(pa.field("categories", pa.uint32()))
+
+
+def _partition_path(year: int) -> Path:
+    return CORPUS_DIR / f"{year}.parquet"
+
+
+def _partition_years() -> list[int]:
+    if not CORPUS_DIR.exists():
+        return []
+    return sorted(int(p.stem) for p in CORPUS_DIR.glob("*.parquet") if p.stem.isdigit())
+
+
+def _write_corpus(table: pa.Table):
+    """
+    統合テーブルを投稿年ごとのファイルに分けて書き出す。動画がなくなった年のファイルは削除します。
+    """
+    table = table.cast(CORPUS_SCHEMA).sort_by([("year", "ascending"), ("cid_prefix", "ascending"), ("cid_num", "ascending")])
+    years = table.column("year").to_numpy()
+    present = np.unique(years)
+    bounds = np.searchsorted(years, present, side="left").tolist() + [len(years)]
+    for i, year in enumerate(present):
+        with StoreWriter(_partition_path(int(year)), CORPUS_SCHEMA) as writer:
+            writer.append(table.slice(bounds[i], bounds[i + 1] - bounds[i]))
+    for year in set(_partition_years()) - set(present.tolist()):
+        _partition_path(year).unlink()
+
+
+def corpus_years() -> list[int]:
+    """
+    統合テーブルに存在する投稿年 (昇順)。
+    """
+    if LEGACY_CORPUS_PATH.exists():
+        _write_corpus(pq.read_table(LEGACY_CORPUS_PATH))
+        LEGACY_CORPUS_PATH.unlink()
+    return _partition_years()
+
+
+def _read_corpus(columns: list[str] | None = None, years=None) -> pa.Table:
+    """
+    統合テーブルを読み込む。years (年の iterable) を指定した場合はその年のファイルだけを読みます。
+    """
+    stored = corpus_years()
+    if years is not None:
+        years = set(years)
+        stored = [y for y in stored if y in years]
+    if not stored:
+        schema = CORPUS_SCHEMA if columns is None else pa.schema([CORPUS_SCHEMA.field(c) for c in columns])
+        return schema.empty_table()
+    return pa.concat_tables([pq.read_table(_partition_path(y), columns=columns) for y in stored])
+
+
+def merge_category(category: str, table: pa.Table):
+    """
+    カテゴリの全件 (table) で統合テーブルを更新する。
+    既存の動画はこのカテゴリのビットを付け直し、どのカテゴリにも属さなくなった動画は削除します。
+    同じ動画の列の値は最後に取得したものに置き換わります。
+    """
+    bit = category_bit(category, create=True)
+    table = table.select(SCHEMA.names).cast(SCHEMA)
+    new_mask = np.full(table.num_rows, bit, dtype=np.uint32)
+    parts = []
+    if corpus_years():
+        old = _read_corpus()
+        # 各年のファイル内はキー順なので、連結後の並べ替えは run の併合だけで済む
+        old = old.take(np.argsort(content_keys(old), kind="stable"))
+        old_mask = old.column("categories").to_numpy() & np.uint32(~bit & 0xFFFFFFFF)
+        # キー順に並べたうえで二分探索で突き合わせる
+        old_keys = content_keys(old)
+        new_keys = content_keys(table)
+        pos = np.minimum(np.searchsorted(old_keys, new_keys), max(len(old_keys) - 1, 0))
+        found = old_keys[pos] == new_keys if len(old_keys) else np.zeros(len(new_keys), dtype=bool)
+        # 既存の動画が属していた他カテゴリのビットを引き継ぐ
+        new_mask[found] |= old_mask[pos[found]]
+        keep = old_mask != 0
+        keep[pos[found]] = False
+        parts.append(old.drop_columns(["categories"]).filter(pa.array(keep)).append_column("categories", pa.array(old_mask[keep])))
+    parts.append(table.append_column("categories", pa.array(new_mask)))
+    _write_corpus(pa.concat_tables(parts))
+
+
+def _migrate_legacy(category: str) -> bool:
+    """
+    統合テーブルに未登録のカテゴリを、従来の results/{category}.pickle から取り込む。
+    """
+    pickle_path = RESULTS_DIR / f"{category}.pickle"
+    if not pickle_path.exists():
+        return False
+    with open(pickle_path, "rb") as f:
+        recv = pickle.load(f)
+    vocab = load_vocabulary()
+    table = records_to_table(recv["data"], vocab)
+    vocab.save()
+    merge_category(category, table)
+    return True
+
+
+def has_category(category: str) -> bool:
+    return (category_bit(category) is not None and bool(corpus_years())) or (RESULTS_DIR / f"{category}.pickle").exists()
+
+
+def category_mask(categories, category: str) -> np.ndarray:
+    """
+    categories 列 (ビットマスク) からカテゴリに属する行の真偽値マスクを作る。
+    """
+    bit = category_bit(category)
+    values = np.asarray(categories)
+    if bit is None:
+        return np.zeros(len(values), dtype=bool)
+    return (values & np.uint32(bit)) != 0
+
+
+def read_category(category: str, columns: list[str] | None = None, years=None) -> pa.Table:
+    """
+    統合テーブルからカテゴリに属する行だけを Arrow Table として読み込む。
+    years を指定した場合はその投稿年のファイルだけを読みます。
+    """
+    if category_bit(category) is None or not corpus_years():
+        if not _migrate_legacy(category):
+            raise FileNotFoundError(f"{category} のデータがありません")
+    table = _read_corpus(_physical_columns(columns), years)
+    mask = category_mask(table.column("categories").to_numpy(), category)
+    table = table.filter(pa.array(mask))
+    if columns is None or "categories" not in columns:
+        table = table.drop_columns(["categories"])
+    return table
+
+
+def _physical_columns(columns: list[str] | None) -> list[str] | None:
+    # 論理的な列名 (contentId) を保存時の列に読み替え、マスク判定用の categories を加える
+    if columns is None:
+        return None
+    physical = []
+    for c in columns:
+        physical += ["cid_prefix", "cid_num"] if c in ("contentId", "key") else [c]
+    return list(dict.fromkeys([*physical, "categories"]))
+
+
+def _types_mapper(t: pa.DataType):
+    # tag_ids は CSR のまま (Arrow の list 型として) 保持し、Python のリストに展開しない
+    # (title などの文字列は pandas 3 の str 型として Arrow のバッファのまま読み込まれる)
+    return pd.ArrowDtype(t) if pa.types.is_list(t) else None
+
+
+def table_to_frame(table: pa.Table, requested: list[str] | None = None, start_time: bool = True, tags: bool = False) -> pd.DataFrame:
+    """
+    保存形式の Arrow Table を解析用の DataFrame に変換する (引数の意味は load_videos と同じ)。
+    """
+    if requested is not None:
+        table = table.select([c for c in _physical_columns(requested) if c in table.column_names])
+    columns = {}
+    for name in table.column_names:
+        col = table.column(name)
+        if name == "cid_prefix" and "cid_num" in table.column_names:
+            # key (int64 の動画キー) は明示的に指定された場合だけ付ける
+            if requested is None or "contentId" in requested:
+                columns["contentId"] = join_content_id(col, table.column("cid_num"))
+            if requested is not None and "key" in requested:
+                columns["key"] = content_keys(table)
+        elif name in ("cid_prefix", "cid_num"):
+            continue
+        elif name == "userId":
+            # 解析側は従来通り userId == 0 を「投稿者不明」として扱う
+            columns[name] = pc.fill_null(col, 0)
+        else:
+            columns[name] = col
+    df = pa.table(columns).to_pandas(types_mapper=_types_mapper)
+    if tags and "tag_ids" in df.columns:
+        df["tags"] = pd.Series(decode_tags(df["tag_ids"]).to_pandas(), index=df.index)
+    if start_time and "startEpoch" in df.columns:
+        df = add_start_time(df)
+    return df
+
+
+def load_videos(category: str, columns: list[str] | None = None, start_time: bool = True, tags: bool = False, years=None) -> pd.DataFrame:
+    """
+    カテゴリの動画データを DataFrame として読み込む。
+    統合テーブルに未登録の場合は従来の results/{category}.pickle から取り込みます。
+    start_time=True の場合は startEpoch から tz-aware な startTime 列を付与します
+    (年・月単位の集計だけなら year / month 列で足りるため False で省略可)。
+    tags=True の場合は tag_ids から従来の空白区切りの tags 列を復元します。
+    columns に "key" を指定すると content_keys() と同じ int64 の動画キー列を付けます。
+    years (例: range(2020, 2026)) を指定すると、その投稿年 (JST) のパーティションだけを読み込みます。
+    """
+    return table_to_frame(read_category(category, columns, years), columns, start_time, tags)
+
+
+def load_corpus(categories: list[str] | None = None, columns: list[str] | None = None, start_time: bool = True, tags: bool = False, years=None) -> pd.DataFrame:
+    """
+    全カテゴリの動画 (contentId で重複なし) を categories 列付きで一度に読み込む。
+    カテゴリごとの行は category_mask(df["categories"], category) で取り出します。
+    categories を指定した場合は、未登録のものを従来の pickle から取り込んだうえで
+    いずれかに属する行だけを返します。years は load_videos と同じです。
+    """
+    for category in categories or []:
+        if category_bit(category) is None or not corpus_years():
+            _migrate_legacy(category)
+    table = _read_corpus(_physical_columns(columns), years)
+    if categories:
+        bits = np.uint32(sum(category_bit(c) or 0 for c in categories))
+        table = table.filter(pa.array((table.column("categories").to_numpy() & bits) != 0))
+    return table_to_frame(table, columns, start_time, tags)
+
+
+def memory_report(category: str):
+    """
+    1動画あたりのメモリ使用量を、従来の json_normalize 後の DataFrame (文字列は object 列) と
+    現在のスキーマ (Arrow) で比較する。
+    """
+    table = read_category(category)
+    n = max(table.num_rows, 1)
+    legacy = pd.DataFrame(
+        {
+            "contentId": pd.Series(join_content_id(table.column("cid_prefix"), table.column("cid_num")).to_pylist(), dtype=object),
+            "title": pd.Series(table.column("title").to_pylist(), dtype=object),
+            "userId": pc.fill_null(table.column("userId"), 0).to_numpy().astype(np.uint64),
+            "viewCounter": table.column("viewCounter").to_numpy().astype(np.int64),
+            "lengthSeconds": table.column("lengthSeconds").to_pandas().astype(np.float64),
+            "startTime": pd.Series(pd.to_datetime(table.column("startEpoch").to_numpy(), unit="s", utc=True).tz_convert("Asia/Tokyo").map(lambda t: t.isoformat()), dtype=object),
+            "tags": pd.Series(decode_tags(table.column("tag_ids")).to_pylist(), dtype=object),
+        }
+    )
+    print(f"{category}: {table.num_rows:,} 動画")
+    print(f"{'列':<14} {'before (B/動画)':>16} {'after (B/動画)':>16}")
+    after_of = {
+        "contentId": table.column("cid_prefix").nbytes + table.column("cid_num").nbytes,
+        "startTime": sum(table.column(c).nbytes for c in ("startEpoch", "year", "month")),
+        "tags": table.column("tag_ids").nbytes,
+    }
+    before_total = after_total = 0
+    for name in legacy.columns:
+        before = legacy[name].memory_usage(deep=True, index=False)
+        after = after_of.get(name) or table.column(name).nbytes
+        before_total += before
+        after_total += after
+        print(f"{name:<14} {before / n:16.1f} {after / n:16.1f}")
+    print(f"{'合計':<14} {before_total / n:16.1f} {after_total / n:16.1f}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    for category in sys.argv[1:] or ["software_talk"]:
+        memory_report(category)
@@ -0,0 +1,233 @@
+"""
+Processing Overview:
+再生数の時系列ストア。フェッチのたびに (動画, スナップショット時刻, 再生数) を記録しますが、
+前回の記録から値が変わった動画の差分 (delta) だけを追記するため、日次で何年分を重ねても小さく保てます。
+任意の期間の動画別・キャラクター別・カテゴリ別の再生数の伸び (1日あたり) を集計できます。
+
+使い方:
+    python view_history.py software_talk 2025-01-01 2025-07-01
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from video_store import STORE_DIR, content_keys, load_videos, split_content_id
+
+HISTORY_DIR = STORE_DIR / "view_history"
+SEGMENTS_DIR = HISTORY_DIR / "segments"
+# 動画ごとの最新の記録値 (次回の差分計算用)
+LATEST_PATH = HISTORY_DIR / "latest.parquet"
+
+SEGMENT_SCHEMA = pa.schema(
+    [
+        ("key", pa.int64()),          # content_keys() と同じ動画キー
+        ("snapshot", pa.int64()),     # スナップショットの更新日時 (UNIX時刻)
+        ("delta", pa.int64()),        # 前回記録からの再生数の増分 (初回は再生数そのもの)
+        ("initial", pa.bool_()),      # その動画の初回記録かどうか
+    ]
+)
+
+
+def _to_epoch(t) -> int:
+    if isinstance(t, (int, np.integer)):
+        return int(t)
+    ts = pd.Timestamp(t)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("Asia/Tokyo")
+    return int(ts.timestamp())
+
+
+def _write_segment(table: pa.Table, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 書き込み途中のファイルを読み込み側が拾わないよう "." 始まりの名前で書く
+    tmp_path = path.parent / f".{path.name}.tmp"
+    # キーは昇順なので差分 + ビットパッキングが効く。snapshot/initial はほぼ定数なので RLE で消える
+    pq.write_table(
+        table,
+        tmp_path,
+        use_dictionary=["snapshot", "initial"],
+        column_encoding={"key": "DELTA_BINARY_PACKED", "delta": "DELTA_BINARY_PACKED"},
+        compression="zstd",
+    )
+    tmp_path.replace(path)
+
+
+def record_snapshot(table: pa.Table, snapshot_version, source: str) -> int:
+    """
+    取得結果 (cid_prefix, cid_num, viewCounter を含む Arrow Table) の再生数を記録する。
+    前回の記録から変化した動画だけを追記し、追記した件数を返します。
+    """
+    snapshot = _to_epoch(snapshot_version)
+    keys = content_keys(table)
+    views = table.column("viewCounter").to_numpy(zero_copy_only=False).astype(np.int64)
+    order = np.argsort(keys, kind="stable")
+    keys, views = keys[order], views[order]
+
+    if LATEST_PATH.exists():
+        latest = pq.read_table(LATEST_PATH)
+        old_keys = latest.column("key").to_numpy()
+        old_views = latest.column("views").to_numpy()
+    else:
+        old_keys = np.zeros(0, dtype=np.int64)
+        old_views = np.zeros(0, dtype=np.int64)
+
+    # 最新値とキー順にマージ結合して差分を求める
+    pos = np.searchsorted(old_keys, keys)
+    found = np.zeros(len(keys), dtype=bool)
+    in_range = pos < len(old_keys)
+    found[in_range] = old_keys[pos[in_range]] == keys[in_range]
+    previous = np.where(found, old_views[np.minimum(pos, max(len(old_keys) - 1, 0))] if len(old_keys) else 0, 0)
+    changed = ~found | (views != previous)
+    if not changed.any():
+        return 0
+
+    segment = pa.table(
+        {
+            "key": keys[changed],
+            "snapshot": np.full(changed.sum(), snapshot, dtype=np.int64),
+            "delta": (views - previous)[changed],
+            "initial": ~found[changed],
+        },
+        schema=SEGMENT_SCHEMA,
+    )
+    _write_segment(segment, SEGMENTS_DIR / f"{snapshot}_{source}.parquet")
+
+    # 最新値を更新する
+    merged_keys = np.concatenate([old_keys, keys[~found]])
+    merged_views = np.concatenate([old_views, views[~found]])
+    order = np.argsort(merged_keys, kind="stable")
+    merged_keys, merged_views = merged_keys[order], merged_views[order]
+    merged_views[np.searchsorted(merged_keys, keys[found])] = views[found]
+    HISTORY_DIR.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.table({"key": merged_keys, "views": merged_views}), LATEST_PATH)
+    return int(changed.sum())
+
+
+def load_segments(end=None, keys: np.ndarray | None = None) -> pd.DataFrame:
+    """
+    記録を (key, snapshot, delta, initial) の DataFrame として読み込む。
+    end を指定した場合はそれ以前のスナップショットだけを読みます。
+    """
+    if not SEGMENTS_DIR.exists():
+        return pd.DataFrame({name: pd.Series(dtype=t.to_pandas_dtype()) for name, t in zip(SEGMENT_SCHEMA.names, SEGMENT_SCHEMA.types)})
+    filters = [("snapshot", "<=", _to_epoch(end))] if end is not None else None
+    table = pq.read_table(SEGMENTS_DIR, schema=SEGMENT_SCHEMA, filters=filters)
+    df = table.to_pandas()
+    if keys is not None:
+        df = df[np.isin(df["key"].to_numpy(), keys)]
+    return df
+
+
+def views_at(t, keys: np.ndarray | None = None) -> pd.Series:
+    """
+    時刻 t 時点で記録されていた再生数 (key -> 再生数)。t 以前に記録のない動画は含みません。
+    """
+    seg = load_segments(end=t, keys=keys)
+    return seg.groupby("key")["delta"].sum()
+
+
+def view_growth(start, end, keys: np.ndarray | None = None, posted: pd.Series | None = None) -> pd.DataFrame:
+    """
+    期間 [start, end] の動画ごとの再生数の伸び (growth) と1日あたりの伸び (per_day)。
+    start 以前に記録のない動画は start 時点の再生数が不明なため除外します。
+    ただし posted (key -> 投稿日時の UNIX時刻) を渡した場合、期間中に投稿された動画は
+    start 時点の再生数を 0 として含めます。
+    """
+    start_epoch, end_epoch = _to_epoch(start), _to_epoch(end)
+    seg = load_segments(end=end_epoch, keys=keys)
+    before = seg["snapshot"].to_numpy() <= start_epoch
+    df = pd.DataFrame(
+        {
+            "start_views": seg[before].groupby("key")["delta"].sum(),
+            "end_views": seg.groupby("key")["delta"].sum(),
+        }
+    )
+    df.index.name = "key"
+    if posted is not None:
+        new = df["start_views"].isna() & (posted.reindex(df.index) >= start_epoch)
+        df.loc[new, "start_views"] = 0
+    df = df.dropna(subset=["start_views"])
+    df["growth"] = df["end_views"] - df["start_views"]
+    df["per_day"] = df["growth"] / (max(end_epoch - start_epoch, 1) / 86400)
+    return df
+
+
+def video_velocity(content_ids: list[str], start, end) -> pd.DataFrame:
+    """
+    指定した動画 (contentId) の期間中の再生数の伸び。記録のない動画は NaN です。
+    """
+    prefix, num = split_content_id(content_ids)
+    keys = content_keys(pa.table({"cid_prefix": prefix, "cid_num": num}))
+    growth = view_growth(start, end, keys)
+    return growth.reindex(keys).set_axis(pd.Index(content_ids, name="contentId"))
+
+
+def _category_growth(category: str, start, end, columns=()) -> tuple[pd.DataFrame, pd.DataFrame]:
+    videos = load_videos(category, columns=["key", "startEpoch", *columns], start_time=False)
+    growth = view_growth(start, end, videos["key"].to_numpy(), posted=videos.set_index("key")["startEpoch"])
+    return videos, growth
+
+
+def category_velocity(category: str, start, end) -> pd.Series:
+    """
+    カテゴリ全体の期間中の再生数の伸び (対象動画数・合計・1日あたり)。
+    """
+    _, growth = _category_growth(category, start, end)
+    days = max(_to_epoch(end) - _to_epoch(start), 1) / 86400
+    total = growth["growth"].sum()
+    return pd.Series({"videos": len(growth), "growth": total, "per_day": total / days})
+
+
+def character_velocity(category: str, character_names, start, end) -> pd.DataFrame:
+    """
+    カテゴリ内のキャラクター別の期間中の再生数の伸び。1動画に複数キャラがいる場合はそれぞれに計上します。
+    """
+    from common_utils import find_character_rows
+
+    videos, growth = _category_growth(category, start, end, columns=["tag_ids"])
+    found = find_character_rows(videos, character_names)
+    found["key"] = videos["key"].to_numpy()[found["row"].to_numpy()]
+    found = found.join(growth[["growth"]], on="key", how="inner")
+    days = max(_to_epoch(end) - _to_epoch(start), 1) / 86400
+    result = found.groupby("character").agg(videos=("key", "nunique"), growth=("growth", "sum"))
+    result["per_day"] = result["growth"] / days
+    return result.sort_values("growth", ascending=False)
+
+
+def compact(year: int):
+    """
+    指定年のスナップショットの記録を1ファイルにまとめる (ファイル数を抑えて圧縮率を上げる)。
+    """
+    start = _to_epoch(f"{year}-01-01")
+    end = _to_epoch(f"{year + 1}-01-01")
+    paths = [p for p in SEGMENTS_DIR.glob("*.parquet") if p.stem.split("_")[0].isdigit() and start <= int(p.stem.split("_")[0]) < end]
+    if len(paths) <= 1:
+        return
+    table = pa.concat_tables([pq.read_table(p, schema=SEGMENT_SCHEMA) for p in paths])
+    table = table.sort_by([("snapshot", "ascending"), ("key", "ascending")])
+    out_path = SEGMENTS_DIR / f"{start}_{year}_compacted.parquet"
+    _write_segment(table, out_path)
+    # 前回まとめたファイルも入力に含まれるため、書き出したファイル自体は消さない
+    for p in paths:
+        if p != out_path:
+            p.unlink()
+
+
+def main(category, start, end):
+    character_names = pd.read_csv("characters.csv")["キャラクター名"].tolist()
+    print(f"{category}: {start} - {end}")
+    print(category_velocity(category, start, end).to_string())
+    print()
+    print(character_velocity(category, character_names, start, end).head(20).to_string())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        main(*sys.argv[1:])
+    else:
+        print("コマンドライン引数が少なすぎます")